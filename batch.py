@@ -0,0 +1,209 @@
+"""Run many prompts concurrently over one Gemini client.
+
+    python batch.py prompts.jsonl --concurrency 8 > results.jsonl
+    cat prompts.jsonl | python batch.py -
+
+Each input line is a JSON object with a "prompt" and optionally an "id" and a
+"working_directory" to start from (defaults to WORKING_DIR), or just a JSON
+string. Every prompt gets its own conversation and its own copy of the
+working directory, so tasks cannot see each other's edits. One JSON result per
+prompt is written to stdout as soon as it finishes; tool call progress and
+the throughput summary go to stderr.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from config import BATCH_CONCURRENCY, WORKING_DIR
+from main import (
+    AgentStats,
+    add_backend_arguments,
+    add_prefetch_arguments,
+    add_routing_arguments,
+    add_tracing_arguments,
+    backend_stats,
+    create_client,
+    create_router,
+    run_agent,
+)
+from prefetch import prefetcher
+from tool_cache import tool_cache
+from tracing import tracer
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a batch of prompts through the AI Code Assistant")
+    parser.add_argument("prompts", type=str, help="JSONL file of prompts, or - to read stdin")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="Conversations run at once")
+    parser.add_argument("--keep-workdirs", action="store_true", help="Keep each task's working directory copy")
+    parser.add_argument("--verbose", action="store_true", help="Enable verbose output")
+    add_backend_arguments(parser)
+    add_routing_arguments(parser)
+    add_prefetch_arguments(parser)
+    add_tracing_arguments(parser)
+    args = parser.parse_args()
+    tracer.configure(args.trace, args.metrics)
+    prefetcher.configure(args.prefetch)
+
+    if args.prompts == "-":
+        tasks = read_tasks(sys.stdin)
+    else:
+        with open(args.prompts, encoding="utf-8") as f:
+            tasks = read_tasks(f)
+
+    # one client for every task, so retries and throttling are shared
+    client = create_client(args)
+
+    # the agent prints tool calls as it goes; keep stdout for the results
+    results = sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        summary = asyncio.run(run_batch(
+            client, tasks, results, args.concurrency, args.verbose, args.keep_workdirs, lambda: create_router(args),
+        ))
+
+    tracer.write_metrics()
+    tracer.close()
+    print(format_summary(summary), file=sys.stderr)
+    if args.verbose:
+        print(f"Model backend: {backend_stats(client)}", file=sys.stderr)
+        if prefetcher.mode != "off":
+            print(f"Prefetch: {prefetcher.stats()}", file=sys.stderr)
+    if summary["failed"]:
+        sys.exit(1)
+
+
+def read_tasks(lines):
+    tasks = []
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        task = json.loads(line)
+        if isinstance(task, str):
+            task = {"prompt": task}
+        if not isinstance(task, dict) or not task.get("prompt"):
+            raise ValueError(f'line {line_number}: expected a JSON string or an object with a "prompt"')
+        task.setdefault("id", str(line_number))
+        tasks.append(task)
+    return tasks
+
+
+async def run_batch(
+    client, tasks, results, concurrency=BATCH_CONCURRENCY, verbose=False, keep_workdirs=False, make_router=None,
+):
+    """Run every task, at most `concurrency` at a time, and return a summary.
+
+    Results are written to `results` as JSON lines in the order the tasks
+    finish. Working directory copies live in one temporary directory that is
+    removed afterwards unless `keep_workdirs` is set. `make_router` returns
+    the ModelRouter for each task, or None to use MODEL throughout.
+    """
+    limit = asyncio.Semaphore(concurrency)
+    batch_dir = tempfile.mkdtemp(prefix="agent-batch-")
+    start = time.perf_counter()
+    try:
+        finished = await asyncio.gather(*(
+            _run_task(client, task, index, batch_dir, results, limit, verbose, keep_workdirs, make_router)
+            for index, task in enumerate(tasks)
+        ))
+    finally:
+        if not keep_workdirs:
+            shutil.rmtree(batch_dir, ignore_errors=True)
+    return _summary(finished, time.perf_counter() - start)
+
+
+async def _run_task(client, task, index, batch_dir, results, limit, verbose, keep_workdirs, make_router):
+    from google.genai import types
+    from functions.checkpoint import drop_checkpoints
+    from functions.get_files_info import DEFAULT_EXCLUDES
+    from functions.run_tests import drop_test_state
+    from functions.search_code import drop_search_index
+
+    async with limit:
+        with tracer.span("task", task_id=task["id"]):
+            start = time.perf_counter()
+            stats = AgentStats()
+            working_directory = os.path.join(batch_dir, f"task-{index}")
+            final_text = None
+            try:
+                await asyncio.to_thread(
+                    shutil.copytree,
+                    task.get("working_directory") or WORKING_DIR,
+                    working_directory,
+                    ignore=shutil.ignore_patterns(*DEFAULT_EXCLUDES),
+                )
+                messages = [types.Content(role="user", parts=[types.Part(text=task["prompt"])])]
+                router = make_router() if make_router else None
+                final_text = await run_agent(client, messages, verbose, working_directory, stats, router=router)
+            except Exception as e:
+                stats.error = f"{type(e).__name__}: {e}"
+            finally:
+                # nothing else will look at this copy again
+                tool_cache.clear(working_directory)
+                prefetcher.clear(working_directory)
+                drop_search_index(working_directory)
+                drop_test_state(working_directory)
+                drop_checkpoints(working_directory)
+                if not keep_workdirs:
+                    await asyncio.to_thread(shutil.rmtree, working_directory, True)
+
+    if final_text:
+        status = "ok"
+    elif stats.error:
+        status = "error"
+    else:
+        status = "max_iterations"
+    result = {
+        "id": task["id"],
+        "status": status,
+        "final_text": final_text,
+        "iterations": stats.iterations,
+        "prompt_tokens": stats.prompt_tokens,
+        "response_tokens": stats.response_tokens,
+        "models": stats.models(),
+        "wall_time": round(time.perf_counter() - start, 3),
+    }
+    if stats.error:
+        result["error"] = stats.error
+    if keep_workdirs:
+        result["working_directory"] = working_directory
+
+    results.write(json.dumps(result) + "\n")
+    results.flush()
+    return result
+
+
+def _summary(finished, wall_time):
+    latencies = sorted(result["wall_time"] for result in finished)
+    tokens = sum(result["prompt_tokens"] + result["response_tokens"] for result in finished)
+    ok = sum(result["status"] == "ok" for result in finished)
+    return {
+        "prompts": len(finished),
+        "ok": ok,
+        "failed": len(finished) - ok,
+        "wall_time": wall_time,
+        "tokens": tokens,
+        "prompts_per_second": len(finished) / wall_time if wall_time else 0.0,
+        "tokens_per_second": tokens / wall_time if wall_time else 0.0,
+        "median_latency": statistics.median(latencies) if latencies else 0.0,
+        "p95_latency": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] if latencies else 0.0,
+    }
+
+
+def format_summary(summary):
+    return (
+        f"Batch: {summary['prompts']} prompt(s), {summary['ok']} ok, {summary['failed']} failed "
+        f"in {summary['wall_time']:.2f}s: {summary['prompts_per_second']:.2f} prompts/s, "
+        f"{summary['tokens_per_second']:.0f} tokens/s, "
+        f"latency median {summary['median_latency']:.2f}s p95 {summary['p95_latency']:.2f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,392 @@
+"""End-to-end benchmark of the agent loop against a scripted fake model.
+
+Builds a synthetic workspace, then runs whole sessions of MAX_ITERATIONS
+turns through `run_agent`. The fake model replays a fixed script of tool
+calls (listing, search, ranged and parallel reads, edits, writes, script
+runs), so every run does the same work. Each phase is timed on its own:
+
+- model_wait: time spent inside the model call
+- compaction: building the compacted history sent to the model
+- message_building: the rest of a turn outside the model and the tools
+- dispatch: call_function overhead around each tool (cache, bookkeeping)
+- tools.<name>: the tool implementations themselves
+
+The size of `messages` is sampled every iteration to show how the history
+grows. Results are written as JSON; --compare flags regressions between two
+result files.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_agent --files 2000 --big-file-mb 5 --output bench.json
+    python -m benchmarks.bench_agent --compare old.json bench.json
+"""
+import argparse
+import asyncio
+import contextlib
+import contextvars
+import functools
+import json
+import os
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from google.genai import types
+
+import call_function
+import main
+from compaction import estimate_tokens
+from config import MAX_ITERATIONS
+from model_backend import ModelBackend
+from tool_cache import tool_cache
+
+
+# tool time spent inside the current call_function_async, for the dispatch overhead
+_tool_time = contextvars.ContextVar("tool_time", default=None)
+
+
+class PhaseTimer:
+    def __init__(self):
+        self.samples = {}
+
+    def add(self, phase, seconds):
+        self.samples.setdefault(phase, []).append(seconds)
+
+    def summary(self):
+        return {phase: _distribution(samples) for phase, samples in sorted(self.samples.items())}
+
+
+class ScriptedModel(ModelBackend):
+    """Fake model that asks for the next step of SCRIPT each turn and answers
+    once the iteration budget is almost spent."""
+
+    def __init__(self, timer, workspace, latency=0.0):
+        super().__init__()
+        self.timer = timer
+        self.workspace = workspace
+        self.latency = latency
+        self.session = 0
+
+    async def generate_content(self, model, contents, config=None):
+        start = time.perf_counter()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        turn = (len(contents) - 1) // 2
+        if turn >= MAX_ITERATIONS - 1:
+            parts = [types.Part(text="Done.")]
+        else:
+            step = SCRIPT[turn % len(SCRIPT)]
+            parts = [
+                types.Part(function_call=types.FunctionCall(name=name, args=args))
+                for name, args in step(self.workspace, self.session, turn)
+            ]
+        response = types.GenerateContentResponse(
+            candidates=[types.Candidate(content=types.Content(role="model", parts=parts))],
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=estimate_tokens(contents),
+                candidates_token_count=10,
+            ),
+        )
+        self.timer.add("model_wait", time.perf_counter() - start)
+        return response
+
+
+# each step returns the function calls of one turn
+SCRIPT = [
+    lambda ws, session, turn: [("get_files_info", {"recursive": True})],
+    lambda ws, session, turn: [("search_code", {"query": "def function_1"})],
+    lambda ws, session, turn: [
+        ("get_file_content", {"file_path": ws["big_files"][0], "start_line": 1, "end_line": 200}),
+        ("get_file_content", {"file_path": ws["big_files"][-1], "start_line": ws["big_lines"] // 2, "end_line": ws["big_lines"] // 2 + 100}),
+    ],
+    lambda ws, session, turn: [
+        ("get_file_content", {"file_path": path}) for path in ws["modules"][turn:turn + 4]
+    ],
+    lambda ws, session, turn: [("edit_file", {"file_path": "main.py", "edits": [_next_value(ws)]})],
+    lambda ws, session, turn: [("run_python_file", {"file_path": "main.py"})],
+    lambda ws, session, turn: [
+        ("write_file", {"file_path": f"notes/turn_{turn}.md", "content": "notes\n" * 200}),
+        ("get_file_content", {"file_path": "main.py"}),
+    ],
+    lambda ws, session, turn: [("search_code", {"query": r"return value \+ \d+", "regex": True, "path": "pkg1"})],
+]
+
+
+def _next_value(ws):
+    # main.py's VALUE goes up by one with every edit
+    ws["value"] += 1
+    return {"search": f"VALUE = {ws['value'] - 1}\n", "replace": f"VALUE = {ws['value']}\n"}
+
+
+def make_workspace(root, files, big_files, big_file_mb):
+    modules = []
+    for i in range(files):
+        package = os.path.join(root, f"pkg{i // 100}")
+        if i % 100 == 0:
+            os.makedirs(package)
+            with open(os.path.join(package, "__init__.py"), "w") as f:
+                f.write("")
+        path = os.path.join(package, f"module_{i}.py")
+        with open(path, "w") as f:
+            f.write("".join(
+                f"def function_{i}_{j}(value):\n    return value + {j}\n\n\n" for j in range(10)
+            ))
+        modules.append(os.path.relpath(path, root))
+
+    os.makedirs(os.path.join(root, "data"))
+    big = []
+    line = "# " + "x" * 76 + "\n"
+    big_lines = big_file_mb * 1024 * 1024 // len(line)
+    for j in range(big_files):
+        path = os.path.join(root, "data", f"big_{j}.py")
+        with open(path, "w") as f:
+            f.write(line * big_lines)
+        big.append(os.path.relpath(path, root))
+
+    with open(os.path.join(root, "main.py"), "w") as f:
+        f.write("from pkg0.module_0 import function_0_1\nVALUE = 0\nprint(function_0_1(VALUE))\n")
+    return {"modules": modules, "big_files": big, "big_lines": big_lines, "value": 0}
+
+
+def instrument(timer, message_sizes):
+    """Wrap the agent's internals with timers. Returns a function that undoes it."""
+    originals = {
+        (main, "compact_messages"): main.compact_messages,
+        (main, "call_functions_async"): main.call_functions_async,
+        (call_function, "call_function_async"): call_function.call_function_async,
+    }
+
+    def compact_messages(messages, *args, **kwargs):
+        message_sizes.append(sum(len(content.model_dump_json(exclude_none=True)) for content in messages))
+        start = time.perf_counter()
+        try:
+            return originals[(main, "compact_messages")](messages, *args, **kwargs)
+        finally:
+            timer.add("compaction", time.perf_counter() - start)
+
+    async def call_functions_async(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await originals[(main, "call_functions_async")](*args, **kwargs)
+        finally:
+            timer.add("_call_functions", time.perf_counter() - start)
+
+    async def call_function_async(*args, **kwargs):
+        spent = [0.0]
+        token = _tool_time.set(spent)
+        start = time.perf_counter()
+        try:
+            return await originals[(call_function, "call_function_async")](*args, **kwargs)
+        finally:
+            timer.add("dispatch", time.perf_counter() - start - spent[0])
+            _tool_time.reset(token)
+
+    main.compact_messages = compact_messages
+    main.call_functions_async = call_functions_async
+    call_function.call_function_async = call_function_async
+
+    tool_maps = [call_function.function_map, call_function.async_function_map]
+    saved_maps = [dict(tool_map) for tool_map in tool_maps]
+    for tool_map in tool_maps:
+        for name, tool in tool_map.items():
+            tool_map[name] = _timed_tool(timer, name, tool)
+
+    def restore():
+        for (module, name), original in originals.items():
+            setattr(module, name, original)
+        for tool_map, saved in zip(tool_maps, saved_maps):
+            tool_map.clear()
+            tool_map.update(saved)
+
+    return restore
+
+
+def _timed_tool(timer, name, tool):
+    def record(start):
+        elapsed = time.perf_counter() - start
+        timer.add(f"tools.{name}", elapsed)
+        spent = _tool_time.get()
+        if spent is not None:
+            spent[0] += elapsed
+
+    if asyncio.iscoroutinefunction(tool):
+        @functools.wraps(tool)
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await tool(*args, **kwargs)
+            finally:
+                record(start)
+    else:
+        @functools.wraps(tool)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return tool(*args, **kwargs)
+            finally:
+                record(start)
+    return timed
+
+
+async def run_sessions(model, sessions, workspace_dir, timer):
+    iterations = []
+    for session in range(sessions):
+        model.session = session
+        stats = main.AgentStats()
+        messages = [types.Content(role="user", parts=[types.Part(text=f"benchmark session {session}")])]
+        start = time.perf_counter()
+        final_response = await main.run_agent(model, messages, working_directory=workspace_dir, stats=stats)
+        timer.add("session", time.perf_counter() - start)
+        if final_response is None:
+            raise RuntimeError(f"session {session} failed: {stats.error}")
+        iterations.append(stats.iterations)
+    return iterations
+
+
+def run(args):
+    timer = PhaseTimer()
+    message_sizes = []
+    if args.no_tool_cache:
+        tool_cache.max_entries = 0
+
+    workspace_dir = tempfile.mkdtemp(prefix="agent-bench-")
+    try:
+        start = time.perf_counter()
+        workspace = make_workspace(workspace_dir, args.files, args.big_files, args.big_file_mb)
+        setup_time = time.perf_counter() - start
+
+        model = ScriptedModel(timer, workspace, args.model_latency)
+        restore = instrument(timer, message_sizes)
+        rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        start = time.perf_counter()
+        try:
+            # the agent prints every tool call
+            with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+                iterations = asyncio.run(run_sessions(model, args.sessions, workspace_dir, timer))
+        finally:
+            restore()
+        wall_time = time.perf_counter() - start
+    finally:
+        shutil.rmtree(workspace_dir, ignore_errors=True)
+
+    phases = timer.summary()
+    # everything in a turn that is neither the model nor the tool calls
+    sessions_total = phases.pop("session")["total"]
+    turn_other = sessions_total - phases["model_wait"]["total"] - phases.pop("_call_functions", {"total": 0.0})["total"]
+    phases["message_building"] = {"total": turn_other, "mean": turn_other / sum(iterations)}
+
+    per_iteration = message_sizes[:iterations[0]]
+    return {
+        "config": {
+            "files": args.files,
+            "big_files": args.big_files,
+            "big_file_mb": args.big_file_mb,
+            "sessions": args.sessions,
+            "max_iterations": MAX_ITERATIONS,
+            "model_latency": args.model_latency,
+            "tool_cache": not args.no_tool_cache,
+        },
+        "setup_time": setup_time,
+        "wall_time": wall_time,
+        "iterations": sum(iterations),
+        "phases": phases,
+        "messages": {
+            "bytes_per_iteration": per_iteration,
+            "growth_bytes": per_iteration[-1] - per_iteration[0] if per_iteration else 0,
+        },
+        "peak_rss_growth_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss_before,
+    }
+
+
+def compare(old, new, threshold, min_seconds):
+    """Return lines describing each timing that got slower by more than
+    `threshold` (a fraction) and at least `min_seconds`."""
+    regressions = []
+    for phase, new_stats in new["phases"].items():
+        old_stats = old["phases"].get(phase)
+        if not old_stats:
+            continue
+        # medians and tails are steadier than means; derived phases only have a mean
+        for metric in ("p50", "p95") if "p50" in new_stats else ("mean",):
+            if metric not in old_stats:
+                continue
+            before, after = old_stats[metric], new_stats[metric]
+            if after - before > min_seconds and after > before * (1 + threshold):
+                regressions.append(
+                    f"{phase}.{metric}: {before * 1000:.3f}ms -> {after * 1000:.3f}ms (+{(after / before - 1) * 100:.0f}%)"
+                    if before else f"{phase}.{metric}: 0 -> {after * 1000:.3f}ms"
+                )
+
+    old_growth = old["messages"]["growth_bytes"]
+    new_growth = new["messages"]["growth_bytes"]
+    if new_growth > old_growth * (1 + threshold):
+        regressions.append(f"messages.growth_bytes: {old_growth} -> {new_growth}")
+    return regressions
+
+
+def _distribution(samples):
+    ordered = sorted(samples)
+    return {
+        "count": len(ordered),
+        "total": sum(ordered),
+        "mean": statistics.mean(ordered),
+        "p50": statistics.median(ordered),
+        "p95": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        "max": ordered[-1],
+    }
+
+
+def _print_results(results):
+    print(f"{results['iterations']} iterations in {results['wall_time']:.2f}s (workspace built in {results['setup_time']:.2f}s)")
+    for phase, stats in results["phases"].items():
+        line = f"  {phase:<28} total={stats['total'] * 1000:9.1f}ms mean={stats['mean'] * 1000:8.3f}ms"
+        if "p95" in stats:
+            line += f" p95={stats['p95'] * 1000:8.3f}ms n={stats['count']}"
+        print(line)
+    sizes = results["messages"]["bytes_per_iteration"]
+    if sizes:
+        print(f"  messages: {sizes[0]} -> {sizes[-1]} bytes over {len(sizes)} iterations")
+    print(f"  peak RSS growth: {results['peak_rss_growth_kb'] / 1024:.1f} MB")
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Benchmark the agent loop end to end")
+    parser.add_argument("--files", type=int, default=2000, help="Small Python modules in the workspace")
+    parser.add_argument("--big-files", type=int, default=2, help="Large files in the workspace")
+    parser.add_argument("--big-file-mb", type=int, default=5, help="Size of each large file in MB")
+    parser.add_argument("--sessions", type=int, default=3, help="Sessions of MAX_ITERATIONS turns to run")
+    parser.add_argument("--model-latency", type=float, default=0.0, help="Seconds the fake model takes per call")
+    parser.add_argument("--no-tool-cache", action="store_true", help="Disable the tool result cache")
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two result files instead of running")
+    parser.add_argument("--threshold", type=float, default=0.25, help="Slowdown fraction counted as a regression")
+    parser.add_argument("--min-ms", type=float, default=0.05, help="Ignore slowdowns smaller than this many ms")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f:
+            old = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        if old["config"] != new["config"]:
+            print(f"warning: the runs used different settings: {old['config']} vs {new['config']}")
+        regressions = compare(old, new, args.threshold, args.min_ms / 1000)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions")
+        return
+
+    results = run(args)
+    _print_results(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,128 @@
+"""Calculator.evaluate: compiled, cached programs vs re-parsing on every call.
+
+The baseline is the engine the calculator used to have: split on spaces and
+run shunting-yard with lambda dispatch for every call. The compiled engine is
+timed with a cold cache (every expression new) and a warm one (the same
+formula shapes repeated).
+
+The last section evaluates one formula with variables over `--rows` rows:
+`evaluate_many` on whole columns (NumPy when installed, otherwise one pass
+of chained maps over array.array columns) against calling `evaluate` per row.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_calculator --calls 200000 --rows 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "calculator"))
+
+from pkg import expression as compiled_expression  # noqa: E402
+from pkg.calculator import Calculator  # noqa: E402
+
+
+class SplitCalculator:
+    # the calculator before expressions were compiled, kept for comparison
+    def __init__(self):
+        self.operators = {
+            "+": lambda a, b: a + b,
+            "-": lambda a, b: a - b,
+            "*": lambda a, b: a * b,
+            "/": lambda a, b: a / b,
+        }
+        self.precedence = {"+": 1, "-": 1, "*": 2, "/": 2}
+
+    def evaluate(self, expression):
+        if not expression or expression.isspace():
+            return None
+        values, operators = [], []
+        for token in expression.strip().split():
+            if token in self.operators:
+                while operators and self.precedence[operators[-1]] >= self.precedence[token]:
+                    self._apply(operators, values)
+                operators.append(token)
+            else:
+                values.append(float(token))
+        while operators:
+            self._apply(operators, values)
+        return values[0]
+
+    def _apply(self, operators, values):
+        operator = operators.pop()
+        b = values.pop()
+        a = values.pop()
+        values.append(self.operators[operator](a, b))
+
+
+def expressions(count, shapes, seed=0):
+    # `shapes` distinct formulas, each evaluated count / shapes times
+    rng = random.Random(seed)
+    formulas = [
+        " ".join(
+            f"{rng.randint(1, 99)} {rng.choice('+-*/')}" for _ in range(rng.randint(2, 8))
+        ) + f" {rng.randint(1, 99)}"
+        for _ in range(shapes)
+    ]
+    return [formulas[i % shapes] for i in range(count)]
+
+
+def bench(name, calculator, workload):
+    start = time.perf_counter()
+    for expression in workload:
+        calculator.evaluate(expression)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<24} {elapsed * 1e9 / len(workload):8.0f} ns/call  ({len(workload)} calls)")
+    return elapsed
+
+
+def bench_rows(rows, formula="a * b + c / 4 - a"):
+    rng = random.Random(2)
+    columns = {name: array("d", (rng.uniform(-100, 100) for _ in range(rows))) for name in "abc"}
+    calculator = Calculator()
+    backend = "NumPy" if compiled_expression.numpy is not None else "array.array + map"
+
+    start = time.perf_counter()
+    many = calculator.evaluate_many(formula, columns)
+    vectorized = time.perf_counter() - start
+
+    a, b, c = columns["a"], columns["b"], columns["c"]
+    start = time.perf_counter()
+    looped = [calculator.evaluate(formula, {"a": a[i], "b": b[i], "c": c[i]}) for i in range(rows)]
+    per_row = time.perf_counter() - start
+
+    assert list(many) == looped, "evaluate_many disagrees with evaluate"
+    print(f"\n{formula!r} over {rows} rows")
+    print(f"{'evaluate per row':<24} {per_row * 1e9 / rows:8.0f} ns/row  ({per_row:.2f}s)")
+    print(f"{'evaluate_many':<24} {vectorized * 1e9 / rows:8.0f} ns/row  ({vectorized:.2f}s, {backend})")
+    print(f"columns: {per_row / vectorized:.1f}x faster than a loop of evaluate")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark calculator expression evaluation")
+    parser.add_argument("--calls", type=int, default=200_000, help="Evaluations per run")
+    parser.add_argument("--shapes", type=int, default=100, help="Distinct formulas in the repeated workload")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Rows for the evaluate_many comparison")
+    args = parser.parse_args()
+
+    repeated = expressions(args.calls, args.shapes)
+    distinct = expressions(args.calls // 10, args.calls // 10, seed=1)
+
+    # same answers before timing anything
+    for expression in repeated[:args.shapes] + distinct[:1000]:
+        assert Calculator().evaluate(expression) == SplitCalculator().evaluate(expression), expression
+
+    baseline = bench("split + shunting-yard", SplitCalculator(), repeated)
+    compiled = bench("compiled, warm cache", Calculator(), repeated)
+    bench("split, distinct", SplitCalculator(), distinct)
+    bench("compiled, cold cache", Calculator(cache_size=0), distinct)
+    print(f"\nrepeated formulas: {baseline / compiled:.1f}x faster with the program cache")
+    bench_rows(args.rows)
+
+
+if __name__ == "__main__":
+    main()
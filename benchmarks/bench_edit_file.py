@@ -0,0 +1,71 @@
+"""Changing one line of a large file: write_file rewrite vs edit_file hunk.
+
+Compares the size of the arguments the model has to generate for each call
+(a proxy for output tokens) and how long the tool takes to apply it.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_edit_file --lines 2000
+"""
+import argparse
+import json
+import statistics
+import tempfile
+import time
+
+from compaction import CHARS_PER_TOKEN
+from functions.edit_file import edit_file
+from functions.write_file import write_file
+
+
+def bench(name, tool, working_directory, calls, runs):
+    # cycles through `calls` so edits can undo each other between runs
+    timings = []
+    for run in range(runs):
+        args = calls[run % len(calls)]
+        start = time.perf_counter()
+        result = tool(working_directory, **args)
+        timings.append((time.perf_counter() - start) * 1000)
+        assert result.startswith("Successfully"), result
+
+    chars = len(json.dumps(calls[0]))
+    print(
+        f"{name:<10} args={chars:8d} chars (~{chars // CHARS_PER_TOKEN} tokens) "
+        f"median={statistics.median(timings):6.2f}ms"
+    )
+    return chars
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark a one-line change to a large file")
+    parser.add_argument("--lines", type=int, default=2000, help="Lines in the edited file")
+    parser.add_argument("--runs", type=int, default=20, help="Timed calls per tool")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as working_directory:
+        def source(target_line):
+            return "".join(
+                f"def function_{i}(value):\n    return value * {i}{target_line if i == args.lines // 4 else ''}\n"
+                for i in range(args.lines // 2)
+            )
+
+        original, changed = source(""), source(" + 1")
+        write_file(working_directory, "module.py", original)
+
+        header = f"def function_{args.lines // 4}(value):\n    return value * {args.lines // 4}"
+        write_calls = [
+            {"file_path": "module.py", "content": changed},
+            {"file_path": "module.py", "content": original},
+        ]
+        edit_calls = [
+            {"file_path": "module.py", "edits": [{"search": header + "\n", "replace": header + " + 1\n"}]},
+            {"file_path": "module.py", "edits": [{"search": header + " + 1\n", "replace": header + "\n"}]},
+        ]
+
+        write_chars = bench("write_file", write_file, working_directory, write_calls, args.runs)
+        edit_chars = bench("edit_file", edit_file, working_directory, edit_calls, args.runs)
+    print(f"{'':<10} output tokens x{write_chars / edit_chars:.0f} fewer with edit_file")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Finding and reading one function of a large module: whole-file reads vs outline + symbol.
+
+The baseline reads the file with get_file_content, page after page of
+MAX_CHARS, the way the agent has to without the outline tools. The
+alternative is get_file_outline followed by get_symbol for one method, with
+an outline of the method's class in between when the module is big enough
+for its outline to list class members by name only.
+Result sizes stand in for prompt tokens. The outline is timed on a cold
+parse and on the cached AST.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_outline --classes 40 --methods 12
+    python -m benchmarks.bench_outline --file main.py
+"""
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+
+from compaction import CHARS_PER_TOKEN
+from config import MAX_CHARS
+from functions import code_outline
+from functions.code_outline import get_file_outline, get_symbol
+from functions.get_file_content import get_file_content
+
+
+def synthetic_module(classes, methods):
+    chunks = ['"""A generated module."""\nimport math\n\nSCALE = 2\n\n']
+    for c in range(classes):
+        chunks.append(f"class Shape{c}:\n    \"\"\"Shape number {c}.\"\"\"\n\n")
+        for m in range(methods):
+            chunks.append(
+                f"    def measure_{m}(self, width, height, depth=1.0):\n"
+                f"        \"\"\"Measure {m} of the shape.\"\"\"\n"
+                f"        total = width * height * depth * SCALE\n"
+                f"        for step in range({m + 1}):\n"
+                f"            total += math.sqrt(step + {c})\n"
+                f"        return total / {m + 1}\n\n"
+            )
+    return "".join(chunks)
+
+
+def read_whole_file(working_directory, file_path):
+    # every page of the file, as the agent reads it when it can only page
+    results = [get_file_content(working_directory, file_path)]
+    total_lines = sum(1 for _ in open(os.path.join(working_directory, file_path), encoding="utf-8"))
+    page_lines = max(1, results[0][:MAX_CHARS].count("\n"))
+    for start_line in range(page_lines + 1, total_lines + 1, page_lines):
+        results.append(get_file_content(working_directory, file_path, start_line=start_line, end_line=start_line + page_lines - 1))
+    return results
+
+
+def timed(function, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def report(name, results):
+    chars = sum(len(result) for result in results)
+    print(f"{name:<22} {len(results):3d} call(s) {chars:9d} chars (~{chars // CHARS_PER_TOKEN} tokens)")
+    return chars
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark outline and symbol reads against whole-file reads")
+    parser.add_argument("--classes", type=int, default=40, help="Classes in the generated module")
+    parser.add_argument("--methods", type=int, default=12, help="Methods per generated class")
+    parser.add_argument("--file", help="Measure this Python file instead of a generated one")
+    parser.add_argument("--symbol", help="Symbol to read with get_symbol (default: a method from the middle)")
+    parser.add_argument("--runs", type=int, default=20, help="Timed outline calls")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as working_directory:
+        file_path = "module.py"
+        if args.file:
+            shutil.copyfile(args.file, os.path.join(working_directory, file_path))
+        else:
+            with open(os.path.join(working_directory, file_path), "w", encoding="utf-8") as f:
+                f.write(synthetic_module(args.classes, args.methods))
+
+        outlines = [get_file_outline(working_directory, file_path)]
+        assert not outlines[0].startswith("Error"), outlines[0]
+        _, symbols = code_outline._parse(working_directory, file_path, "outline")
+        symbol = args.symbol
+        if symbol is None:
+            functions = [qualname for qualname, _, _, _, signature, _ in symbols if "def " in signature]
+            symbol = functions[len(functions) // 2]
+        if "." in symbol and "by name only" in outlines[0].splitlines()[0]:
+            outlines.append(get_file_outline(working_directory, file_path, symbol.rpartition(".")[0]))
+        source = get_symbol(working_directory, file_path, symbol)
+        assert not source.startswith("Error"), source
+
+        size = os.path.getsize(os.path.join(working_directory, file_path))
+        print(f"{file_path}: {size} bytes, {len(symbols)} definitions, reading {symbol}\n")
+        whole = report("get_file_content pages", read_whole_file(working_directory, file_path))
+        first = report("get_file_content once", [get_file_content(working_directory, file_path)])
+        targeted = report("outline + symbol", [*outlines, source])
+
+        def cold():
+            code_outline.forget_outline(working_directory, file_path)
+            get_file_outline(working_directory, file_path)
+
+        print(f"\noutline: cold parse {timed(cold, args.runs):.2f}ms, cached AST "
+              f"{timed(lambda: get_file_outline(working_directory, file_path), args.runs):.2f}ms")
+        print(f"prompt chars: {whole / targeted:.1f}x fewer than reading the whole file, "
+              f"{first / targeted:.1f}x fewer than its first page")
+
+
+if __name__ == "__main__":
+    main()
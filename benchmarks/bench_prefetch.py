@@ -0,0 +1,87 @@
+"""Reading files after a listing: on demand vs prefetched.
+
+A generated project of `--files` Python modules plus main.py, tests.py and a
+README is listed with get_files_info, and then the agent's usual next reads
+follow one per model turn, `--turn-ms` apart. Each prefetch mode reports the
+time spent inside the reads, the hit rate, the bytes read that were never
+asked for and, for "inline", how much the listing grew and how many of the
+reads its previews already answered in full.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_prefetch --files 30 --reads 4 --turn-ms 50
+"""
+import argparse
+import tempfile
+import time
+
+from google.genai import types
+
+from call_function import call_function
+from functions.write_file import write_file
+from prefetch import prefetcher
+from tool_cache import tool_cache
+
+
+def project(working_directory, files, file_lines):
+    body = "".join(f"    total += {line} * value\n" for line in range(file_lines))
+    for i in range(files):
+        write_file(working_directory, f"module_{i}.py", f"def compute_{i}(value):\n    total = 0\n{body}    return total\n")
+    imports = "".join(f"from module_{i} import compute_{i}\n" for i in range(files))
+    write_file(working_directory, "main.py", imports + "\nprint(compute_0(1))\n")
+    write_file(working_directory, "tests.py", "import unittest\nfrom module_0 import compute_0\n" + body)
+    write_file(working_directory, "README.md", "# project\n\nComputes things.\n")
+
+
+def call(name, working_directory, **args):
+    result = call_function(types.FunctionCall(name=name, args=args), working_directory=working_directory)
+    return result.parts[0].function_response.response["result"]
+
+
+def session(working_directory, mode, reads, turn_seconds):
+    # the listing, time inside the reads, reads the previews answered and this session's prefetch counts
+    prefetcher.configure(mode)
+    prefetcher.clear()
+    tool_cache.clear()
+    before = prefetcher.stats()
+    listing = call("get_files_info", working_directory)
+    read_seconds = 0.0
+    answered = 0
+    for path in ["main.py", "README.md", "tests.py", "module_0.py", "module_1.py", "module_2.py"][:reads]:
+        time.sleep(turn_seconds)  # the model reading the previous result
+        start = time.perf_counter()
+        content = call("get_file_content", working_directory, file_path=path)
+        read_seconds += time.perf_counter() - start
+        assert not content.startswith("Error"), content
+        if f"--- {path} (whole file" in listing:
+            answered += 1
+    after = prefetcher.stats()
+    counts = {name: after[name] - before[name] for name in ["prefetched", "bytes_prefetched", "hits"]}
+    return listing, read_seconds, answered, counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark prefetching likely reads after a listing")
+    parser.add_argument("--files", type=int, default=30, help="Generated modules besides main.py, tests.py and README.md")
+    parser.add_argument("--file-lines", type=int, default=200, help="Lines per generated module")
+    parser.add_argument("--reads", type=int, default=4, help="Files read after the listing, most likely first")
+    parser.add_argument("--turn-ms", type=float, default=50.0, help="Model time between two reads")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as working_directory:
+        project(working_directory, args.files, args.file_lines)
+        baseline = None
+        for mode in ["off", "buffer", "inline"]:
+            listing, read_seconds, answered, counts = session(working_directory, mode, args.reads, args.turn_ms / 1000)
+            baseline = baseline or listing
+            print(
+                f"{mode:<7} reads {read_seconds * 1000:6.2f}ms  hits {counts['hits']}/{args.reads}  "
+                f"prefetched {counts['prefetched']} files / {counts['bytes_prefetched']} bytes, "
+                f"{counts['prefetched'] - counts['hits']} never read  listing {len(listing)} chars "
+                f"(+{len(listing) - len(baseline)})  answered by previews {answered}/{args.reads}"
+            )
+    prefetcher.configure("off")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Per-call latency of run_python_file: fresh subprocess vs warm forkserver worker.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_run_python --runs 20
+"""
+import argparse
+import statistics
+import time
+
+import functions.run_python as run_python
+from config import WORKING_DIR
+
+
+def bench(label, file_path, args, runs):
+    # one untimed call so the worker mode's forkserver is already up
+    run_python.run_python_file(WORKING_DIR, file_path, args)
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        run_python.run_python_file(WORKING_DIR, file_path, args)
+        timings.append((time.perf_counter() - start) * 1000)
+
+    timings.sort()
+    p95 = timings[min(len(timings) - 1, int(len(timings) * 0.95))]
+    print(
+        f"{label:<10} {file_path:<10} mean={statistics.mean(timings):7.1f}ms "
+        f"median={statistics.median(timings):7.1f}ms p95={p95:7.1f}ms"
+    )
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark run_python_file latency")
+    parser.add_argument("--runs", type=int, default=20, help="Timed calls per script and mode")
+    args = parser.parse_args()
+
+    for file_path, script_args in [("main.py", ["3 + 5"]), ("tests.py", None)]:
+        run_python.PYTHON_WORKER_POOL = False
+        cold = bench("subprocess", file_path, script_args, args.runs)
+        run_python.PYTHON_WORKER_POOL = True
+        warm = bench("worker", file_path, script_args, args.runs)
+        print(f"{'':<10} {file_path:<10} speedup x{cold / warm:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""Testing after a one-file change: the whole suite vs run_tests' affected tests.
+
+A generated project has `--modules` modules, each with its own test class of
+`--cases` slow-ish cases in one tests.py. After changing one module the
+suite is run three ways: `python tests.py` through run_python_file (what the
+agent did before), run_tests(full=True), and run_tests on the changes alone.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_run_tests --modules 20 --cases 10
+"""
+import argparse
+import tempfile
+import time
+
+from functions.run_python import run_python_file
+from functions.run_tests import run_tests
+from functions.write_file import write_file
+
+
+def module_source(index, version=0):
+    return f"def compute_{index}(n):\n    return sum(range(n)) + {index} + {version} * 0\n"
+
+
+def tests_source(modules, cases, case_seconds):
+    lines = ["import time", "import unittest"]
+    lines += [f"from pkg.module_{i} import compute_{i}" for i in range(modules)]
+    for i in range(modules):
+        lines += ["", "", f"class TestModule{i}(unittest.TestCase):"]
+        for case in range(cases):
+            lines += [
+                f"    def test_{case}(self):",
+                f"        time.sleep({case_seconds})",
+                f"        self.assertEqual(compute_{i}({case}), sum(range({case})) + {i})",
+            ]
+    lines += ["", "", 'if __name__ == "__main__":', "    unittest.main()", ""]
+    return "\n".join(lines)
+
+
+def timed(name, function):
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<28} {elapsed:6.2f}s  {result.splitlines()[0][:90]}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark affected-only test runs against the whole suite")
+    parser.add_argument("--modules", type=int, default=20, help="Modules, each with its own test class")
+    parser.add_argument("--cases", type=int, default=10, help="Test cases per module")
+    parser.add_argument("--case-ms", type=float, default=20.0, help="Time each test case sleeps")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as working_directory:
+        write_file(working_directory, "pkg/__init__.py", "")
+        for i in range(args.modules):
+            write_file(working_directory, f"pkg/module_{i}.py", module_source(i))
+        write_file(working_directory, "tests.py", tests_source(args.modules, args.cases, args.case_ms / 1000))
+
+        timed("first run_tests (full)", lambda: run_tests(working_directory))
+        write_file(working_directory, "pkg/module_0.py", module_source(0, version=1))
+
+        whole = timed("run_python_file tests.py", lambda: run_python_file(working_directory, "tests.py"))
+        full = timed("run_tests full=true", lambda: run_tests(working_directory, full=True))
+        write_file(working_directory, "pkg/module_0.py", module_source(0, version=2))
+        affected = timed("run_tests affected", lambda: run_tests(working_directory))
+        print(f"\naffected only: {whole / affected:.1f}x faster than the whole suite in one process, "
+              f"{full / affected:.1f}x faster than run_tests full=true")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""CLI startup cost: what `python main.py` pays before it does any work.
+
+Every scenario runs in a fresh interpreter with `-X importtime`:
+
+- bare interpreter: `python -c pass`, the baseline the others are measured against
+- import main: importing the agent, which should not touch the Gemini SDK
+- --help: the whole `python main.py --help` command
+- model call ready: importing main and building the shared request config,
+  which is where the SDK import now happens
+
+The slowest imports of `import main` are listed, and the command exits 1 when
+the median of `import main` or `--help` takes more than `--budget-ms` longer
+than the bare interpreter.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_startup --runs 10 --budget-ms 150
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = {
+    "bare interpreter": ["-c", "pass"],
+    "import main": ["-c", "import main"],
+    "--help": ["main.py", "--help"],
+    "model call ready": ["-c", "import main; main.generate_config()"],
+}
+BUDGETED = ("import main", "--help")
+
+
+def run_once(argv):
+    start = time.perf_counter()
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", *argv],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    wall_ms = (time.perf_counter() - start) * 1000
+    return wall_ms, parse_importtime(completed.stderr)
+
+
+def parse_importtime(stderr):
+    # "import time: self [us] | cumulative | imported package", nested imports indented
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        imports.append((name.rstrip(), int(self_us), int(cumulative_us)))
+    return imports
+
+
+def bench(name, argv, runs):
+    walls, import_totals = [], []
+    for _ in range(runs):
+        wall_ms, imports = run_once(argv)
+        walls.append(wall_ms)
+        # top-level entries' cumulative times add up to everything imported
+        import_totals.append(sum(cumulative for module, _, cumulative in imports if not module.startswith("  ")) / 1000)
+    result = {
+        "wall_ms": statistics.median(walls),
+        "import_ms": statistics.median(import_totals),
+        "modules": len(imports),
+        "sdk_loaded": any(module.strip() == "google.genai" for module, _, _ in imports),
+    }
+    print(
+        f"{name:<18} wall median={result['wall_ms']:7.1f}ms  imports={result['import_ms']:7.1f}ms "
+        f"({result['modules']} modules, Gemini SDK {'loaded' if result['sdk_loaded'] else 'not loaded'})"
+    )
+    return result, imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark CLI startup and import time")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per scenario")
+    parser.add_argument(
+        "--budget-ms", type=float, default=150.0,
+        help="Allowed median wall time of import main and --help on top of the bare interpreter",
+    )
+    parser.add_argument("--top", type=int, default=10, help="Slowest imports of import main to list")
+    args = parser.parse_args()
+
+    results = {}
+    for name, argv in SCENARIOS.items():
+        results[name], imports = bench(name, argv, args.runs)
+        if name == "import main":
+            slowest = sorted(imports, key=lambda entry: entry[1], reverse=True)[:args.top]
+
+    print("\nslowest imports of import main (self time, last run):")
+    for module, self_us, cumulative_us in slowest:
+        print(f"  {module.strip():<40} self={self_us / 1000:6.1f}ms cumulative={cumulative_us / 1000:6.1f}ms")
+
+    baseline = results["bare interpreter"]["wall_ms"]
+    over = False
+    print()
+    for name in BUDGETED:
+        overhead = results[name]["wall_ms"] - baseline
+        within = overhead <= args.budget_ms
+        over = over or not within
+        print(f"{'ok' if within else 'OVER BUDGET':<12} {name}: +{overhead:.1f}ms over the bare interpreter (budget {args.budget_ms:.0f}ms)")
+    if over:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
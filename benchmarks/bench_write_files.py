@@ -0,0 +1,85 @@
+"""Multi-file changes: one write_file per file vs a write_files transaction,
+and undoing them with checkpoint/rollback vs a full copy of the workspace.
+
+A generated workspace of `--files` modules gets a change to `--changed` of
+them. Writes are timed without and with fsync (WRITE_FSYNC). Tool calls
+stand in for model round trips. The checkpoint is compared with copying
+the workspace aside and copying it back.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_write_files --files 2000 --changed 10
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from functions import write_file as write_file_module
+from functions.checkpoint import checkpoint, drop_checkpoints, rollback
+from functions.write_file import write_file, write_files
+
+
+def module_source(index, version=0):
+    return f"def compute_{index}(value):\n    return value * {index} + {version}\n" * 20
+
+
+def timed(name, function, calls=1):
+    start = time.perf_counter()
+    result = function()
+    elapsed = time.perf_counter() - start
+    print(f"{name:<34} {elapsed * 1000:8.2f}ms  {calls:3d} call(s)")
+    assert not result.startswith("Error"), result
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark write_files transactions and checkpoint/rollback")
+    parser.add_argument("--files", type=int, default=2000, help="Modules in the generated workspace")
+    parser.add_argument("--changed", type=int, default=10, help="Modules one change touches")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as root:
+        working_directory = os.path.join(root, "workspace")
+        for i in range(args.files):
+            write_file(working_directory, f"pkg/module_{i}.py", module_source(i))
+
+        def change(version):
+            return [
+                {"file_path": f"pkg/module_{i}.py", "content": module_source(i, version)}
+                for i in range(args.changed)
+            ]
+
+        for fsync in [False, True]:
+            label = "fsync" if fsync else "no fsync"
+            write_file_module.WRITE_FSYNC = fsync
+
+            def one_by_one(files):
+                results = [write_file(working_directory, **entry) for entry in files]
+                return next((result for result in results if result.startswith("Error")), results[-1])
+
+            timed(f"write_file x{args.changed} ({label})", lambda: one_by_one(change(1)), args.changed)
+            timed(f"write_files ({label})", lambda: write_files(working_directory, change(2)))
+        write_file_module.WRITE_FSYNC = False
+        print()
+
+        backup = os.path.join(root, "backup")
+        copy = timed("copytree (checkpoint by copy)", lambda: shutil.copytree(working_directory, backup) and "")
+        taken = timed("checkpoint", lambda: checkpoint(working_directory))
+        write_files(working_directory, change(3))
+
+        def restore_copy():
+            shutil.rmtree(working_directory)
+            shutil.copytree(backup, working_directory)
+            return ""
+
+        restore = timed("rmtree + copytree (restore by copy)", restore_copy)
+        write_files(working_directory, change(4))
+        rolled = timed("rollback", lambda: rollback(working_directory))
+        print(f"\ncheckpoint {copy / taken:.1f}x faster than a copy, rollback {restore / rolled:.1f}x faster than restoring it")
+        drop_checkpoints(working_directory)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,25 @@
+import functools
+import operator
+
+from pkg.expression import compile_expression, divide_ieee
+
+
 class Calculator:
-    def __init__(self):
+    """Evaluates infix expressions over numbers and named variables.
+
+    `zero_division` says what dividing by zero does, the same for single
+    values and whole columns: "raise" raises ZeroDivisionError, "ieee" gives
+    inf, -inf or nan as IEEE 754 floating point does.
+    """
+
+    def __init__(self, cache_size=1024, zero_division="raise"):
+        if zero_division not in ("raise", "ieee"):
+            raise ValueError(f'zero_division must be "raise" or "ieee", not {zero_division!r}')
         self.operators = {
-            "+": lambda a, b: a + b,
-            "-": lambda a, b: a - b,
-            "*": lambda a, b: a * b,
-            "/": lambda a, b: a / b,
+            "+": operator.add,
+            "-": operator.sub,
+            "*": operator.mul,
+            "/": operator.truediv if zero_division == "raise" else divide_ieee,
         }
         self.precedence = {
             "+": 1,
@@ -12,48 +27,17 @@ class Calculator:
             "*": 2,
             "/": 2,
         }
+        # compiled programs by expression text, least recently used dropped first
+        self.compile = functools.lru_cache(maxsize=cache_size)(self._compile)
 
-    def evaluate(self, expression):
+    def evaluate(self, expression, variables=None):
         if not expression or expression.isspace():
             return None
-        tokens = expression.strip().split()
-        return self._evaluate_infix(tokens)
-
-    def _evaluate_infix(self, tokens):
-        values = []
-        operators = []
-
-        for token in tokens:
-            if token in self.operators:
-                while (
-                    operators
-                    and operators[-1] in self.operators
-                    and self.precedence[operators[-1]] >= self.precedence[token]
-                ):
-                    self._apply_operator(operators, values)
-                operators.append(token)
-            else:
-                try:
-                    values.append(float(token))
-                except ValueError:
-                    raise ValueError(f"invalid token: {token}")
-
-        while operators:
-            self._apply_operator(operators, values)
-
-        if len(values) != 1:
-            raise ValueError("invalid expression")
-
-        return values[0]
-
-    def _apply_operator(self, operators, values):
-        if not operators:
-            return
-
-        operator = operators.pop()
-        if len(values) < 2:
-            raise ValueError(f"not enough operands for operator {operator}")
-
-        b = values.pop()
-        a = values.pop()
-        values.append(self.operators[operator](a, b))
+        return self.compile(expression).evaluate(variables)
+
+    def evaluate_many(self, expression, columns):
+        """Evaluate `expression` for every row of `columns`; see Program.evaluate_many."""
+        return self.compile(expression).evaluate_many(columns)
+
+    def _compile(self, expression):
+        return compile_expression(expression, self.operators, self.precedence)
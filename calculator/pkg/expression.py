@@ -0,0 +1,304 @@
+import math
+import numbers
+import operator
+from array import array
+from itertools import repeat
+
+try:
+    import numpy
+except ImportError:  # evaluate_many falls back to plain Python columns
+    numpy = None
+
+
+SYMBOLS = "+-*/()"
+
+OPERATORS = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": operator.truediv,
+}
+PRECEDENCE = {
+    "+": 1,
+    "-": 1,
+    "*": 2,
+    "/": 2,
+}
+
+# unary minus; it binds tighter than any binary operator
+NEGATE = "neg"
+_NEGATE_PENDING = ((NEGATE, None), float("inf"))
+# names float() reads as numbers rather than variables
+_FLOAT_NAMES = {"inf", "infinity", "nan"}
+
+
+def divide_ieee(a, b):
+    """a / b, with division by zero giving IEEE 754 results instead of raising:
+    +-inf for a nonzero numerator, nan for 0 / 0 and nan / 0."""
+    try:
+        return a / b
+    except ZeroDivisionError:
+        if a == 0 or math.isnan(a):
+            return math.nan
+        return math.copysign(math.inf, a) * math.copysign(1.0, b)
+
+
+class Program:
+    """A compiled expression: flat postfix code for a small stack machine.
+
+    Each instruction is ("const", number), ("load", variable name),
+    ("neg", None) or, for a binary operator, its symbol and function.
+    Constant subexpressions are folded when compiling; an expression without
+    variables keeps its result in `value`.
+    """
+
+    __slots__ = ("expression", "code", "variables", "value")
+
+    def __init__(self, expression, code, variables, value=None):
+        self.expression = expression
+        self.code = code
+        self.variables = variables
+        self.value = value
+
+    def evaluate(self, variables=None):
+        """The value of the expression for one set of `variables` (name -> number)."""
+        if not self.variables:
+            return self.value
+        values = {name: float(value) for name, value in _bind(self.variables, variables or {})}
+        stack = []
+        for op, argument in self.code:
+            if op == "const":
+                stack.append(argument)
+            elif op == "load":
+                stack.append(values[argument])
+            elif op == NEGATE:
+                stack[-1] = -stack[-1]
+            else:
+                b = stack.pop()
+                stack[-1] = argument(stack[-1], b)
+        return stack[0]
+
+    def evaluate_many(self, columns):
+        """The value of the expression for every row of `columns`.
+
+        `columns` maps each variable to a column (a NumPy array, an
+        array.array, a memoryview or any sequence of numbers) or to a single
+        number used for every row. Columns must all have the same length,
+        including columns the expression does not use: they set the number
+        of rows when it uses only constants and single numbers.
+        With NumPy installed every instruction is one vectorized operation
+        over whole columns and a float64 array is returned. Otherwise the
+        instructions are chained into one pass over the rows, producing an
+        array.array of doubles. Either way each row gets exactly the result
+        `evaluate` would give it, including how division by zero is handled.
+        """
+        bound = dict(_bind(self.variables, columns))
+        lengths = {len(column) for column in columns.values() if not isinstance(column, numbers.Real)}
+        if len(lengths) > 1:
+            raise ValueError(f"columns have different lengths: {sorted(lengths)}")
+        if not lengths:
+            raise ValueError("evaluate_many needs at least one column")
+        length = lengths.pop()
+
+        if numpy is not None and all(op in ("const", "load", NEGATE) or argument in _NUMPY_OPERATORS for op, argument in self.code):
+            return self._evaluate_numpy(bound, length)
+        return self._evaluate_columns(bound, length)
+
+    def _evaluate_numpy(self, bound, length):
+        arrays = {
+            name: float(column) if isinstance(column, numbers.Real) else numpy.asarray(column, dtype=numpy.float64)
+            for name, column in bound.items()
+        }
+        stack = []
+        # inf - inf and the like give nan as Python floats do, without warnings
+        with numpy.errstate(all="ignore"):
+            for op, argument in self.code:
+                if op == "const":
+                    stack.append(argument)
+                elif op == "load":
+                    stack.append(arrays[argument])
+                elif op == NEGATE:
+                    stack[-1] = numpy.negative(stack[-1])
+                else:
+                    b = stack.pop()
+                    stack[-1] = _NUMPY_OPERATORS[argument](stack[-1], b)
+        if len(self.code) == 1 or not isinstance(stack[0], numpy.ndarray):
+            # a lone constant or variable, or only single numbers: a fresh
+            # array of the batch length, never the caller's own
+            return numpy.array(numpy.broadcast_to(stack[0], (length,)), dtype=numpy.float64)
+        return stack[0]
+
+    def _evaluate_columns(self, bound, length):
+        columns = {
+            name: column if isinstance(column, numbers.Real) or _is_double_array(column) else array("d", column)
+            for name, column in bound.items()
+        }
+        # lazy maps over the columns: one pass computes each row through every instruction
+        stack = []
+        for op, argument in self.code:
+            if op == "const":
+                stack.append(repeat(argument, length))
+            elif op == "load":
+                column = columns[argument]
+                stack.append(repeat(float(column), length) if isinstance(column, numbers.Real) else column)
+            elif op == NEGATE:
+                stack[-1] = map(operator.neg, stack[-1])
+            else:
+                b = stack.pop()
+                stack[-1] = map(argument, stack[-1], b)
+        return array("d", stack[0])
+
+    def __repr__(self):
+        return f"Program({self.expression!r}, {self.code!r})"
+
+
+def compile_expression(expression, operators=OPERATORS, precedence=PRECEDENCE):
+    """Compile infix `expression` into a Program.
+
+    Whitespace between tokens is optional. Raises ValueError with the same
+    messages evaluation always gave: an invalid token, an operator without
+    enough operands, or an expression that does not reduce to one value;
+    unbalanced parentheses are reported as mismatched.
+    """
+    postfix = _to_postfix(_split(expression), operators, precedence)
+
+    # check operand counts in the order evaluation always did, folding every
+    # operator whose operands are the constants just before it
+    code = []
+    depth = 0  # values the code so far leaves on the stack
+    for instruction in postfix:
+        op, argument = instruction
+        if op == "const" or op == "load":
+            code.append(instruction)
+            depth += 1
+        elif op == NEGATE:
+            if depth < 1:
+                raise ValueError("not enough operands for operator -")
+            if code[-1][0] == "const":
+                code[-1] = ("const", -code[-1][1])
+            else:
+                code.append(instruction)
+        else:
+            if depth < 2:
+                raise ValueError(f"not enough operands for operator {op}")
+            if code[-1][0] == "const" and code[-2][0] == "const":
+                b = code.pop()[1]
+                code[-1] = ("const", argument(code[-1][1], b))
+            else:
+                code.append(instruction)
+            depth -= 1
+
+    if depth != 1:
+        raise ValueError("invalid expression")
+    variables = tuple(dict.fromkeys(argument for op, argument in code if op == "load"))
+    value = code[0][1] if not variables else None
+    return Program(expression, tuple(code), variables, value)
+
+
+def _to_postfix(pieces, operators, precedence):
+    # shunting-yard; a "-" where an operand is expected is unary minus.
+    # `pending` holds "(" and the instructions of operators still waiting
+    # for their right-hand side, with their precedence
+    output = []
+    pending = []
+    expect_operand = True
+    for piece in pieces:
+        if piece == "(":
+            pending.append(piece)
+            expect_operand = True
+        elif piece == ")":
+            while pending and pending[-1] != "(":
+                output.append(pending.pop()[0])
+            if not pending:
+                raise ValueError("mismatched parentheses")
+            pending.pop()
+            expect_operand = False
+        elif piece in operators:
+            if piece == "-" and expect_operand:
+                pending.append(_NEGATE_PENDING)
+                continue
+            rank = precedence[piece]
+            while pending and pending[-1] != "(" and pending[-1][1] >= rank:
+                output.append(pending.pop()[0])
+            pending.append(((piece, operators[piece]), rank))
+            expect_operand = True
+        elif piece.isidentifier() and piece.lower() not in _FLOAT_NAMES:
+            output.append(("load", piece))
+            expect_operand = False
+        else:
+            try:
+                output.append(("const", float(piece)))
+            except ValueError:
+                raise ValueError(f"invalid token: {piece}")
+            expect_operand = False
+
+    while pending:
+        op = pending.pop()
+        if op == "(":
+            raise ValueError("mismatched parentheses")
+        output.append(op[0])
+    return output
+
+
+def _split(expression):
+    # pad every operator and parenthesis with spaces so str.split tokenizes
+    # unspaced input; chained replace beats str.translate and re here
+    for symbol in SYMBOLS:
+        if symbol in expression:
+            expression = expression.replace(symbol, f" {symbol} ")
+    pieces = expression.split()
+    if "e" in expression or "E" in expression:
+        pieces = _join_exponents(pieces)
+    return pieces
+
+
+def _join_exponents(pieces):
+    # an exponent's sign was split off with the operators: "1e", "-", "5"
+    joined = []
+    index = 0
+    while index < len(pieces):
+        piece = pieces[index]
+        if (
+            piece[-1] in "eE"
+            and piece[0] in "0123456789."
+            and index + 2 < len(pieces)
+            and pieces[index + 1] in ("+", "-")
+            and pieces[index + 2].isdigit()
+        ):
+            joined.append(piece + pieces[index + 1] + pieces[index + 2])
+            index += 3
+        else:
+            joined.append(piece)
+            index += 1
+    return joined
+
+
+def _bind(names, values):
+    # (name, value) for every variable the program reads
+    for name in names:
+        if name not in values:
+            raise ValueError(f"unknown variable: {name}")
+        yield name, values[name]
+
+
+def _is_double_array(column):
+    return isinstance(column, array) and column.typecode == "d"
+
+
+if numpy is not None:
+    def _numpy_divide(a, b):
+        # raise like the scalar path does, before any row is divided
+        if numpy.any(numpy.asarray(b) == 0):
+            raise ZeroDivisionError("float division by zero")
+        return numpy.divide(a, b)
+
+    # the scalar operator functions and the NumPy operations that give the same results
+    _NUMPY_OPERATORS = {
+        operator.add: numpy.add,
+        operator.sub: numpy.subtract,
+        operator.mul: numpy.multiply,
+        operator.truediv: _numpy_divide,
+        divide_ieee: numpy.divide,
+    }
+else:
+    _NUMPY_OPERATORS = {}
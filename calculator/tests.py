@@ -1,4 +1,9 @@
+import math
+import random
 import unittest
+from array import array
+
+from pkg import expression
 from pkg.calculator import Calculator
 
 
@@ -46,6 +51,97 @@ class TestCalculator(unittest.TestCase):
         result = self.calculator.evaluate("3 + 7 * 2")
         self.assertEqual(result, 17)
 
+    def test_unspaced_expression(self):
+        result = self.calculator.evaluate("2*3-8/2+5")
+        self.assertEqual(result, 7)
+
+    def test_parentheses(self):
+        result = self.calculator.evaluate("(3 + 7) * (2 - 4)")
+        self.assertEqual(result, -20)
+
+    def test_unary_minus(self):
+        result = self.calculator.evaluate("-3 * -(2 - 5)")
+        self.assertEqual(result, -9)
+
+    def test_mismatched_parentheses(self):
+        with self.assertRaises(ValueError):
+            self.calculator.evaluate("(3 + 5")
+        with self.assertRaises(ValueError):
+            self.calculator.evaluate("3 + 5)")
+
+    def test_invalid_expression(self):
+        with self.assertRaisesRegex(ValueError, "invalid expression"):
+            self.calculator.evaluate("3 5")
+
+    def test_compiled_program_is_cached(self):
+        program = self.calculator.compile("1 + 2 * 3")
+        self.assertIs(self.calculator.compile("1 + 2 * 3"), program)
+        self.assertEqual(program.evaluate(), 7)
+
+    def test_variables(self):
+        result = self.calculator.evaluate("a * b + c", {"a": 2, "b": 3, "c": 4})
+        self.assertEqual(result, 10)
+        self.assertEqual(self.calculator.compile("a * b + c").variables, ("a", "b", "c"))
+
+    def test_unknown_variable(self):
+        with self.assertRaisesRegex(ValueError, "unknown variable: b"):
+            self.calculator.evaluate("a + b", {"a": 1})
+
+    def test_evaluate_many(self):
+        columns = {"a": [1, 2, 3], "b": array("d", [4, 5, 6]), "c": memoryview(array("d", [7, 8, 9]))}
+        result = self.calculator.evaluate_many("a * b + c", columns)
+        self.assertEqual(list(result), [11, 18, 27])
+        result = self.calculator.evaluate_many("-a * 2", {"a": [1, 2], "b": 5})
+        self.assertEqual(list(result), [-2, -4])
+
+    def test_evaluate_many_matches_evaluate(self):
+        rng = random.Random(0)
+        columns = {name: [rng.choice([0.0, -0.0, rng.uniform(-10, 10)]) for _ in range(1000)] for name in "abc"}
+        calculator = Calculator(zero_division="ieee")
+        formula = "a * b + c / (a - b) - -c / 3"
+        many = calculator.evaluate_many(formula, columns)
+        for row, value in enumerate(many):
+            expected = calculator.evaluate(formula, {name: column[row] for name, column in columns.items()})
+            self.assertTrue(value == expected or math.isnan(value) and math.isnan(expected), (row, value, expected))
+
+    def test_evaluate_many_without_used_columns(self):
+        # the batch length comes from every column passed, used or not
+        numpy = expression.numpy
+        for use_numpy in ([False, True] if numpy else [False]):
+            expression.numpy = numpy if use_numpy else None
+            try:
+                self.assertEqual(list(self.calculator.evaluate_many("1 + 2", {"a": [1, 2, 3]})), [3, 3, 3])
+                result = self.calculator.evaluate_many("b * 2", {"a": array("d", [1, 2]), "b": 4})
+                self.assertEqual(list(result), [8, 8])
+                self.assertEqual(list(self.calculator.evaluate_many("b", {"a": [1, 2], "b": 4})), [4, 4])
+            finally:
+                expression.numpy = numpy
+        with self.assertRaisesRegex(ValueError, "at least one column"):
+            self.calculator.evaluate_many("1 + 2", {})
+        with self.assertRaisesRegex(ValueError, "different lengths"):
+            self.calculator.evaluate_many("b", {"a": [1, 2], "b": [1]})
+
+    def test_evaluate_many_columns_must_match(self):
+        with self.assertRaises(ValueError):
+            self.calculator.evaluate_many("a + b", {"a": [1, 2], "b": [1]})
+
+    def test_division_by_zero(self):
+        with self.assertRaises(ZeroDivisionError):
+            self.calculator.evaluate_many("a / b", {"a": [1, 2], "b": [1, 0]})
+        calculator = Calculator(zero_division="ieee")
+        result = calculator.evaluate_many("a / b", {"a": [1, -1, 0], "b": 0})
+        self.assertEqual(list(result[:2]), [math.inf, -math.inf])
+        self.assertTrue(math.isnan(result[2]))
+        self.assertEqual(calculator.evaluate("-1 / 0"), -math.inf)
+
+    @unittest.skipUnless(expression.numpy, "NumPy is not installed")
+    def test_evaluate_many_numpy(self):
+        numpy = expression.numpy
+        a = numpy.linspace(-5, 5, 101)
+        result = self.calculator.evaluate_many("a * a - a / 3", {"a": a})
+        self.assertIsInstance(result, numpy.ndarray)
+        self.assertEqual(list(result), [self.calculator.evaluate("a * a - a / 3", {"a": value}) for value in a])
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -1,62 +1,365 @@
-from google.genai import types
+import asyncio
+import functools
+import importlib
+import json
+import os
+import re
+import time
 
-from functions.get_files_info import schema_get_files_info, get_files_info
-from functions.get_file_content import schema_get_file_content, get_file_content
-from functions.run_python import schema_run_python_file, run_python_file
-from functions.write_file import schema_write_file, write_file
-from config import WORKING_DIR
+from config import WORKING_DIR, MAX_TOOL_WORKERS
+from prefetch import prefetcher
+from tool_cache import tool_cache
+from tracing import tracer
 
 
-# give LLM toolbox to generate a response
-available_functions = types.Tool(
-    function_declarations=[
-        schema_get_files_info,
-        schema_get_file_content,
-        schema_run_python_file,
-        schema_write_file,
-    ]
-)
+# the summary line run_python_file and run_tests end their output with
+EXIT_CODE = re.compile(r"\[exit code (-?\d+), wall time")
 
+# tools that only read from the working directory and can safely run side by side
+READ_ONLY_FUNCTIONS = {"get_files_info", "get_file_content", "get_file_outline", "get_symbol", "search_code"}
 
-def call_function(function_call_part, verbose=False):
+# the LLM's toolbox: each tool's module defines the function and its `schema_<name>`.
+# Modules are imported the first time a tool is declared or called, so starting
+# the CLI does not pay for the Gemini SDK or for tools a session never uses
+TOOL_MODULES = {
+    "get_files_info": "functions.get_files_info",
+    "get_file_content": "functions.get_file_content",
+    "get_file_outline": "functions.code_outline",
+    "get_symbol": "functions.code_outline",
+    "run_python_file": "functions.run_python",
+    "run_tests": "functions.run_tests",
+    "write_file": "functions.write_file",
+    "write_files": "functions.write_file",
+    "edit_file": "functions.edit_file",
+    "search_code": "functions.search_code",
+    "checkpoint": "functions.checkpoint",
+    "rollback": "functions.checkpoint",
+}
+
+
+def _lazy_tool(module_name, function_name, is_async=False):
+    # stands in for a tool until its first call, then forwards to the real function
+    resolved = []
+
+    def resolve():
+        if not resolved:
+            resolved.append(getattr(importlib.import_module(module_name), function_name))
+        return resolved[0]
+
+    if is_async:
+        async def tool(*args, **kwargs):
+            return await resolve()(*args, **kwargs)
+    else:
+        def tool(*args, **kwargs):
+            return resolve()(*args, **kwargs)
+    tool.__name__ = tool.__qualname__ = function_name
+    return tool
+
+
+# based on function_call_part call the actual function
+function_map = {name: _lazy_tool(module, name) for name, module in TOOL_MODULES.items()}
+
+# tools with a native async implementation; the rest run on a worker thread
+async_function_map = {
+    "run_python_file": _lazy_tool("functions.run_python", "run_python_file_async", is_async=True),
+}
+
+
+@functools.cache
+def tool_declarations():
+    """The types.Tool declaring every tool, built on first use and then shared."""
+    from google.genai import types
+
+    return types.Tool(
+        function_declarations=[
+            getattr(importlib.import_module(module), f"schema_{name}") for name, module in TOOL_MODULES.items()
+        ]
+    )
+
+
+def call_function(function_call_part, verbose=False, working_directory=WORKING_DIR):
+    _print_call(function_call_part, verbose)
+
+    if function_call_part.name not in function_map:
+        return _unknown_function_response(function_call_part.name)
+
+    function_call_part.args["working_directory"] = working_directory
+    with tracer.span("tool_call", tool=function_call_part.name) as span:
+        cache_key, output = _cached_output(function_call_part, verbose, working_directory)
+        cached = output is not None
+        if not cached:
+            output = _prefetched_output(function_call_part, verbose, working_directory, span)
+        if output is None:
+            call_actual_function = function_map[function_call_part.name]
+            output = call_actual_function(**function_call_part.args)
+        if not cached:
+            _after_call(function_call_part, cache_key, output, working_directory)
+        # cached listings too; the cache keeps them without inline previews
+        output = _with_prefetch(function_call_part, output, working_directory)
+        if span.recording:
+            _record_tool_span(span, function_call_part, cache_key, cached, output)
+    return _function_response(function_call_part.name, output)
+
+
+async def call_function_async(function_call_part, verbose=False, working_directory=WORKING_DIR):
+    _print_call(function_call_part, verbose)
+
+    if function_call_part.name not in function_map:
+        return _unknown_function_response(function_call_part.name)
+
+    function_call_part.args["working_directory"] = working_directory
+    with tracer.span("tool_call", tool=function_call_part.name) as span:
+        cache_key, output = _cached_output(function_call_part, verbose, working_directory)
+        cached = output is not None
+        if not cached:
+            output = _prefetched_output(function_call_part, verbose, working_directory, span)
+        if output is None:
+            if function_call_part.name in async_function_map:
+                output = await async_function_map[function_call_part.name](**function_call_part.args)
+            else:
+                output = await asyncio.to_thread(function_map[function_call_part.name], **function_call_part.args)
+        if not cached:
+            _after_call(function_call_part, cache_key, output, working_directory)
+        # cached listings too; the cache keeps them without inline previews
+        if prefetcher.mode == "inline":
+            # previews wait for their reads
+            output = await asyncio.to_thread(_with_prefetch, function_call_part, output, working_directory)
+        else:
+            output = _with_prefetch(function_call_part, output, working_directory)
+        if span.recording:
+            _record_tool_span(span, function_call_part, cache_key, cached, output)
+    return _function_response(function_call_part.name, output)
+
+
+def _record_tool_span(span, function_call_part, cache_key, cached, output):
+    args = {name: value for name, value in function_call_part.args.items() if name != "working_directory"}
+    span.set(
+        arg_bytes=len(json.dumps(args, default=str)),
+        output_bytes=len(output.encode()) if isinstance(output, str) else 0,
+        cache=None if cache_key is None else ("hit" if cached else "miss"),
+    )
+    if function_call_part.name in ("run_python_file", "run_tests") and isinstance(output, str):
+        match = EXIT_CODE.search(output)
+        if match:
+            span.set(exit_code=int(match.group(1)))
+
+
+def _cached_output(function_call_part, verbose, working_directory):
+    # the key is taken before the call runs, so it matches the files it saw
+    cache_key = tool_cache.key(function_call_part.name, function_call_part.args, working_directory)
+    if cache_key is None:
+        return None, None
+
+    output = tool_cache.get(cache_key)
+    if verbose and output is not None:
+        print(f"Cache hit: {function_call_part.name}")
+    return cache_key, output
+
+
+def _prefetched_output(function_call_part, verbose, working_directory, span):
+    # a whole-file read the prefetcher already has in memory
+    if function_call_part.name != "get_file_content" or prefetcher.mode == "off":
+        return None
+    args = function_call_part.args
+    if any(args.get(name) is not None for name in ("offset", "length", "start_line", "end_line")):
+        return None
+    output = prefetcher.take(working_directory, args.get("file_path", ""))
+    if output is not None:
+        span.set(prefetch="hit")
+        if verbose:
+            print(f"Prefetch hit: {args.get('file_path')}")
+    return output
+
+
+def _with_prefetch(function_call_part, output, working_directory):
+    # a listing starts prefetching the files it makes likely next reads
+    if function_call_part.name != "get_files_info" or prefetcher.mode == "off":
+        return output
+    args = function_call_part.args
+    # recursive listings already show paths relative to the working directory
+    directory = "." if args.get("recursive") else args.get("directory")
+    return prefetcher.after_listing(working_directory, directory, output)
+
+
+def _after_call(function_call_part, cache_key, output, working_directory):
+    from functions.code_outline import forget_outline
+    from functions.search_code import update_search_index, mark_search_index_stale
+
+    if cache_key is not None:
+        tool_cache.put(cache_key, output)
+
+    for file_path in written_paths(function_call_part):
+        tool_cache.invalidate(working_directory, file_path)
+        prefetcher.invalidate(working_directory, file_path)
+        update_search_index(working_directory, file_path)
+        forget_outline(working_directory, file_path)
+    if function_call_part.name in ("run_python_file", "run_tests"):
+        tool_cache.invalidate_listings(working_directory)
+        mark_search_index_stale(working_directory)
+    elif function_call_part.name == "rollback":
+        # any file may have been put back
+        tool_cache.clear(working_directory)
+        prefetcher.clear(working_directory)
+        mark_search_index_stale(working_directory)
+
+
+def written_paths(function_call_part):
+    """The paths a write_file, edit_file or write_files call writes to."""
+    args = function_call_part.args or {}
+    if function_call_part.name in ("write_file", "edit_file"):
+        return [args.get("file_path", ".")]
+    if function_call_part.name == "write_files":
+        return [entry.get("file_path") or "." for entry in args.get("files") or [] if isinstance(entry, dict)]
+    return []
+
+
+def call_functions(function_call_parts, verbose=False, working_directory=WORKING_DIR):
+    return asyncio.run(call_functions_async(function_call_parts, verbose, working_directory))
+
+
+async def call_functions_async(function_call_parts, verbose=False, working_directory=WORKING_DIR):
+    """Run one turn's function calls concurrently, at most MAX_TOOL_WORKERS at a time.
+
+    Read-only calls run in parallel. A call that writes waits for every earlier
+    call touching an overlapping path, so writes and runs keep the order the
+    model asked for. Results are returned in the original call order.
+    """
+    scheduler = CallScheduler(verbose, working_directory)
+    for function_call_part in function_call_parts:
+        scheduler.submit(function_call_part)
+    return await scheduler.results()
+
+
+class CallScheduler:
+    """Starts a turn's function calls one by one as they become known.
+
+    Used directly when the model's response is streamed, so each call can
+    start as soon as it has arrived; `results` waits for all of them. Must be
+    used from a running event loop.
+    """
+
+    def __init__(self, verbose=False, working_directory=WORKING_DIR):
+        self.verbose = verbose
+        self.working_directory = working_directory
+        self.limit = asyncio.Semaphore(MAX_TOOL_WORKERS)
+        self.scheduled = []
+        self.start = time.perf_counter()
+
+    def submit(self, function_call_part):
+        path, writes = _touched_path(function_call_part)
+        depends_on = [
+            task
+            for other_path, other_writes, task in self.scheduled
+            if (writes or other_writes) and _paths_overlap(path, other_path)
+        ]
+        task = asyncio.create_task(
+            _timed_call(function_call_part, depends_on, self.limit, self.verbose, self.working_directory)
+        )
+        self.scheduled.append((path, writes, task))
+
+    async def results(self):
+        results = await asyncio.gather(*(task for _, _, task in self.scheduled))
+
+        if self.verbose and results:
+            wall_time = time.perf_counter() - self.start
+            busy_time = sum(elapsed for _, elapsed in results)
+            print(f"Ran {len(results)} function call(s) in {wall_time:.3f}s (sequential total {busy_time:.3f}s)")
+
+        return [function_call_result for function_call_result, _ in results]
+
+    def cancel(self):
+        for _, _, task in self.scheduled:
+            task.cancel()
+
+
+async def _timed_call(function_call_part, depends_on, limit, verbose, working_directory):
+    # earlier calls on the same paths must finish first
+    if depends_on:
+        await asyncio.wait(depends_on)
+
+    async with limit:
+        start = time.perf_counter()
+        function_call_result = await call_function_async(function_call_part, verbose, working_directory)
+        elapsed = time.perf_counter() - start
+
+    if verbose:
+        print(f"{function_call_part.name} took {elapsed:.3f}s")
+    return function_call_result, elapsed
+
+
+def _touched_path(function_call_part):
+    # returns the path a call works on (relative to the working directory) and
+    # whether it modifies it; running a script can read or write anything, so
+    # it claims the whole working directory
+    args = function_call_part.args or {}
+    name = function_call_part.name
+
+    if name == "get_files_info":
+        return os.path.normpath(args.get("directory") or "."), False
+    if name in ("get_file_content", "get_file_outline", "get_symbol"):
+        return os.path.normpath(args.get("file_path", ".")), False
+    if name == "search_code":
+        return os.path.normpath(args.get("path") or "."), False
+    if name in ("write_file", "edit_file"):
+        return os.path.normpath(args.get("file_path", ".")), True
+    if name == "write_files":
+        # the deepest directory holding every file of the transaction
+        paths = [os.path.normpath(path) for path in written_paths(function_call_part)]
+        try:
+            return os.path.commonpath(paths) or ".", True
+        except ValueError:
+            return ".", True
+    if name in ("run_python_file", "run_tests", "checkpoint", "rollback"):
+        return ".", True
+    return None, False
+
+
+def _paths_overlap(path, other_path):
+    if path is None or other_path is None:
+        return False
+    if path == "." or other_path == ".":
+        return True
+    return (
+        path == other_path
+        or path.startswith(other_path + os.sep)
+        or other_path.startswith(path + os.sep)
+    )
+
+
+def _print_call(function_call_part, verbose):
     if verbose:
         print(f"Calling function: {function_call_part.name}({function_call_part.args})")
     else:
         print(f" - Calling function: {function_call_part.name}")
 
-    # based on function_call_part call the actual function
-    function_map = {
-        "get_files_info": get_files_info,
-        "get_file_content": get_file_content,
-        "run_python_file": run_python_file,
-        "write_file": write_file,
-    }
-
-    if function_call_part.name in function_map:
-        call_actual_function = function_map[function_call_part.name]
-        function_call_part.args["working_directory"] = WORKING_DIR
-        output = call_actual_function(**function_call_part.args)
-
-        return types.Content(
-            role="tool",
-            parts=[
-                types.Part.from_function_response(
-                    name=function_call_part.name,
-                    response={
-                        "result": output
-                    },
-                )
-            ],
-        )
-    else:
-        return types.Content(
-            role="tool",
-            parts=[
-                types.Part.from_function_response(
-                    name=function_call_part.name,
-                    response={
-                        "error": f"Unknown function: {function_call_part.name}"
-                    },
-                )
-            ],
-        )
+
+def _function_response(name, output):
+    from google.genai import types
+
+    return types.Content(
+        role="tool",
+        parts=[
+            types.Part.from_function_response(
+                name=name,
+                response={
+                    "result": output
+                },
+            )
+        ],
+    )
+
+
+def _unknown_function_response(name):
+    from google.genai import types
+
+    return types.Content(
+        role="tool",
+        parts=[
+            types.Part.from_function_response(
+                name=name,
+                response={
+                    "error": f"Unknown function: {name}"
+                },
+            )
+        ],
+    )
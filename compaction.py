@@ -0,0 +1,153 @@
+import json
+import os
+
+from config import CONTEXT_TOKEN_BUDGET, KEEP_RECENT_MESSAGES, COMPACTED_RESULT_CHARS
+
+
+# rough chars-per-token ratio; close enough to decide when to compact
+CHARS_PER_TOKEN = 4
+
+# tools whose result is a file's content, stale once the file is rewritten
+FILE_READS = {"get_file_content", "get_file_outline", "get_symbol"}
+
+
+def estimate_tokens(messages):
+    return sum(_content_chars(content) for content in messages) // CHARS_PER_TOKEN
+
+
+def compact_messages(messages, token_budget=CONTEXT_TOKEN_BUDGET, keep_recent=KEEP_RECENT_MESSAGES):
+    """Return a copy of the history that fits the token budget, plus tokens saved.
+
+    File reads made obsolete by a later write or edit are always replaced with a stub.
+    If the history is still over budget, old tool results and written file
+    contents are cut down to a short digest, oldest first. The first user
+    prompt and the last `keep_recent` messages are never touched, and the
+    original `messages` list is left as is.
+    """
+    before = estimate_tokens(messages)
+    compacted = _drop_stale_reads(messages)
+
+    chars = sum(_content_chars(content) for content in compacted)
+    protected_from = max(1, len(compacted) - keep_recent)
+    for index in range(1, protected_from):
+        if chars // CHARS_PER_TOKEN <= token_budget:
+            break
+        digest = _digest_content(compacted[index])
+        chars -= _content_chars(compacted[index]) - _content_chars(digest)
+        compacted[index] = digest
+
+    return compacted, before - chars // CHARS_PER_TOKEN
+
+
+def _drop_stale_reads(messages):
+    # pair each function response with the call that produced it: the model's
+    # calls and our responses sit in consecutive messages, in the same order
+    calls_by_message = {}
+    for index, content in enumerate(messages[:-1]):
+        calls = [part.function_call for part in content.parts or [] if part.function_call]
+        if calls:
+            calls_by_message[index + 1] = calls
+
+    # the last (message, call) position each path was written at
+    last_write = {}
+    for index, calls in calls_by_message.items():
+        for position, function_call in enumerate(calls):
+            if function_call.name in ("write_file", "edit_file"):
+                last_write[_call_path(function_call)] = (index, position)
+            elif function_call.name == "write_files":
+                for entry in (function_call.args or {}).get("files") or []:
+                    if isinstance(entry, dict):
+                        last_write[os.path.normpath(entry.get("file_path") or ".")] = (index, position)
+
+    compacted = list(messages)
+    for index, calls in calls_by_message.items():
+        content = messages[index]
+        parts = list(content.parts or [])
+        changed = False
+        for position, (part, function_call) in enumerate(zip(parts, calls)):
+            if not part.function_response or function_call.name not in FILE_READS:
+                continue
+            path = _call_path(function_call)
+            if last_write.get(path, (-1, -1)) > (index, position):
+                parts[position] = _result_part(
+                    part, f'[read of "{path}" dropped: the file was changed later]'
+                )
+                changed = True
+        if changed:
+            compacted[index] = content.model_copy(update={"parts": parts})
+    return compacted
+
+
+def _digest_content(content):
+    parts = []
+    changed = False
+    for part in content.parts or []:
+        if part.function_response:
+            text = _response_text(part.function_response.response)
+            if len(text) > COMPACTED_RESULT_CHARS:
+                part = _result_part(part, _digest(text))
+                changed = True
+        elif part.function_call and part.function_call.name == "write_file":
+            args = dict(part.function_call.args or {})
+            written = args.get("content") or ""
+            if len(written) > COMPACTED_RESULT_CHARS:
+                args["content"] = f"[{len(written)} characters written, elided from history]"
+                function_call = part.function_call.model_copy(update={"args": args})
+                part = part.model_copy(update={"function_call": function_call})
+                changed = True
+        elif part.function_call and part.function_call.name == "write_files":
+            args = dict(part.function_call.args or {})
+            files = [entry for entry in args.get("files") or [] if isinstance(entry, dict)]
+            if sum(len(entry.get("content") or "") for entry in files) > COMPACTED_RESULT_CHARS:
+                args["files"] = [
+                    {**entry, "content": f"[{len(entry.get('content') or '')} characters written, elided from history]"}
+                    for entry in files
+                ]
+                function_call = part.function_call.model_copy(update={"args": args})
+                part = part.model_copy(update={"function_call": function_call})
+                changed = True
+        elif part.function_call and part.function_call.name == "edit_file":
+            args = dict(part.function_call.args or {})
+            changes = json.dumps({"edits": args.pop("edits", None), "diff": args.pop("diff", None)}, default=str)
+            if len(changes) > COMPACTED_RESULT_CHARS:
+                args["edits"] = f"[{len(changes)} characters of edits, elided from history]"
+                function_call = part.function_call.model_copy(update={"args": args})
+                part = part.model_copy(update={"function_call": function_call})
+                changed = True
+        parts.append(part)
+
+    if not changed:
+        return content
+    return content.model_copy(update={"parts": parts})
+
+
+def _digest(text):
+    head = text[:COMPACTED_RESULT_CHARS]
+    return f"{head}[... {len(text) - len(head)} characters elided from an old tool result; call the tool again for the full output]"
+
+
+def _result_part(part, result):
+    function_response = part.function_response.model_copy(update={"response": {"result": result}})
+    return part.model_copy(update={"function_response": function_response})
+
+
+def _response_text(response):
+    if response and set(response) == {"result"} and isinstance(response["result"], str):
+        return response["result"]
+    return json.dumps(response, default=str)
+
+
+def _call_path(function_call):
+    return os.path.normpath((function_call.args or {}).get("file_path", "."))
+
+
+def _content_chars(content):
+    chars = 0
+    for part in content.parts or []:
+        if part.text:
+            chars += len(part.text)
+        if part.function_call:
+            chars += len(json.dumps(part.function_call.args or {}, default=str))
+        if part.function_response:
+            chars += len(_response_text(part.function_response.response))
+    return chars
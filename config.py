@@ -1,3 +1,46 @@
 MAX_CHARS = 10000
 WORKING_DIR = "./calculator"
+MODEL = "gemini-2.5-flash"
+MODEL_ROUTING = False
+FAST_MODEL = "gemini-2.5-flash-lite"
+STRONG_MODEL = "gemini-2.5-pro"
+ROUTING_HISTORY_TOKENS = 20000
+ROUTING_RECHECK_FINAL = True
 MAX_ITERATIONS = 20
+SAVE_SESSIONS = True
+SESSION_DIR = ".sessions"
+SESSION_BLOB_MIN_CHARS = 1000
+MAX_TOOL_WORKERS = 4
+RUN_TIMEOUT = 30
+RUN_TESTS_WORKERS = 4
+WRITE_FSYNC = False
+CHECKPOINT_DIR = None
+MAX_CHECKPOINTS = 10
+CONTEXT_TOKEN_BUDGET = 32000
+KEEP_RECENT_MESSAGES = 4
+COMPACTED_RESULT_CHARS = 300
+TOOL_CACHE_MAX_ENTRIES = 256
+TOOL_CACHE_MAX_CHARS = 2_000_000
+TOOL_CACHE_RUNS = False
+LISTING_PAGE_SIZE = 500
+PREFETCH_MODE = "off"
+PREFETCH_MAX_FILES = 6
+PREFETCH_MAX_FILE_BYTES = 20_000
+PREFETCH_BUFFER_BYTES = 1_000_000
+PREFETCH_PREVIEW_LINES = 15
+SEARCH_MAX_RESULTS = 50
+SEARCH_MAX_FILE_BYTES = 1_000_000
+PYTHON_WORKER_POOL = False
+PYTHON_WORKER_PRELOAD = ["unittest", "json", "re", "collections", "dataclasses", "typing"]
+RUN_OUTPUT_MAX_BYTES = 10_000_000
+RUN_OUTPUT_HEAD_BYTES = 4000
+RUN_OUTPUT_TAIL_BYTES = 4000
+RUN_CPU_LIMIT_SECONDS = None
+RUN_MEMORY_LIMIT_MB = None
+BATCH_CONCURRENCY = 8
+MODEL_REQUESTS_PER_MINUTE = 1000
+MODEL_TOKENS_PER_MINUTE = 1_000_000
+MODEL_MAX_CONCURRENCY = 16
+MODEL_MAX_RETRIES = 6
+MODEL_RETRY_BASE_DELAY = 1.0
+MODEL_RETRY_MAX_DELAY = 60.0
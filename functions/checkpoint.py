@@ -0,0 +1,260 @@
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from config import CHECKPOINT_DIR, MAX_CHECKPOINTS
+from functions.get_files_info import CHECKPOINT_STORE, DEFAULT_EXCLUDES, gitignore_patterns, is_excluded
+from google.genai import types
+
+
+class Checkpoints:
+    """The checkpoints of one working directory, oldest first.
+
+    Taking a checkpoint hard-links every file into a store in the working
+    directory's .checkpoints directory, which the tools never list, search or
+    checkpoint, so no file is copied: the tools replace a file by
+    renaming a new one over it, which leaves the linked original as it was.
+    Files are only copied where links are not possible. A rollback puts back
+    the files that changed, removes the ones created since and restores the
+    deleted ones, leaving unchanged files alone.
+    """
+
+    def __init__(self, absolute_working_dir):
+        self.absolute_working_dir = absolute_working_dir
+        self.store = None
+        self.saved = []  # (name, store dir, {path: (mtime_ns, size, linked)}, directories)
+        self.taken = 0
+        self.lock = threading.Lock()
+
+    def take(self, name):
+        if self.store is None:
+            # by default inside the working directory, so nothing is written
+            # outside it and the files are on the same filesystem to link them
+            store_parent = CHECKPOINT_DIR or os.path.join(self.absolute_working_dir, CHECKPOINT_STORE)
+            os.makedirs(store_parent, exist_ok=True)
+            self.store = tempfile.mkdtemp(
+                prefix=f"{os.path.basename(self.absolute_working_dir)}-checkpoints-", dir=store_parent
+            )
+        self.taken += 1
+        name = name or f"checkpoint-{self.taken}"
+        self._discard([entry for entry in self.saved if entry[0] == name])
+
+        store_dir = os.path.join(self.store, str(self.taken))
+        files, directories = self.snapshot()
+        saved = {}
+        made = set()
+        for path, source in files.items():
+            target = os.path.join(store_dir, path)
+            if os.path.dirname(target) not in made:
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                made.add(os.path.dirname(target))
+            try:
+                linked = _link_or_copy(source, target)
+                stat = os.stat(target)
+            except OSError:
+                continue  # removed while walking
+            saved[path] = (stat.st_mtime_ns, stat.st_size, linked)
+        self.saved.append((name, store_dir, saved, directories))
+        self._discard(self.saved[:-MAX_CHECKPOINTS])
+        return name, saved
+
+    def rollback(self, name):
+        # (restored, removed, lost) paths; later checkpoints are dropped
+        index = next(i for i in range(len(self.saved) - 1, -1, -1) if name is None or self.saved[i][0] == name)
+        _, store_dir, saved, saved_directories = self.saved[index]
+        files, directories = self.snapshot()
+
+        removed = sorted(path for path in files if path not in saved)
+        for path in removed:
+            os.unlink(os.path.join(self.absolute_working_dir, path))
+
+        restored, lost = [], []
+        for path, (mtime_ns, size, linked) in sorted(saved.items()):
+            current = os.path.join(self.absolute_working_dir, path)
+            stored = os.path.join(store_dir, path)
+            try:
+                stored_stat = os.stat(stored)
+            except OSError:
+                lost.append(path)
+                continue
+            if (stored_stat.st_mtime_ns, stored_stat.st_size) != (mtime_ns, size):
+                # a script wrote into the file in place, and so into the linked copy too
+                lost.append(path)
+                continue
+            if path in files and _unchanged(current, stored_stat, linked):
+                continue
+            os.makedirs(os.path.dirname(current), exist_ok=True)
+            temp_path = os.path.join(os.path.dirname(current), f".restore-{uuid.uuid4().hex}.tmp")
+            _link_or_copy(stored, temp_path)
+            os.replace(temp_path, current)
+            restored.append(path)
+
+        # directories created since, deepest first, if nothing else is left in them
+        for directory in sorted(directories - saved_directories, key=lambda path: path.count(os.sep), reverse=True):
+            try:
+                os.rmdir(os.path.join(self.absolute_working_dir, directory))
+            except OSError:
+                pass
+
+        self._discard(self.saved[index + 1:])
+        return restored, removed, lost
+
+    def names(self):
+        return [entry[0] for entry in self.saved]
+
+    def snapshot(self):
+        # the files and directories a checkpoint covers
+        patterns = DEFAULT_EXCLUDES + gitignore_patterns(self.absolute_working_dir)
+        files, directories = {}, set()
+        for dirpath, dirnames, filenames in os.walk(self.absolute_working_dir):
+            relative_dir = os.path.relpath(dirpath, self.absolute_working_dir)
+            prefix = "" if relative_dir == "." else relative_dir + os.sep
+            dirnames[:] = [
+                name for name in dirnames
+                if not is_excluded(name, prefix + name, patterns) and os.path.join(dirpath, name) != self.store
+            ]
+            directories.update(prefix + name for name in dirnames)
+            for name in filenames:
+                if not is_excluded(name, prefix + name, patterns):
+                    files[prefix + name] = os.path.join(dirpath, name)
+        return files, directories
+
+    def drop(self):
+        if self.store is not None:
+            shutil.rmtree(self.store, ignore_errors=True)
+            try:
+                os.rmdir(os.path.join(self.absolute_working_dir, CHECKPOINT_STORE))
+            except OSError:
+                pass  # not there, or another process's store is still in it
+        self.store = None
+        self.saved = []
+
+    def _discard(self, entries):
+        for entry in entries:
+            self.saved.remove(entry)
+            shutil.rmtree(entry[1], ignore_errors=True)
+
+
+# absolute working directory -> Checkpoints
+_checkpoints = {}
+_checkpoints_lock = threading.Lock()
+
+
+def drop_checkpoints(working_directory):
+    # removes the checkpoint store of a working directory that is going away
+    with _checkpoints_lock:
+        checkpoints = _checkpoints.pop(os.path.abspath(working_directory), None)
+    if checkpoints is not None:
+        with checkpoints.lock:
+            checkpoints.drop()
+
+
+@atexit.register
+def _drop_all_checkpoints():
+    for working_directory in list(_checkpoints):
+        drop_checkpoints(working_directory)
+
+
+def checkpoint(working_directory, name=None):
+    absolute_working_dir = os.path.abspath(working_directory)
+    if not os.path.isdir(absolute_working_dir):
+        return f'Error: "{working_directory}" is not a directory'
+
+    with _checkpoints_lock:
+        checkpoints = _checkpoints.setdefault(absolute_working_dir, Checkpoints(absolute_working_dir))
+    try:
+        with checkpoints.lock:
+            start = time.perf_counter()
+            name, saved = checkpoints.take(name)
+            elapsed = time.perf_counter() - start
+    except Exception as e:
+        return f"Error: creating checkpoint: {e}"
+
+    copied = sum(1 for _, _, linked in saved.values() if not linked)
+    how = f", {copied} copied" if copied else ""
+    return (
+        f'Created checkpoint "{name}" of {len(saved)} file(s){how} in {elapsed:.3f}s; '
+        f'rollback undoes every change made after it'
+    )
+
+
+def rollback(working_directory, name=None):
+    absolute_working_dir = os.path.abspath(working_directory)
+    with _checkpoints_lock:
+        checkpoints = _checkpoints.get(absolute_working_dir)
+    if checkpoints is None or not checkpoints.saved:
+        return "Error: No checkpoint to roll back to; create one with checkpoint first"
+
+    try:
+        with checkpoints.lock:
+            if name is not None and name not in checkpoints.names():
+                return f'Error: No checkpoint "{name}"; checkpoints: {", ".join(checkpoints.names())}'
+            name = name or checkpoints.names()[-1]
+            restored, removed, lost = checkpoints.rollback(name)
+    except Exception as e:
+        return f'Error: rolling back to checkpoint "{name}": {e}'
+
+    if not (restored or removed or lost):
+        return f'Rolled back to checkpoint "{name}": nothing had changed'
+    lines = [f'Rolled back to checkpoint "{name}": restored {len(restored)} file(s), removed {len(removed)} file(s) created since']
+    if restored:
+        lines.append(f"- restored: {', '.join(restored)}")
+    if removed:
+        lines.append(f"- removed: {', '.join(removed)}")
+    if lost:
+        lines.append(f"- could not restore (changed in place after the checkpoint): {', '.join(lost)}")
+    return "\n".join(lines)
+
+
+def _link_or_copy(source, target):
+    # True when hard-linked, False when copied
+    try:
+        os.link(source, target)
+        return True
+    except OSError:
+        shutil.copy2(source, target)
+        return False
+
+
+def _unchanged(current, stored_stat, linked):
+    try:
+        stat = os.stat(current)
+    except OSError:
+        return False
+    if linked:
+        return os.path.samestat(stat, stored_stat)
+    return (stat.st_mtime_ns, stat.st_size) == (stored_stat.st_mtime_ns, stored_stat.st_size)
+
+
+schema_checkpoint = types.FunctionDeclaration(
+    name="checkpoint",
+    description="Saves the state of every file in the working directory under a name, cheaply and without reading the files. Take one before a risky multi-file change so a failed attempt can be undone with rollback.",
+    parameters=types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            "name": types.Schema(
+                type=types.Type.STRING,
+                description="Optional name for the checkpoint. Defaults to a numbered one.",
+                nullable=True,
+            ),
+        },
+    ),
+)
+
+schema_rollback = types.FunctionDeclaration(
+    name="rollback",
+    description="Puts the working directory back the way it was at a checkpoint: changed and deleted files are restored and files created since are removed. Checkpoints taken after it are dropped; it can be rolled back to again.",
+    parameters=types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            "name": types.Schema(
+                type=types.Type.STRING,
+                description="The checkpoint to roll back to. Defaults to the latest one.",
+                nullable=True,
+            ),
+        },
+    ),
+)
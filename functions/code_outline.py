@@ -0,0 +1,232 @@
+import ast
+import io
+import os
+import threading
+from config import MAX_CHARS
+from google.genai import types
+
+
+MAX_PARSED_FILES = 64
+# longest constant value shown in an outline
+VALUE_CHARS = 60
+
+# absolute path -> (mtime_ns, size, lines, symbols); parsing is the expensive part
+_parsed = {}
+_parsed_lock = threading.Lock()
+
+
+def get_file_outline(working_directory, file_path, symbol=None):
+    parsed = _parse(working_directory, file_path, "outline")
+    if isinstance(parsed, str):
+        return parsed
+    lines, symbols = parsed
+
+    where = f'"{file_path}"'
+    if symbol:
+        # the members of one class
+        members = [entry for entry in symbols if entry[0].startswith(symbol + ".")]
+        if not members:
+            return f'Error: No class "{symbol}" with members in "{file_path}"'
+        depth = members[0][3]
+        symbols = [(qualname, start, end, member_depth - depth, *rest) for qualname, start, end, member_depth, *rest in members]
+        where = f'"{symbol}" in "{file_path}"'
+    header = f"[Outline of {where}: {len(lines)} lines, {len(symbols)} definitions"
+
+    # a big module is outlined with less detail rather than cut off: first
+    # without docstrings, then with class members listed by name only
+    text = header + "]\n" + _outline_lines(symbols, docstrings=True)
+    if len(text) > MAX_CHARS:
+        text = header + "; docstrings left out]\n" + _outline_lines(symbols, docstrings=False)
+    if len(text) > MAX_CHARS:
+        text = (
+            header + "; class members by name only, outline a class with symbol for its signatures]\n"
+            + _outline_lines(symbols, docstrings=False, members=False)
+        )
+    if len(text) > MAX_CHARS:
+        text = text[:MAX_CHARS] + f"[...Outline truncated at {MAX_CHARS} characters]"
+    return text
+
+
+def get_symbol(working_directory, file_path, symbol):
+    parsed = _parse(working_directory, file_path, "read symbols of")
+    if isinstance(parsed, str):
+        return parsed
+    lines, symbols = parsed
+
+    # a qualified name ("Class.method") first, then a bare name anywhere in the file
+    matches = [entry for entry in symbols if entry[0] == symbol]
+    if not matches:
+        matches = [entry for entry in symbols if entry[0].rsplit(".", 1)[-1] == symbol]
+    if not matches:
+        top_level = ", ".join(entry[0] for entry in symbols if entry[3] == 0)
+        return f'Error: No symbol "{symbol}" in "{file_path}"; it defines: {top_level or "nothing"}'
+    qualnames = list(dict.fromkeys(entry[0] for entry in matches))
+    if len(qualnames) > 1:
+        return f'Error: "{symbol}" is ambiguous in "{file_path}": {", ".join(qualnames)}; use the qualified name'
+
+    # one name can be defined more than once, e.g. in both branches of an if
+    definitions = []
+    for qualname, start, end, *_ in matches:
+        source = "".join(lines[start - 1:end])
+        definitions.append(f'[Symbol "{qualname}" in "{file_path}": lines {start}-{end} of {len(lines)}]\n{source}')
+    text = "".join(definitions)
+    if len(text) > MAX_CHARS:
+        text = text[:MAX_CHARS] + f"[...Symbol truncated at {MAX_CHARS} characters]"
+    return text
+
+
+def _outline_lines(symbols, docstrings, members=True):
+    # one line per definition: line range, indented signature, docstring
+    member_names = {}
+    for qualname, *_ in symbols:
+        parent, _, name = qualname.rpartition(".")
+        if parent:
+            member_names.setdefault(parent, []).append(name)
+
+    entries = []
+    for qualname, start, end, depth, signature, doc in symbols:
+        if depth and not members:
+            continue
+        line_range = f"{start}" if start == end else f"{start}-{end}"
+        entry = f"{line_range:>9}  {'    ' * depth}{signature}"
+        if not members and qualname in member_names:
+            entry += f": {', '.join(member_names[qualname])}"
+        if doc and docstrings:
+            entry += f"  # {doc}"
+        entries.append(entry)
+    return "\n".join(entries)
+
+
+def forget_outline(working_directory, file_path):
+    # a write through the tools replaced the file; parse it again on the next request
+    absolute_path = os.path.abspath(os.path.join(working_directory, file_path))
+    with _parsed_lock:
+        _parsed.pop(absolute_path, None)
+
+
+def _parse(working_directory, file_path, action):
+    # (lines, symbols) for a Python file in the working directory, or an error string
+    relative_path = os.path.join(working_directory, file_path)
+    target_absolute_file_path = os.path.abspath(relative_path)
+
+    # check if file_path is within bounds
+    absolute_working_dir = os.path.abspath(working_directory)
+    common_path = os.path.commonpath([absolute_working_dir, target_absolute_file_path])
+    if common_path != absolute_working_dir:
+        return f'Error: Cannot {action} "{file_path}" as it is outside the permitted working directory'
+
+    if not os.path.isfile(target_absolute_file_path):
+        return f'Error: File not found or is not a regular file: "{file_path}"'
+    if not file_path.endswith(".py"):
+        return f'Error: Cannot {action} "{file_path}": only Python files are supported; use get_file_content'
+
+    try:
+        stat = os.stat(target_absolute_file_path)
+        with _parsed_lock:
+            cached = _parsed.get(target_absolute_file_path)
+        if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+            return cached[2:]
+
+        with open(target_absolute_file_path, "r", encoding="utf-8", errors="replace") as f:
+            source = f.read()
+        try:
+            tree = ast.parse(source, filename=file_path)
+        except SyntaxError as e:
+            return f'Error: Cannot parse "{file_path}": {e.msg} (line {e.lineno})'
+        # only the line breaks ast counts; str.splitlines also splits on \f, \x1c-\x1e, \x85 and U+2028
+        lines = io.StringIO(source, newline=None).readlines()
+        symbols = list(_symbols(tree.body))
+
+        with _parsed_lock:
+            if target_absolute_file_path not in _parsed and len(_parsed) >= MAX_PARSED_FILES:
+                _parsed.pop(next(iter(_parsed)))
+            _parsed[target_absolute_file_path] = (stat.st_mtime_ns, stat.st_size, lines, symbols)
+        return lines, symbols
+    except Exception as e:
+        return f'Error reading file "{file_path}": {e}'
+
+
+def _symbols(body, prefix="", depth=0):
+    # (qualified name, first line, last line, depth, signature, first docstring line)
+    # for the classes, functions and assignments of a module or class body,
+    # including those under an if or try at that level; functions nested in
+    # functions are implementation details and left out
+    for node in body:
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            qualname = prefix + node.name
+            start = node.decorator_list[0].lineno if node.decorator_list else node.lineno
+            yield qualname, start, node.end_lineno, depth, _signature(node), _first_doc_line(node)
+            if isinstance(node, ast.ClassDef):
+                yield from _symbols(node.body, qualname + ".", depth + 1)
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            names = [target.id for target in targets if isinstance(target, ast.Name)]
+            if not names:
+                continue
+            value = ast.unparse(node.value) if node.value is not None else ""
+            if len(value) > VALUE_CHARS:
+                value = value[:VALUE_CHARS] + "..."
+            annotation = f": {ast.unparse(node.annotation)}" if isinstance(node, ast.AnnAssign) else ""
+            signature = f"{' = '.join(names)}{annotation}{f' = {value}' if value else ''}"
+            for name in names:
+                yield prefix + name, node.lineno, node.end_lineno, depth, signature, None
+        elif isinstance(node, ast.If):
+            yield from _symbols(node.body + node.orelse, prefix, depth)
+        elif isinstance(node, ast.Try):
+            handlers = [statement for handler in node.handlers for statement in handler.body]
+            yield from _symbols(node.body + handlers + node.orelse + node.finalbody, prefix, depth)
+
+
+def _signature(node):
+    decorators = "".join(f"@{ast.unparse(decorator)} " for decorator in node.decorator_list)
+    if isinstance(node, ast.ClassDef):
+        bases = [ast.unparse(base) for base in node.bases] + [ast.unparse(keyword) for keyword in node.keywords]
+        return f"{decorators}class {node.name}" + (f"({', '.join(bases)})" if bases else "")
+    keyword = "async def" if isinstance(node, ast.AsyncFunctionDef) else "def"
+    returns = f" -> {ast.unparse(node.returns)}" if node.returns else ""
+    return f"{decorators}{keyword} {node.name}({ast.unparse(node.args)}){returns}"
+
+
+def _first_doc_line(node):
+    doc = ast.get_docstring(node)
+    return doc.strip().splitlines()[0] if doc and doc.strip() else None
+
+
+schema_get_file_outline = types.FunctionDeclaration(
+    name="get_file_outline",
+    description="Lists the classes, functions (with their signatures), methods and module-level assignments of a Python file with their line ranges and the first line of each docstring, without the code. Much smaller than reading the file; use it to find what to read, then get_symbol or a line range of get_file_content. Large modules are outlined with less detail.",
+    parameters=types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            "file_path": types.Schema(
+                type=types.Type.STRING,
+                description="The path to the Python file, relative to the working directory.",
+            ),
+            "symbol": types.Schema(
+                type=types.Type.STRING,
+                description="Optional class to outline on its own, with the signatures of all its members. Useful when the outline of a large module lists class members by name only.",
+                nullable=True,
+            ),
+        },
+        required=["file_path"]
+    ),
+)
+
+schema_get_symbol = types.FunctionDeclaration(
+    name="get_symbol",
+    description="Returns the source of one class, function, method or module-level assignment of a Python file, including its decorators, with its line range.",
+    parameters=types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            "file_path": types.Schema(
+                type=types.Type.STRING,
+                description="The path to the Python file, relative to the working directory.",
+            ),
+            "symbol": types.Schema(
+                type=types.Type.STRING,
+                description='The name to look up: "function", "Class" or a qualified "Class.method". A bare name must be unique in the file.',
+            ),
+        },
+        required=["file_path", "symbol"]
+    ),
+)
@@ -0,0 +1,237 @@
+import os
+import re
+from functions.write_file import replace_file
+from google.genai import types
+
+
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+\d+(?:,\d+)? @@")
+
+
+class EditError(Exception):
+    pass
+
+
+def edit_file(working_directory, file_path, edits=None, diff=None):
+    relative_path = os.path.join(working_directory, file_path)
+    target_absolute_file_path = os.path.abspath(relative_path)
+
+    # check if file_path is within bounds
+    absolute_working_dir = os.path.abspath(working_directory)
+    common_path = os.path.commonpath([absolute_working_dir, target_absolute_file_path])
+    is_within_bounds = common_path == absolute_working_dir
+
+    if not is_within_bounds:
+        return f'Error: Cannot edit "{file_path}" as it is outside the permitted working directory'
+
+    if not os.path.isfile(target_absolute_file_path):
+        return f'Error: File not found or is not a regular file: "{file_path}"'
+
+    if bool(edits) == bool(diff):
+        return "Error: Provide either edits or a diff"
+
+    try:
+        with open(target_absolute_file_path, "r", encoding="utf-8", newline="") as f:
+            text = f.read()
+    except UnicodeDecodeError:
+        return f'Error: "{file_path}" is not a UTF-8 text file'
+    except Exception as e:
+        return f'Error reading file "{file_path}": {e}'
+
+    # everything is applied in memory first, so a failing hunk leaves the file untouched
+    newline = "\r\n" if "\r\n" in text else "\n"
+    try:
+        if edits:
+            text, changes = _apply_edits(text, edits, newline)
+        else:
+            text, changes = _apply_diff(text, diff, newline)
+    except EditError as e:
+        return f'Error: {e}; "{file_path}" was not changed'
+
+    try:
+        replace_file(target_absolute_file_path, text, newline="")
+    except Exception as e:
+        return f"Error: writing to file: {e}"
+
+    return _summary(file_path, changes, _line_count(text, newline))
+
+
+def _apply_edits(text, edits, newline):
+    # each search must match exactly once in the text as edited so far
+    changes = []
+    for number, edit in enumerate(edits, start=1):
+        search = (edit.get("search") or "").replace("\r\n", "\n")
+        replace = (edit.get("replace") or "").replace("\r\n", "\n")
+        if not search:
+            raise EditError(f"edit {number} has an empty search text")
+        search = search.replace("\n", newline)
+        replace = replace.replace("\n", newline)
+
+        count = text.count(search)
+        if count == 0:
+            raise EditError(f"edit {number} search text not found{_closest_line(text, search, newline)}")
+        if count > 1:
+            raise EditError(f"edit {number} search text matches {count} places; include more surrounding lines to make it unique")
+
+        position = text.index(search)
+        start_line = text.count(newline, 0, position) + 1
+        text = text[:position] + replace + text[position + len(search):]
+        changes.append(_changed_lines(start_line, search.split(newline), replace.split(newline)))
+    return text, changes
+
+
+def _apply_diff(text, diff, newline):
+    lines = text.split(newline)
+    changes = []
+    shift = 0  # how far earlier hunks moved the lines after them
+    for number, (hint, old, new) in enumerate(_parse_diff(diff), start=1):
+        if not old:
+            if hint is None:
+                raise EditError(f"hunk {number} has no context lines and no line number")
+            position = min(hint + shift, len(lines))
+        else:
+            matches = _find_block(lines, old)
+            if not matches:
+                raise EditError(f"hunk {number} does not match the file{_closest_line(newline.join(lines), newline.join(old), newline)}")
+            if hint is None:
+                if len(matches) > 1:
+                    raise EditError(f"hunk {number} matches {len(matches)} places; add a line number to its @@ header or more context")
+                position = matches[0]
+            else:
+                # like patch, allow the hunk to have moved; take the nearest match
+                position = min(matches, key=lambda match: abs(match - (hint + shift)))
+
+        lines[position:position + len(old)] = new
+        shift += len(new) - len(old)
+        changes.append(_changed_lines(position + 1, old, new))
+    return newline.join(lines), changes
+
+
+def _parse_diff(diff):
+    # yields (0-based line hint or None, old lines, new lines) per hunk; file
+    # headers are skipped and @@ headers may leave out the line numbers
+    hunks = []
+    hunk = None
+    lines = diff.replace("\r\n", "\n").split("\n")
+    for index, line in enumerate(lines):
+        if line.startswith("@@"):
+            match = HUNK_HEADER.match(line)
+            hint = None
+            if match:
+                # "-5,0" inserts after line 5; otherwise the hunk starts at line 5
+                start = int(match.group(1))
+                hint = start if match.group(2) == "0" else max(start - 1, 0)
+            hunk = (hint, [], [])
+            hunks.append(hunk)
+        elif hunk is None or line.startswith("\\"):
+            continue  # headers before the first hunk, "\ No newline at end of file"
+        elif line.startswith("diff ") or (line.startswith("--- ") and _next_line(lines, index).startswith("+++ ")):
+            raise EditError("the diff touches more than one file; send one diff per file")
+        elif line.startswith("-"):
+            hunk[1].append(line[1:])
+        elif line.startswith("+"):
+            hunk[2].append(line[1:])
+        else:
+            # context; a bare empty line is an empty context line
+            hunk[1].append(line[1:])
+            hunk[2].append(line[1:])
+
+    if not hunks:
+        raise EditError("the diff has no @@ hunks")
+
+    for _, old, new in hunks:
+        # trailing blank context is usually an artifact of how the diff was quoted
+        while old and new and old[-1] == "" and new[-1] == "":
+            old.pop()
+            new.pop()
+    return hunks
+
+
+def _next_line(lines, index):
+    return lines[index + 1] if index + 1 < len(lines) else ""
+
+
+def _find_block(lines, block):
+    return [
+        index
+        for index in range(len(lines) - len(block) + 1)
+        if lines[index] == block[0] and lines[index:index + len(block)] == block
+    ]
+
+
+def _closest_line(text, search, newline):
+    # points at the likely spot when only whitespace or later lines differ
+    first = next((line.strip() for line in search.split(newline) if line.strip()), None)
+    if first is None:
+        return ""
+    for number, line in enumerate(text.split(newline), start=1):
+        if line.strip() == first:
+            return f" (its first line is similar to line {number}; check whitespace and the lines after it)"
+    return ""
+
+
+def _changed_lines(start_line, old, new):
+    # (first changed line, lines removed, lines added), leaving out unchanged context
+    prefix = 0
+    while prefix < min(len(old), len(new)) and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < min(len(old), len(new)) - prefix and old[-1 - suffix] == new[-1 - suffix]:
+        suffix += 1
+    return start_line + prefix, len(old) - prefix - suffix, len(new) - prefix - suffix
+
+
+def _line_count(text, newline):
+    if not text:
+        return 0
+    return text.count(newline) + (0 if text.endswith(newline) else 1)
+
+
+def _summary(file_path, changes, total_lines):
+    removed = sum(old for _, old, _ in changes)
+    added = sum(new for _, _, new in changes)
+    lines = [f'Successfully edited "{file_path}": {len(changes)} hunk(s), -{removed} +{added} lines, {total_lines} lines total']
+    for start_line, old, new in changes:
+        end_line = start_line + max(new, 1) - 1
+        where = f"line {start_line}" if end_line == start_line else f"lines {start_line}-{end_line}"
+        lines.append(f"- {where}: -{old} +{new}")
+    return "\n".join(lines)
+
+
+schema_edit_file = types.FunctionDeclaration(
+    name="edit_file",
+    description="Changes part of an existing file with search/replace edits or a unified diff, instead of rewriting the whole file with write_file. All changes are applied together or not at all; the call fails if any search text or hunk does not match. Returns which lines changed.",
+    parameters=types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            "file_path": types.Schema(
+                type=types.Type.STRING,
+                description="The path to the file to edit, relative to the working directory. Must be within the permitted working directory bounds.",
+            ),
+            "edits": types.Schema(
+                type=types.Type.ARRAY,
+                items=types.Schema(
+                    type=types.Type.OBJECT,
+                    properties={
+                        "search": types.Schema(
+                            type=types.Type.STRING,
+                            description="Exact text to find, including indentation. Must occur exactly once; include a few surrounding lines if needed.",
+                        ),
+                        "replace": types.Schema(
+                            type=types.Type.STRING,
+                            description="The text to put in its place. Empty to delete it.",
+                        ),
+                    },
+                    required=["search", "replace"],
+                ),
+                description="Search/replace edits, applied in order.",
+                nullable=True,
+            ),
+            "diff": types.Schema(
+                type=types.Type.STRING,
+                description="A unified diff for this one file, with @@ hunks of ' ' context, '-' removed and '+' added lines. Used instead of edits.",
+                nullable=True,
+            ),
+        },
+        required=["file_path"]
+    ),
+)
@@ -1,9 +1,20 @@
+import mmap
 import os
+from bisect import bisect_left
 from config import MAX_CHARS
 from google.genai import types
 
 
-def get_file_content(working_directory, file_path):
+# the line index stores how many newlines come before each chunk of this size,
+# so finding a line only scans the one chunk it is in
+INDEX_CHUNK_SIZE = 64 * 1024
+MAX_INDEXED_FILES = 32
+
+# absolute path -> (mtime_ns, size, newline counts per chunk)
+_line_indexes = {}
+
+
+def get_file_content(working_directory, file_path, offset=None, length=None, start_line=None, end_line=None):
     relative_path = os.path.join(working_directory, file_path)
     target_absolute_file_path = os.path.abspath(relative_path)
 
@@ -20,23 +31,124 @@ def get_file_content(working_directory, file_path):
     if not valid_file_path:
         return f'Error: File not found or is not a regular file: "{file_path}"'
 
+    ranged = any(value is not None for value in (offset, length, start_line, end_line))
+    if ranged:
+        try:
+            return _read_range(target_absolute_file_path, file_path, offset, length, start_line, end_line)
+        except Exception as e:
+            return f'Error reading file "{file_path}": {e}'
+
     # reading file and return its contents
     try:
         with open(target_absolute_file_path, "r", encoding="utf-8", errors="replace") as f:
             file_content_string = f.read(MAX_CHARS + 1)
 
-            if len(file_content_string) > MAX_CHARS:
-                truncated_content = file_content_string[:MAX_CHARS] + f'[...File "{file_path}" truncated at {MAX_CHARS} characters]'
-                return truncated_content
-            
-            return file_content_string
+        if len(file_content_string) > MAX_CHARS:
+            total_lines, total_bytes = _file_totals(target_absolute_file_path)
+            truncated_content = (
+                file_content_string[:MAX_CHARS]
+                + f'[...File "{file_path}" truncated at {MAX_CHARS} characters; it has {total_lines} lines, {total_bytes} bytes.'
+                + " Read more with start_line/end_line or offset/length]"
+            )
+            return truncated_content
+
+        return file_content_string
     except Exception as e:
         return f'Error reading file "{file_path}": {e}'
 
 
+def _read_range(absolute_path, file_path, offset, length, start_line, end_line):
+    if (offset is not None or length is not None) and (start_line is not None or end_line is not None):
+        return "Error: Use either offset/length or start_line/end_line, not both"
+
+    with open(absolute_path, "rb") as f:
+        stat = os.fstat(f.fileno())
+        if stat.st_size == 0:
+            return f'[File "{file_path}" is empty: 0 lines, 0 bytes]\n'
+
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            counts = _line_index(absolute_path, stat, mm)
+            total_lines = _total_lines(mm, counts)
+            total_bytes = len(mm)
+
+            if start_line is not None or end_line is not None:
+                start_line = int(start_line) if start_line is not None else 1
+                end_line = int(end_line) if end_line is not None else total_lines
+                if start_line > total_lines:
+                    return f'Error: start_line {start_line} is past the end of "{file_path}" ({total_lines} lines)'
+                if start_line < 1 or end_line < start_line:
+                    return f"Error: Invalid line range {start_line}-{end_line}"
+                start = _line_start(mm, counts, start_line)
+                end = _line_start(mm, counts, end_line + 1)
+                end_line = min(end_line, total_lines)
+                header = f'[File "{file_path}": lines {start_line}-{end_line} of {total_lines}, {total_bytes} bytes total]'
+            else:
+                start = int(offset) if offset is not None else 0
+                if start < 0:
+                    return f"Error: Invalid offset {start}"
+                if start >= total_bytes:
+                    return f'Error: offset {start} is past the end of "{file_path}" ({total_bytes} bytes)'
+                if length is not None and int(length) < 0:
+                    return f"Error: Invalid length {length}"
+                end = min(start + int(length), total_bytes) if length is not None else total_bytes
+                header = f'[File "{file_path}": bytes {start}-{end} of {total_bytes}, {total_lines} lines total]'
+
+            text = mm[start:end].decode("utf-8", errors="replace")
+
+    if len(text) > MAX_CHARS:
+        text = text[:MAX_CHARS] + f"[...Range truncated at {MAX_CHARS} characters]"
+    return f"{header}\n{text}"
+
+
+def _file_totals(absolute_path):
+    with open(absolute_path, "rb") as f:
+        stat = os.fstat(f.fileno())
+        if stat.st_size == 0:
+            return 0, 0
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            counts = _line_index(absolute_path, stat, mm)
+            return _total_lines(mm, counts), len(mm)
+
+
+def _line_index(absolute_path, stat, mm):
+    # counts[i] is the number of newlines before chunk i; the last entry is the total
+    cached = _line_indexes.get(absolute_path)
+    if cached and cached[:2] == (stat.st_mtime_ns, stat.st_size):
+        return cached[2]
+
+    counts = [0]
+    for chunk_start in range(0, len(mm), INDEX_CHUNK_SIZE):
+        counts.append(counts[-1] + mm[chunk_start:chunk_start + INDEX_CHUNK_SIZE].count(b"\n"))
+
+    if absolute_path not in _line_indexes and len(_line_indexes) >= MAX_INDEXED_FILES:
+        _line_indexes.pop(next(iter(_line_indexes)))
+    _line_indexes[absolute_path] = (stat.st_mtime_ns, stat.st_size, counts)
+    return counts
+
+
+def _total_lines(mm, counts):
+    # a last line without a trailing newline still counts
+    return counts[-1] + (0 if mm[-1:] == b"\n" else 1)
+
+
+def _line_start(mm, counts, line):
+    # byte offset where 1-based `line` starts, or the file size past the end
+    newlines_before = line - 1
+    if newlines_before <= 0:
+        return 0
+    if newlines_before > counts[-1]:
+        return len(mm)
+
+    chunk = bisect_left(counts, newlines_before) - 1
+    position = chunk * INDEX_CHUNK_SIZE
+    for _ in range(newlines_before - counts[chunk]):
+        position = mm.find(b"\n", position) + 1
+    return position
+
+
 schema_get_file_content = types.FunctionDeclaration(
     name="get_file_content",
-    description="Reads and returns the content of a specified file, constrained to the working directory. Files are truncated if they exceed the maximum character limit.",
+    description="Reads and returns the content of a specified file, constrained to the working directory. Files are truncated if they exceed the maximum character limit; use start_line/end_line or offset/length to page through large files. Ranged reads report the file's total line and byte counts.",
     parameters=types.Schema(
         type=types.Type.OBJECT,
         properties={
@@ -44,6 +156,26 @@ schema_get_file_content = types.FunctionDeclaration(
                 type=types.Type.STRING,
                 description="The path to the file to read, relative to the working directory. Must be within the permitted working directory bounds.",
             ),
+            "start_line": types.Schema(
+                type=types.Type.INTEGER,
+                description="Optional first line to read (1-based, inclusive).",
+                nullable=True,
+            ),
+            "end_line": types.Schema(
+                type=types.Type.INTEGER,
+                description="Optional last line to read (1-based, inclusive). Defaults to the end of the file.",
+                nullable=True,
+            ),
+            "offset": types.Schema(
+                type=types.Type.INTEGER,
+                description="Optional byte offset to start reading from. Cannot be combined with start_line/end_line.",
+                nullable=True,
+            ),
+            "length": types.Schema(
+                type=types.Type.INTEGER,
+                description="Optional number of bytes to read from offset. Defaults to the rest of the file.",
+                nullable=True,
+            ),
         },
         required=["file_path"]
     ),
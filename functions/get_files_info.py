@@ -1,14 +1,24 @@
+import fnmatch
 import os
+from itertools import islice
+from config import LISTING_PAGE_SIZE
 from google.genai import types
 
 
-def get_files_info(working_directory, directory="."):
+# where checkpoint stores go by default; never listed, searched or checkpointed
+CHECKPOINT_STORE = ".checkpoints"
+
+# skipped in recursive listings on top of any exclude/.gitignore patterns
+DEFAULT_EXCLUDES = [".git", "__pycache__", ".venv", CHECKPOINT_STORE]
+
+
+def get_files_info(working_directory, directory=".", recursive=False, max_depth=None, exclude=None, cursor=None):
     relative_path = os.path.join(working_directory, directory)
     absolute_path = os.path.abspath(relative_path)
 
     # check if a path within bounds
     absolute_working_dir = os.path.abspath(working_directory)
-    is_within_bounds = absolute_path.startswith(absolute_working_dir)
+    is_within_bounds = os.path.commonpath([absolute_working_dir, absolute_path]) == absolute_working_dir
 
     if not is_within_bounds:
         return f'Error: Cannot list "{directory}" as it is outside the permitted working directory'
@@ -18,15 +28,34 @@ def get_files_info(working_directory, directory="."):
     if not valid_dir:
         return f'Error: "{directory}" is not a directory'
 
+    try:
+        start = int(cursor) if cursor else 0
+    except ValueError:
+        return f'Error: Invalid cursor "{cursor}"'
+
     # show contents of the directory in a formatted manner
     try:
-        formatted_lines = []
-        contents = os.listdir(absolute_path)
-        for filename in contents:
-            full_filename_path = os.path.join(absolute_path, filename)
-            file_size = os.path.getsize(full_filename_path)
-            is_dir = os.path.isdir(full_filename_path)
-            formatted_lines.append(f"- {filename}: file_size={file_size} bytes, is_dir={is_dir}")
+        if recursive:
+            # paths relative to the working directory, so they can be passed
+            # to the other tools and matched against .gitignore path globs
+            relative_dir = os.path.relpath(absolute_path, absolute_working_dir).replace(os.sep, "/")
+            prefix = "" if relative_dir == "." else relative_dir + "/"
+            patterns = DEFAULT_EXCLUDES + gitignore_patterns(absolute_working_dir) + list(exclude or [])
+            depth = int(max_depth) if max_depth is not None else None
+            entries = _walk(absolute_path, prefix, patterns, depth)
+        else:
+            patterns = [CHECKPOINT_STORE] + list(exclude or [])
+            entries = _walk(absolute_path, "", patterns, 1)
+
+        # one extra entry tells us whether there is another page
+        page = list(islice(entries, start, start + LISTING_PAGE_SIZE + 1))
+        formatted_lines = [
+            f"- {path}: file_size={file_size} bytes, is_dir={is_dir}"
+            for path, file_size, is_dir in page[:LISTING_PAGE_SIZE]
+        ]
+        if len(page) > LISTING_PAGE_SIZE:
+            next_cursor = start + LISTING_PAGE_SIZE
+            formatted_lines.append(f'[...more entries; call again with cursor="{next_cursor}" to continue]')
 
         files_info = "\n".join(formatted_lines)
         return files_info
@@ -34,9 +63,46 @@ def get_files_info(working_directory, directory="."):
         return f"Error listing files: {e}"
 
 
+def _walk(absolute_path, prefix, patterns, depth):
+    # yields (relative path, size, is_dir) in a stable order, depth first;
+    # scandir gives the type for free and caches the stat on the entry
+    with os.scandir(absolute_path) as scanner:
+        entries = sorted(scanner, key=lambda entry: entry.name)
+
+    for entry in entries:
+        path = prefix + entry.name
+        if is_excluded(entry.name, path, patterns):
+            continue
+        is_dir = entry.is_dir()
+        yield path, entry.stat().st_size, is_dir
+        if is_dir and (depth is None or depth > 1) and not entry.is_symlink():
+            yield from _walk(entry.path, path + "/", patterns, None if depth is None else depth - 1)
+
+
+def is_excluded(name, path, patterns):
+    return any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(path, pattern) for pattern in patterns)
+
+
+def gitignore_patterns(absolute_working_dir):
+    # simple name and path globs only; negations are not supported
+    try:
+        with open(os.path.join(absolute_working_dir, ".gitignore"), encoding="utf-8") as f:
+            lines = f.read().splitlines()
+    except OSError:
+        return []
+
+    patterns = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#") or line.startswith("!"):
+            continue
+        patterns.append(line.strip("/"))
+    return patterns
+
+
 schema_get_files_info = types.FunctionDeclaration(
     name="get_files_info",
-    description="Lists files in the specified directory along with their sizes, constrained to the working directory.",
+    description="Lists files in the specified directory along with their sizes, constrained to the working directory. Can list a whole tree in one call with recursive=true; long listings are split into pages.",
     parameters=types.Schema(
         type=types.Type.OBJECT,
         properties={
@@ -44,6 +110,30 @@ schema_get_files_info = types.FunctionDeclaration(
                 type=types.Type.STRING,
                 description="The directory to list files from, relative to the working directory. If not provided, lists files in the working directory itself.",
             ),
+            "recursive": types.Schema(
+                type=types.Type.BOOLEAN,
+                description="List subdirectories too, with paths relative to the working directory. .git, __pycache__, .venv and .gitignore'd paths are skipped.",
+                nullable=True,
+            ),
+            "max_depth": types.Schema(
+                type=types.Type.INTEGER,
+                description="Optional maximum depth for recursive listings; 1 lists only the directory itself.",
+                nullable=True,
+            ),
+            "exclude": types.Schema(
+                type=types.Type.ARRAY,
+                items=types.Schema(
+                    type=types.Type.STRING,
+                    description="A glob matched against entry names and, in recursive listings, paths relative to the working directory.",
+                ),
+                description="Optional glob patterns of entries to leave out, e.g. [\"*.txt\", \"build\"].",
+                nullable=True,
+            ),
+            "cursor": types.Schema(
+                type=types.Type.STRING,
+                description="Cursor returned by a previous call, to fetch the next page of a long listing.",
+                nullable=True,
+            ),
         },
     ),
 )
@@ -0,0 +1,103 @@
+import os
+import selectors
+import time
+
+
+class OutputWindow:
+    """Bounded capture of one output stream.
+
+    Keeps the first `head_bytes` and roughly the last `tail_bytes` of output,
+    cut at line boundaries, and counts what was dropped in between, so memory
+    stays flat no matter how much a script prints. Runs of identical lines
+    are collapsed when the text is rendered.
+    """
+
+    def __init__(self, head_bytes, tail_bytes):
+        self.head_bytes = head_bytes
+        self.tail_bytes = tail_bytes
+        self.total_bytes = 0
+        self.elided_lines = 0
+        self.elided_bytes = 0
+        self._head = bytearray()
+        self._head_full = False
+        self._tail = bytearray()
+
+    def feed(self, data):
+        self.total_bytes += len(data)
+        if not self._head_full:
+            room = self.head_bytes - len(self._head)
+            if len(data) <= room:
+                self._head += data
+                return
+            # fill the head up to its last complete line, the rest goes to the tail
+            cut = data.rfind(b"\n", 0, room) + 1
+            self._head += data[:cut]
+            data = data[cut:]
+            self._head_full = True
+
+        self._tail += data
+        # trimming in bulk keeps the per-chunk cost to a few C-level calls
+        if len(self._tail) > 2 * self.tail_bytes:
+            self._trim()
+
+    def close(self):
+        if len(self._tail) > self.tail_bytes:
+            self._trim()
+
+    def text(self):
+        text = _collapse_repeats(self._head.decode("utf-8", errors="replace"))
+        if self.elided_bytes:
+            text += f"[... {self.elided_lines} lines ({self.elided_bytes} bytes) elided ...]\n"
+        return text + _collapse_repeats(self._tail.decode("utf-8", errors="replace"))
+
+    def _trim(self):
+        start = len(self._tail) - self.tail_bytes
+        cut = self._tail.find(b"\n", start) + 1 or start
+        self.elided_lines += self._tail.count(b"\n", 0, cut)
+        self.elided_bytes += cut
+        del self._tail[:cut]
+
+
+def _collapse_repeats(text):
+    lines = text.split("\n")
+    collapsed = []
+    index = 0
+    while index < len(lines):
+        line = lines[index]
+        run = 1
+        while index + run < len(lines) and lines[index + run] == line:
+            run += 1
+        collapsed.append(line)
+        if run > 2:
+            collapsed.append(f"[previous line repeated {run - 1} more times]")
+        else:
+            collapsed.extend([line] * (run - 1))
+        index += run
+    return "\n".join(collapsed)
+
+
+def read_streams(fds, windows, deadline, max_bytes, on_poll=None, poll_interval=0.05):
+    """Feed each fd into its window until EOF on all of them.
+
+    `on_poll` is called at least every `poll_interval` seconds while reading.
+    Returns "timeout" if the deadline passes, "output" if more than
+    `max_bytes` arrive in total, or None once every stream is closed.
+    """
+    with selectors.DefaultSelector() as selector:
+        for fd, window in zip(fds, windows):
+            selector.register(fd, selectors.EVENT_READ, window)
+        while selector.get_map():
+            if on_poll:
+                on_poll()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return "timeout"
+            for key, _ in selector.select(min(remaining, poll_interval)):
+                data = os.read(key.fd, 65536)
+                if not data:
+                    selector.unregister(key.fd)
+                    continue
+                key.data.feed(data)
+                if sum(window.total_bytes for window in windows) > max_bytes:
+                    return "output"
+    return None
@@ -0,0 +1,233 @@
+"""Warm fork server for running Python scripts without interpreter cold start.
+
+The server is a long-lived `python3` process that imports a list of commonly
+used modules once. For every run it forks a child that sets up cwd, argv and
+stdout/stderr like `python3 script.py args` would, so each script still runs
+in its own process. Only the standard library is imported here: this file is
+also the server's entry point and must not drag the agent's modules along.
+"""
+import atexit
+import json
+import os
+import resource
+import runpy
+import selectors
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+
+
+_server = None  # (process, socket path)
+_server_lock = threading.Lock()
+
+
+def run_in_worker(script_path, args, cwd, timeout, windows, max_bytes, preload=(), limits=None):
+    """Run a script in a child forked from the warm server.
+
+    stdout and stderr stream into the two `windows` (see output_capture).
+    The child is killed once it runs past `timeout` seconds or prints more
+    than `max_bytes`. Returns (exit code, peak RSS in KB, stop reason), where
+    the reason is None, "timeout" or "output".
+    """
+    # imported here: the server side runs this file as a script, outside the package
+    from functions.output_capture import read_streams
+
+    socket_path = _ensure_server(preload)
+    deadline = time.monotonic() + timeout
+    stdout_read, stdout_write = os.pipe()
+    stderr_read, stderr_write = os.pipe()
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as conn:
+            conn.connect(socket_path)
+            request = json.dumps({"script": script_path, "args": list(args or []), "cwd": cwd, "limits": limits or {}})
+            socket.send_fds(conn, [request.encode() + b"\n"], [stdout_write, stderr_write])
+            # the child holds its own copies; closing ours lets the reads see EOF
+            os.close(stdout_write)
+            os.close(stderr_write)
+            stdout_write = stderr_write = None
+
+            replies = conn.makefile("rb")
+            pid = int(replies.readline())
+            stopped = read_streams([stdout_read, stderr_read], windows, deadline, max_bytes)
+            if stopped:
+                _kill(pid)
+            else:
+                # output closed; give the child until the deadline to exit
+                conn.settimeout(max(0.0, deadline - time.monotonic()))
+                try:
+                    return _parse_status(replies.readline(), None)
+                except (TimeoutError, socket.timeout):
+                    stopped = "timeout"
+                    _kill(pid)
+
+            conn.settimeout(None)
+            return _parse_status(replies.readline(), stopped)
+    finally:
+        for fd in (stdout_read, stderr_read, stdout_write, stderr_write):
+            if fd is not None:
+                os.close(fd)
+
+
+def _parse_status(line, stopped):
+    exit_code, peak_rss_kb = line.split()
+    return int(exit_code), int(peak_rss_kb), stopped
+
+
+def _ensure_server(preload):
+    global _server
+    with _server_lock:
+        if _server is None or _server[0].poll() is not None:
+            socket_path = os.path.join(tempfile.mkdtemp(prefix="python-worker-"), "server.sock")
+            # the server exits when its stdin closes, i.e. when we do
+            process = subprocess.Popen(
+                ["python3", os.path.abspath(__file__), socket_path, *preload],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+            )
+            if process.stdout.readline().strip() != b"ready":
+                raise RuntimeError("python worker server failed to start")
+            atexit.register(process.kill)
+            _server = (process, socket_path)
+        return _server[1]
+
+
+def _kill(pid):
+    try:
+        os.kill(pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+
+
+def serve(socket_path, preload):
+    for module_name in preload:
+        try:
+            __import__(module_name)
+        except ImportError:
+            pass
+
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(socket_path)
+    listener.listen()
+    print("ready", flush=True)
+
+    # SIGCHLD writes to this socket, so the loop wakes up as soon as a child exits
+    wakeup_read, wakeup_write = socket.socketpair()
+    wakeup_read.setblocking(False)
+    wakeup_write.setblocking(False)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+    signal.set_wakeup_fd(wakeup_write.fileno())
+
+    children = {}  # pid -> connection waiting for its exit code
+    with selectors.DefaultSelector() as selector:
+        selector.register(listener, selectors.EVENT_READ)
+        selector.register(wakeup_read, selectors.EVENT_READ)
+        selector.register(sys.stdin.fileno(), selectors.EVENT_READ)
+        while True:
+            for key, _ in selector.select():
+                if key.fileobj is listener:
+                    conn, _ = listener.accept()
+                    _fork_child(conn, [listener, wakeup_read, wakeup_write], children)
+                elif key.fileobj is wakeup_read:
+                    while True:
+                        try:
+                            wakeup_read.recv(4096)
+                        except BlockingIOError:
+                            break
+                elif not os.read(sys.stdin.fileno(), 1024):
+                    for pid in children:
+                        _kill(pid)
+                    os.unlink(socket_path)
+                    return
+
+            while children:
+                pid, status, usage = os.wait4(-1, os.WNOHANG)
+                if pid == 0:
+                    break
+                conn = children.pop(pid)
+                try:
+                    conn.sendall(f"{os.waitstatus_to_exitcode(status)} {usage.ru_maxrss}\n".encode())
+                except OSError:
+                    pass
+                conn.close()
+
+
+def _fork_child(conn, server_sockets, children):
+    message, fds, _, _ = socket.recv_fds(conn, 65536, 2)
+    while not message.endswith(b"\n"):
+        chunk = conn.recv(65536)
+        if not chunk:
+            break
+        message += chunk
+    request = json.loads(message)
+
+    pid = os.fork()
+    if pid == 0:
+        signal.set_wakeup_fd(-1)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        for server_socket in server_sockets:
+            server_socket.close()
+        conn.close()
+        _run_script(request["script"], request["args"], request["cwd"], request["limits"], *fds)
+
+    for fd in fds:
+        os.close(fd)
+    conn.sendall(f"{pid}\n".encode())
+    children[pid] = conn
+
+
+def _run_script(script_path, args, cwd, limits, stdout_fd, stderr_fd):
+    # runs in the forked child: make it look like `python3 script.py args`
+    if "cpu" in limits:
+        resource.setrlimit(resource.RLIMIT_CPU, (limits["cpu"], limits["cpu"]))
+    if "memory" in limits:
+        resource.setrlimit(resource.RLIMIT_AS, (limits["memory"], limits["memory"]))
+
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, 0)
+    os.dup2(stdout_fd, 1)
+    os.dup2(stderr_fd, 2)
+    for fd in (devnull, stdout_fd, stderr_fd):
+        os.close(fd)
+    sys.stdin = open(0, "r", closefd=False)
+    sys.stdout = open(1, "w", encoding="utf-8", closefd=False)
+    sys.stderr = open(2, "w", encoding="utf-8", errors="backslashreplace", closefd=False)
+
+    os.chdir(cwd)
+    sys.argv = [script_path, *args]
+    sys.path[0] = os.path.dirname(script_path)
+
+    exit_code = 0
+    try:
+        runpy.run_path(script_path, run_name="__main__")
+    except SystemExit as e:
+        if e.code is None:
+            exit_code = 0
+        elif isinstance(e.code, int):
+            exit_code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            exit_code = 1
+    except BaseException as e:
+        # report it like the interpreter would, starting at the script's frame
+        tb = e.__traceback__
+        while tb is not None and tb.tb_frame.f_code.co_filename != script_path:
+            tb = tb.tb_next
+        traceback.print_exception(type(e), e, tb or e.__traceback__)
+        exit_code = 1
+
+    try:
+        atexit._run_exitfuncs()
+        sys.stdout.flush()
+        sys.stderr.flush()
+    finally:
+        os._exit(exit_code)
+
+
+if __name__ == "__main__":
+    serve(sys.argv[1], sys.argv[2:])
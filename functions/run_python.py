@@ -1,9 +1,262 @@
+import asyncio
 import os
+import resource
 import subprocess
+import time
+from dataclasses import dataclass
 from google.genai import types
+from config import (
+    RUN_TIMEOUT,
+    RUN_OUTPUT_MAX_BYTES,
+    RUN_OUTPUT_HEAD_BYTES,
+    RUN_OUTPUT_TAIL_BYTES,
+    RUN_CPU_LIMIT_SECONDS,
+    RUN_MEMORY_LIMIT_MB,
+    PYTHON_WORKER_POOL,
+    PYTHON_WORKER_PRELOAD,
+)
+from functions.output_capture import OutputWindow, read_streams
+from functions.python_worker import run_in_worker
+
+
+@dataclass
+class RunResult:
+    exit_code: int
+    stdout: str
+    stderr: str
+    wall_time: float
+    peak_rss_kb: int | None
+    timed_out: bool = False
+    output_capped: bool = False
+    timeout: float = RUN_TIMEOUT
 
 
 def run_python_file(working_directory, file_path, args=None):
+    commands = _build_command(working_directory, file_path, args)
+    if isinstance(commands, str):
+        return commands
+
+    try:
+        result = execute_python(commands, os.path.abspath(working_directory))
+        return _format_result(result, commands)
+    except Exception as e:
+        return f"Error: executing Python file: {e}"
+
+
+async def run_python_file_async(working_directory, file_path, args=None):
+    commands = _build_command(working_directory, file_path, args)
+    if isinstance(commands, str):
+        return commands
+
+    try:
+        if PYTHON_WORKER_POOL:
+            result = await asyncio.to_thread(execute_python, commands, os.path.abspath(working_directory))
+        else:
+            result = await execute_python_async(commands, os.path.abspath(working_directory))
+        return _format_result(result, commands)
+    except Exception as e:
+        return f"Error: executing Python file: {e}"
+
+
+def execute_python(commands, cwd, timeout=RUN_TIMEOUT):
+    """Run a script, streaming its output into bounded windows.
+
+    The child is killed once it runs past `timeout` seconds or prints more
+    than RUN_OUTPUT_MAX_BYTES in total. Optional CPU and memory rlimits come
+    from RUN_CPU_LIMIT_SECONDS and RUN_MEMORY_LIMIT_MB.
+    """
+    start = time.monotonic()
+    windows = _new_windows()
+
+    if PYTHON_WORKER_POOL:
+        exit_code, peak_rss_kb, stopped = run_in_worker(
+            commands[1], commands[2:], cwd, timeout, windows, RUN_OUTPUT_MAX_BYTES,
+            preload=PYTHON_WORKER_PRELOAD, limits=_limits(),
+        )
+    else:
+        exit_code, peak_rss_kb, stopped = _run_subprocess(commands, cwd, start + timeout, windows)
+
+    return _run_result(windows, start, exit_code, peak_rss_kb, stopped, timeout)
+
+
+async def execute_python_async(commands, cwd, timeout=RUN_TIMEOUT):
+    # the asyncio counterpart of execute_python's subprocess path
+    start = time.monotonic()
+    windows = _new_windows()
+    process = await asyncio.create_subprocess_exec(
+        *commands,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        cwd=cwd,
+    )
+    output_capped = asyncio.Event()
+
+    async def pump(stream, window):
+        while chunk := await stream.read(65536):
+            window.feed(chunk)
+            if sum(window.total_bytes for window in windows) > RUN_OUTPUT_MAX_BYTES:
+                output_capped.set()
+                return
+
+    async def sample():
+        while True:
+            peak.sample()
+            await asyncio.sleep(0.05)
+
+    sampler = pumps = capped = None
+    stopped = None
+    try:
+        # inside the try: the child is killed and reaped even if these fail
+        _apply_limits(process.pid)
+        peak = PeakRss(process.pid)
+        sampler = asyncio.create_task(sample())
+        pumps = asyncio.gather(pump(process.stdout, windows[0]), pump(process.stderr, windows[1]))
+        capped = asyncio.create_task(output_capped.wait())
+        remaining = start + timeout - time.monotonic()
+        done, _ = await asyncio.wait([pumps, capped], timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+        if capped in done:
+            stopped = "output"
+        elif not done:
+            stopped = "timeout"
+        else:
+            try:
+                await asyncio.wait_for(process.wait(), start + timeout - time.monotonic())
+            except asyncio.TimeoutError:
+                # closed its output but kept running
+                stopped = "timeout"
+    finally:
+        tasks = [task for task in (sampler, capped, pumps) if task is not None]
+        for task in tasks:
+            task.cancel()
+        if process.returncode is None:
+            process.kill()
+        # a grandchild can keep the pipes open after the child is gone, and
+        # wait() also waits for the pipes; closing the transport closes them
+        process._transport.close()
+        await process.wait()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    return _run_result(windows, start, process.returncode, peak.kb, stopped, timeout)
+
+
+def _run_subprocess(commands, cwd, deadline, windows):
+    process = subprocess.Popen(commands, stdout=subprocess.PIPE, stderr=subprocess.PIPE, cwd=cwd)
+    try:
+        _apply_limits(process.pid)
+        peak = PeakRss(process.pid)
+        stopped = read_streams(
+            [process.stdout.fileno(), process.stderr.fileno()],
+            windows,
+            deadline,
+            RUN_OUTPUT_MAX_BYTES,
+            on_poll=peak.sample,
+        )
+        if not stopped:
+            try:
+                process.wait(max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                # closed its output but kept running
+                stopped = "timeout"
+    finally:
+        process.stdout.close()
+        process.stderr.close()
+        if process.returncode is None:
+            process.kill()
+            process.wait()
+
+    return process.returncode, peak.kb, stopped
+
+
+class PeakRss:
+    """Tracks a child's peak resident set size while it runs.
+
+    Reads the high-water mark (VmHWM) from /proc, which is per address space
+    and starts over at exec. wait4's ru_maxrss is no use here: it carries the
+    spawning process' own peak over the exec. Stays None where /proc is
+    unavailable.
+    """
+
+    def __init__(self, pid):
+        self.path = f"/proc/{pid}/status"
+        self.kb = None
+
+    def sample(self):
+        try:
+            with open(self.path, "rb") as f:
+                for line in f:
+                    if line.startswith(b"VmHWM:"):
+                        self.kb = max(self.kb or 0, int(line.split()[1]))
+                        return
+        except (OSError, ValueError):
+            pass
+
+
+def _new_windows():
+    return [
+        OutputWindow(RUN_OUTPUT_HEAD_BYTES, RUN_OUTPUT_TAIL_BYTES),
+        OutputWindow(RUN_OUTPUT_HEAD_BYTES, RUN_OUTPUT_TAIL_BYTES),
+    ]
+
+
+def _run_result(windows, start, exit_code, peak_rss_kb, stopped, timeout):
+    for window in windows:
+        window.close()
+    return RunResult(
+        exit_code=exit_code,
+        stdout=windows[0].text(),
+        stderr=windows[1].text(),
+        wall_time=time.monotonic() - start,
+        peak_rss_kb=peak_rss_kb,
+        timed_out=stopped == "timeout",
+        output_capped=stopped == "output",
+        timeout=timeout,
+    )
+
+
+def _limits():
+    limits = {}
+    if RUN_CPU_LIMIT_SECONDS:
+        limits["cpu"] = int(RUN_CPU_LIMIT_SECONDS)
+    if RUN_MEMORY_LIMIT_MB:
+        limits["memory"] = int(RUN_MEMORY_LIMIT_MB) * 1024 * 1024
+    return limits
+
+
+def _apply_limits(pid):
+    # set from outside the child to stay clear of preexec_fn in a threaded
+    # process; needs Linux, elsewhere the limits are skipped
+    if not hasattr(resource, "prlimit"):
+        return
+    limits = _limits()
+    if "cpu" in limits:
+        resource.prlimit(pid, resource.RLIMIT_CPU, (limits["cpu"], limits["cpu"]))
+    if "memory" in limits:
+        resource.prlimit(pid, resource.RLIMIT_AS, (limits["memory"], limits["memory"]))
+
+
+def _format_result(result, commands):
+    summary = f"[exit code {result.exit_code}, wall time {result.wall_time:.2f}s"
+    if result.peak_rss_kb is not None:
+        summary += f", peak RSS {result.peak_rss_kb / 1024:.1f} MB"
+    summary += "]"
+
+    if result.timed_out:
+        output = [f"Error: executing Python file: Command '{commands}' timed out after {result.timeout} seconds"]
+        if result.stdout:
+            output.append(f"STDOUT:\n{result.stdout}")
+        if result.stderr:
+            output.append(f"STDERR:\n{result.stderr}")
+        output.append(summary)
+        return "\n".join(output)
+
+    output = _format_output(result.exit_code, result.stdout, result.stderr)
+    if result.output_capped:
+        output = f"Process killed: output exceeded {RUN_OUTPUT_MAX_BYTES} bytes\n{output}"
+    return f"{output}\n{summary}"
+
+
+def _build_command(working_directory, file_path, args):
+    # returns the command line to run, or an error message string
     relative_path = os.path.join(working_directory, file_path)
     target_absolute_path = os.path.abspath(relative_path)
 
@@ -25,36 +278,27 @@ def run_python_file(working_directory, file_path, args=None):
     if not python_file:
         return f'Error: "{file_path}" is not a Python file.'
 
-    # run python file
     commands = ["python3", target_absolute_path]
     if args:
         commands.extend(args)
+    return commands
 
-    try:
-        result = subprocess.run(
-            commands,
-            timeout=30,
-            capture_output=True,
-            text=True,
-            cwd=absolute_working_dir,
-            check=True,
-        )
 
-        if not result.stdout and not result.stderr:
-            return "No output produced"
+def _format_output(returncode, stdout, stderr):
+    if returncode != 0:
+        return f"Process exited with code {returncode}, STDOUT: {stdout}, STDERR: {stderr}"
 
-        # formatting output
-        output = []
-        if result.stdout:
-            output.append(f"STDOUT:\n{result.stdout}")
-        if result.stderr:
-            output.append(f"STDERR:\n{result.stderr}")
+    if not stdout and not stderr:
+        return "No output produced"
 
-        return "\n".join(output)
-    except subprocess.CalledProcessError as e:
-        return f"Process exited with code {e.returncode}, STDOUT: {e.stdout}, STDERR: {e.stderr}"
-    except Exception as e:
-        return f"Error: executing Python file: {e}"
+    # formatting output
+    output = []
+    if stdout:
+        output.append(f"STDOUT:\n{stdout}")
+    if stderr:
+        output.append(f"STDERR:\n{stderr}")
+
+    return "\n".join(output)
 
 
 schema_run_python_file = types.FunctionDeclaration(
@@ -0,0 +1,427 @@
+import ast
+import fnmatch
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import MAX_CHARS, RUN_TIMEOUT, RUN_TESTS_WORKERS
+from functions.get_files_info import DEFAULT_EXCLUDES, gitignore_patterns, is_excluded
+from google.genai import types
+
+
+TEST_FILE_PATTERNS = ("test_*.py", "*_test.py", "tests.py")
+# fewer cases than this are not worth another interpreter
+MIN_CASES_PER_PROCESS = 10
+# traceback lines kept for each failure
+TRACEBACK_LINES = 6
+
+# runs the unittest cases named on the command line and writes one
+# [id, outcome, details] entry per case to the results file
+_RUNNER = """
+import json, sys, unittest
+
+results_path, root, names = sys.argv[1], sys.argv[2], sys.argv[3:]
+sys.path.insert(1, root)
+
+
+class Result(unittest.TestResult):
+    outcomes = []
+
+    def addSuccess(self, test):
+        self.outcomes.append([test.id(), "passed", None])
+
+    def addFailure(self, test, err):
+        self.outcomes.append([test.id(), "failed", self._exc_info_to_string(err, test)])
+
+    def addError(self, test, err):
+        self.outcomes.append([test.id(), "error", self._exc_info_to_string(err, test)])
+
+    def addSkip(self, test, reason):
+        self.outcomes.append([test.id(), "skipped", reason])
+
+    def addExpectedFailure(self, test, err):
+        self.outcomes.append([test.id(), "passed", None])
+
+    def addUnexpectedSuccess(self, test):
+        self.outcomes.append([test.id(), "failed", "unexpected success"])
+
+    def addSubTest(self, test, subtest, err):
+        if err is not None:
+            outcome = "failed" if issubclass(err[0], test.failureException) else "error"
+            self.outcomes.append([subtest.id(), outcome, self._exc_info_to_string(err, test)])
+
+
+result = Result()
+unittest.defaultTestLoader.loadTestsFromNames(names).run(result)
+with open(results_path, "w", encoding="utf-8") as f:
+    json.dump(result.outcomes, f)
+"""
+
+
+class ModuleInfo:
+    """What a Python file imports and, for a test file, what each test case uses.
+
+    `imports` maps every name an import binds to the modules it may come
+    from, as (dotted name, relative import level). Names a test case uses
+    are traced through these and through the test file's own helpers to the
+    files the case depends on.
+    """
+
+    def __init__(self, tree):
+        self.imports = {}  # bound name -> [(module, level)]
+        self.star_imports = []  # [(module, level)] of `from x import *`
+        self.definitions = {}  # top-level name -> names its definition uses
+        self.module_names = set()  # names used by other top-level statements
+        self.strings = set()  # string constants, to spot data files the code opens
+        self.cases = {}  # "Class.test_name" -> names the case and its fixtures use
+
+        test_classes = set()
+        for node in tree.body:
+            if isinstance(node, ast.ClassDef) and any(
+                ast.unparse(base).endswith("TestCase") or ast.unparse(base) in test_classes for base in node.bases
+            ):
+                test_classes.add(node.name)
+                fixture_names = _names(node.bases) | _names(node.decorator_list)
+                tests = []
+                for member in node.body:
+                    if isinstance(member, (ast.FunctionDef, ast.AsyncFunctionDef)) and member.name.startswith("test"):
+                        tests.append(member)
+                    else:
+                        fixture_names |= _names([member])
+                for test in tests:
+                    self.cases[f"{node.name}.{test.name}"] = _names([test]) | fixture_names | {node.name}
+                self.definitions[node.name] = fixture_names
+            elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+                self.definitions[node.name] = _names([node])
+            elif isinstance(node, (ast.Assign, ast.AnnAssign)) and node.value is not None:
+                targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+                for target in targets:
+                    for name in _names([target]):
+                        self.definitions[name] = _names([node.value])
+            elif not isinstance(node, (ast.Import, ast.ImportFrom)):
+                self.module_names |= _names([node])
+
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                for alias in node.names:
+                    # `import a.b` binds a, `import a.b as c` binds c to a.b
+                    bound = alias.asname or alias.name.split(".")[0]
+                    self.imports.setdefault(bound, []).append((alias.name, 0))
+            elif isinstance(node, ast.ImportFrom):
+                for alias in node.names:
+                    module = node.module or ""
+                    if alias.name == "*":
+                        self.star_imports.append((module, node.level))
+                        continue
+                    # the name may be a submodule or something the module defines
+                    submodule = f"{module}.{alias.name}" if module else alias.name
+                    self.imports.setdefault(alias.asname or alias.name, []).extend(
+                        [(submodule, node.level), (module, node.level)]
+                    )
+            elif isinstance(node, ast.Constant) and isinstance(node.value, str) and len(node.value) < 256:
+                self.strings.add(node.value)
+
+
+class TestState:
+    """The import graph of one working directory and the files as they were
+    when its tests last passed."""
+
+    def __init__(self, absolute_working_dir):
+        self.absolute_working_dir = absolute_working_dir
+        self.modules = {}  # relative path -> (mtime_ns, size, ModuleInfo or None)
+        self.green = None  # relative path -> (mtime_ns, size) at the last green run
+        self.lock = threading.Lock()
+
+    def snapshot(self):
+        # (mtime_ns, size) of every file the tests could depend on
+        patterns = DEFAULT_EXCLUDES + gitignore_patterns(self.absolute_working_dir)
+        files = {}
+        for dirpath, dirnames, filenames in os.walk(self.absolute_working_dir):
+            relative_dir = os.path.relpath(dirpath, self.absolute_working_dir)
+            prefix = "" if relative_dir == "." else relative_dir + os.sep
+            dirnames[:] = [name for name in dirnames if not is_excluded(name, prefix + name, patterns)]
+            for name in filenames:
+                if is_excluded(name, prefix + name, patterns):
+                    continue
+                try:
+                    stat = os.stat(os.path.join(dirpath, name))
+                except OSError:
+                    continue
+                files[prefix + name] = (stat.st_mtime_ns, stat.st_size)
+        return files
+
+    def module(self, path, fingerprint):
+        # the parsed file, re-parsed only when its mtime or size changed
+        cached = self.modules.get(path)
+        if cached and cached[:2] == fingerprint:
+            return cached[2]
+        try:
+            with open(os.path.join(self.absolute_working_dir, path), encoding="utf-8", errors="replace") as f:
+                info = ModuleInfo(ast.parse(f.read(), filename=path))
+        except (OSError, SyntaxError, ValueError):
+            info = None  # a file that does not parse affects whatever imports it
+        self.modules[path] = (*fingerprint, info)
+        return info
+
+    def resolve(self, importer, module, level, files):
+        # the files an import of `module` in `importer` loads, package __init__s first
+        if level:
+            base = os.path.dirname(importer)
+            for _ in range(level - 1):
+                base = os.path.dirname(base)
+            bases = [base]
+        else:
+            # the working directory and, as for a script, the importer's own directory
+            bases = list(dict.fromkeys(["", os.path.dirname(importer)]))
+        parts = [part for part in module.split(".") if part]
+        for base in bases:
+            target = os.path.join(base, *parts)
+            if parts and target + ".py" in files:
+                module_file = target + ".py"
+            elif os.path.join(target, "__init__.py") in files:
+                module_file = os.path.join(target, "__init__.py")
+            else:
+                continue
+            packages = [os.path.join(base, *parts[:depth], "__init__.py") for depth in range(1, len(parts))]
+            return [package for package in packages if package in files] + [module_file]
+        return []
+
+    def dependencies(self, path, names, files):
+        # files the given names of `path` lead to, followed through every import
+        info = self.module(path, files[path])
+        if info is None:
+            return set()
+        direct = set()
+        seen_names = set()
+        pending = list(names | info.module_names)
+        while pending:
+            name = pending.pop()
+            if name in seen_names:
+                continue
+            seen_names.add(name)
+            for module, level in info.imports.get(name, ()):
+                direct.update(self.resolve(path, module, level, files))
+            pending.extend(info.definitions.get(name, ()))
+        for module, level in info.star_imports:
+            direct.update(self.resolve(path, module, level, files))
+        return self.closure(direct, files)
+
+    def closure(self, paths, files):
+        seen = set()
+        pending = list(paths)
+        while pending:
+            path = pending.pop()
+            if path in seen or path not in files:
+                continue
+            seen.add(path)
+            info = self.module(path, files[path])
+            if info is None:
+                continue
+            for imports in info.imports.values():
+                for module, level in imports:
+                    pending.extend(self.resolve(path, module, level, files))
+            for module, level in info.star_imports:
+                pending.extend(self.resolve(path, module, level, files))
+        return seen
+
+
+# absolute working directory -> TestState, built on the first run
+_states = {}
+_states_lock = threading.Lock()
+
+
+def drop_test_state(working_directory):
+    # frees the import graph of a working directory that is going away
+    with _states_lock:
+        _states.pop(os.path.abspath(working_directory), None)
+
+
+def run_tests(working_directory, full=False):
+    absolute_working_dir = os.path.abspath(working_directory)
+    if not os.path.isdir(absolute_working_dir):
+        return f'Error: "{working_directory}" is not a directory'
+
+    with _states_lock:
+        state = _states.setdefault(absolute_working_dir, TestState(absolute_working_dir))
+
+    try:
+        with state.lock:
+            start = time.perf_counter()
+            files = state.snapshot()
+            test_files = sorted(
+                path for path in files
+                if any(fnmatch.fnmatch(os.path.basename(path), pattern) for pattern in TEST_FILE_PATTERNS)
+            )
+            if not test_files:
+                return f"Error: No test files ({', '.join(TEST_FILE_PATTERNS)}) found in the working directory"
+
+            changed = None
+            if not full and state.green is not None:
+                changed = sorted(path for path in files.keys() | state.green.keys() if files.get(path) != state.green.get(path))
+                if not changed:
+                    return "No files changed since the last green run, so no tests were run. Pass full=true to run the whole suite."
+
+            units, selected, total = _select(state, test_files, files, changed)
+            if changed is None:
+                scope = "the whole suite"
+            else:
+                shown = ", ".join(changed[:10]) + (f" and {len(changed) - 10} more" if len(changed) > 10 else "")
+                scope = f"{len(changed)} file(s) changed since the last green run: {shown}"
+            if not units:
+                state.green = files
+                return f"No tests depend on the {scope}; nothing to run. Pass full=true to run the whole suite."
+
+            outcomes, processes = _run_units(absolute_working_dir, units)
+            green = all(outcome in ("passed", "skipped") for _, outcome, _ in outcomes)
+            if green:
+                # the files as the tests saw them; later changes count against this run
+                state.green = files
+            summary = _summary(outcomes, selected, total, scope, processes, time.perf_counter() - start, green)
+            # tracebacks name files relative to the working directory, like every other tool
+            return summary.replace(absolute_working_dir + os.sep, "")
+    except Exception as e:
+        return f"Error: running tests: {e}"
+
+
+def _select(state, test_files, files, changed):
+    # the units to run: (test file, case ids or None to run the file as a script),
+    # how many cases they hold and how many cases there are in total
+    changed_set = set(changed or ())
+    deleted_code = any(path.endswith(".py") and path not in files for path in changed_set)
+    changed_data = {os.path.basename(path) for path in changed_set if not path.endswith(".py")}
+
+    units = []
+    selected = total = 0
+    for test_file in test_files:
+        info = state.module(test_file, files[test_file])
+        cases = sorted(info.cases) if info else []
+        total += len(cases) or 1
+        # a change the import graph cannot place runs the whole file: the file
+        # itself, a deleted module, or a data file its code mentions
+        whole_file = (
+            changed is None
+            or test_file in changed_set
+            or deleted_code
+            or info is None
+            or (changed_data and _mentions(state, state.closure({test_file}, files), files, changed_data))
+        )
+        if not cases:
+            if whole_file or state.closure({test_file}, files) & changed_set:
+                units.append((test_file, None))
+                selected += 1
+            continue
+        if not whole_file:
+            cases = [case for case in cases if state.dependencies(test_file, info.cases[case], files) & changed_set]
+        if not cases:
+            continue
+        selected += len(cases)
+        # split a file's cases over processes once there are enough of them
+        chunks = max(1, min(RUN_TESTS_WORKERS, len(cases) // MIN_CASES_PER_PROCESS))
+        size = math.ceil(len(cases) / chunks)
+        units.extend((test_file, cases[i:i + size]) for i in range(0, len(cases), size))
+    return units, selected, total
+
+
+def _mentions(state, paths, files, names):
+    for path in paths:
+        info = state.module(path, files[path])
+        if info and any(name in string for string in info.strings for name in names):
+            return True
+    return False
+
+
+def _run_units(absolute_working_dir, units):
+    with ThreadPoolExecutor(max_workers=RUN_TESTS_WORKERS) as pool:
+        results = list(pool.map(lambda unit: _run_unit(absolute_working_dir, *unit), units))
+    return [outcome for outcomes in results for outcome in outcomes], len(units)
+
+
+def _run_unit(absolute_working_dir, test_file, cases):
+    # one interpreter per unit, started in the test file's directory as `python tests.py` would be
+    cwd = os.path.join(absolute_working_dir, os.path.dirname(test_file))
+    module = os.path.splitext(os.path.basename(test_file))[0]
+    if cases is None:
+        try:
+            completed = subprocess.run(
+                [sys.executable, os.path.basename(test_file)], cwd=cwd, capture_output=True, text=True, timeout=RUN_TIMEOUT,
+            )
+        except subprocess.TimeoutExpired:
+            return [(test_file, "error", f"timed out after {RUN_TIMEOUT} seconds")]
+        if completed.returncode == 0:
+            return [(test_file, "passed", None)]
+        return [(test_file, "failed", f"exit code {completed.returncode}\n{completed.stderr or completed.stdout}")]
+
+    fd, results_path = tempfile.mkstemp(suffix=".json", prefix="run-tests-")
+    os.close(fd)
+    try:
+        names = [f"{module}.{case}" for case in cases]
+        try:
+            completed = subprocess.run(
+                [sys.executable, "-c", _RUNNER, results_path, absolute_working_dir, *names],
+                cwd=cwd, capture_output=True, text=True, timeout=RUN_TIMEOUT,
+            )
+        except subprocess.TimeoutExpired:
+            return [(name, "error", f"timed out after {RUN_TIMEOUT} seconds") for name in names]
+        try:
+            with open(results_path, encoding="utf-8") as f:
+                outcomes = [tuple(outcome) for outcome in json.load(f)]
+        except (OSError, ValueError):
+            outcomes = []
+        if not outcomes:
+            # the runner itself died, e.g. the test module calls sys.exit on import
+            details = f"exit code {completed.returncode}\n{completed.stderr or completed.stdout}"
+            return [(name, "error", details) for name in names]
+        return outcomes
+    finally:
+        os.remove(results_path)
+
+
+def _summary(outcomes, selected, total, scope, processes, wall_time, green):
+    counts = {outcome: 0 for outcome in ("passed", "failed", "error", "skipped")}
+    lines = [f"Ran {selected} of {total} tests for {scope}, in {processes} process(es)"]
+    for test_id, outcome, details in outcomes:
+        counts[outcome] += 1
+        if outcome in ("failed", "error"):
+            lines.append(f"{'FAIL' if outcome == 'failed' else 'ERROR'}: {test_id}")
+            details = (details or "").strip().removeprefix("Traceback (most recent call last):").strip()
+            for line in details.splitlines()[-TRACEBACK_LINES:]:
+                lines.append(f"    {line}")
+    summary = (
+        f"[exit code {0 if green else 1}, wall time {wall_time:.2f}s, {counts['passed']} passed, "
+        f"{counts['failed']} failed, {counts['error']} errors, {counts['skipped']} skipped]"
+    )
+    text = "\n".join(lines)
+    if len(text) > MAX_CHARS:
+        text = text[:MAX_CHARS] + f"[...Failures truncated at {MAX_CHARS} characters]"
+    return f"{text}\n{summary}"
+
+
+def _names(nodes):
+    # every name the nodes read, which is what ties code to imports and helpers
+    return {
+        node.id
+        for root in nodes
+        for node in ast.walk(root)
+        if isinstance(node, ast.Name)
+    }
+
+
+schema_run_tests = types.FunctionDeclaration(
+    name="run_tests",
+    description=f"Runs the project's unittest tests ({', '.join(TEST_FILE_PATTERNS)}) in parallel processes and returns a compact pass/fail summary with the tracebacks of failures. By default only the test cases that import, directly or indirectly, a file changed since the last run where every test passed are run; the first run and full=true run the whole suite.",
+    parameters=types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            "full": types.Schema(
+                type=types.Type.BOOLEAN,
+                description="Run every test, not only the ones affected by changes since the last green run.",
+                nullable=True,
+            ),
+        },
+    ),
+)
@@ -0,0 +1,325 @@
+import os
+import re
+import threading
+from config import SEARCH_MAX_RESULTS, SEARCH_MAX_FILE_BYTES
+from functions.get_files_info import DEFAULT_EXCLUDES, gitignore_patterns, is_excluded
+from google.genai import types
+
+
+SNIPPET_CHARS = 200
+REGEX_METACHARACTERS = set(".^$*+?{}[]()|\\")
+
+
+class CodeIndex:
+    """Trigram index over the text files of one working directory.
+
+    Each file's lowercased trigrams point back at the file, so a query only
+    scans files containing every trigram of its literal parts. The file text
+    is kept in memory to avoid re-reading candidates.
+    """
+
+    def __init__(self, absolute_working_dir):
+        self.absolute_working_dir = absolute_working_dir
+        self.files = {}  # relative path -> (mtime_ns, size, text, trigrams)
+        self.postings = {}  # trigram -> set of relative paths
+        self.stale = True
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        # re-index files whose mtime/size changed since the last refresh
+        with self._lock:
+            if not self.stale:
+                return
+            seen = set()
+            for path, absolute_path in self._source_files():
+                seen.add(path)
+                self._update(path, absolute_path)
+            for path in set(self.files) - seen:
+                self._remove(path)
+            self.stale = False
+
+    def update_file(self, path):
+        with self._lock:
+            path = os.path.normpath(path)
+            self._update(path, os.path.join(self.absolute_working_dir, path))
+
+    def candidates(self, literals):
+        with self._lock:
+            trigrams = {literal[i:i + 3] for literal in literals for i in range(len(literal) - 2)}
+            if not trigrams:
+                return sorted(self.files)
+            postings = sorted((self.postings.get(trigram, set()) for trigram in trigrams), key=len)
+            return sorted(set.intersection(*postings))
+
+    def text(self, path):
+        with self._lock:
+            entry = self.files.get(path)
+            return entry[2] if entry else None
+
+    def _source_files(self):
+        patterns = DEFAULT_EXCLUDES + gitignore_patterns(self.absolute_working_dir)
+        for dirpath, dirnames, filenames in os.walk(self.absolute_working_dir):
+            relative_dir = os.path.relpath(dirpath, self.absolute_working_dir)
+            prefix = "" if relative_dir == "." else relative_dir + os.sep
+            dirnames[:] = [name for name in dirnames if not is_excluded(name, prefix + name, patterns)]
+            for name in filenames:
+                if not is_excluded(name, prefix + name, patterns):
+                    yield prefix + name, os.path.join(dirpath, name)
+
+    def _update(self, path, absolute_path):
+        try:
+            stat = os.stat(absolute_path)
+        except OSError:
+            self._remove(path)
+            return
+
+        entry = self.files.get(path)
+        if entry and entry[:2] == (stat.st_mtime_ns, stat.st_size):
+            return
+
+        self._remove(path)
+        if stat.st_size > SEARCH_MAX_FILE_BYTES:
+            return
+        try:
+            with open(absolute_path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return
+        if b"\0" in data:
+            return  # binary file
+
+        text = data.decode("utf-8", errors="replace")
+        lowered = text.lower()
+        trigrams = {lowered[i:i + 3] for i in range(len(lowered) - 2)}
+        for trigram in trigrams:
+            self.postings.setdefault(trigram, set()).add(path)
+        self.files[path] = (stat.st_mtime_ns, stat.st_size, text, trigrams)
+
+    def _remove(self, path):
+        entry = self.files.pop(path, None)
+        if not entry:
+            return
+        for trigram in entry[3]:
+            paths = self.postings.get(trigram)
+            if paths is not None:
+                paths.discard(path)
+                if not paths:
+                    del self.postings[trigram]
+
+
+# absolute working directory -> CodeIndex, built on first search
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(working_directory):
+    absolute_working_dir = os.path.abspath(working_directory)
+    with _indexes_lock:
+        if absolute_working_dir not in _indexes:
+            _indexes[absolute_working_dir] = CodeIndex(absolute_working_dir)
+        return _indexes[absolute_working_dir]
+
+
+def update_search_index(working_directory, file_path):
+    # keeps an already built index current after a write through the tools
+    index = _indexes.get(os.path.abspath(working_directory))
+    if index is not None and not index.stale:
+        index.update_file(file_path)
+
+
+def mark_search_index_stale(working_directory):
+    # a script run may have changed any file; re-check mtimes on the next search
+    index = _indexes.get(os.path.abspath(working_directory))
+    if index is not None:
+        index.stale = True
+
+
+def drop_search_index(working_directory):
+    # frees the index of a working directory that is going away
+    with _indexes_lock:
+        _indexes.pop(os.path.abspath(working_directory), None)
+
+
+def search_code(working_directory, query, regex=False, case_sensitive=True, path="."):
+    absolute_working_dir = os.path.abspath(working_directory)
+    search_root = os.path.abspath(os.path.join(working_directory, path or "."))
+    if os.path.commonpath([absolute_working_dir, search_root]) != absolute_working_dir:
+        return f'Error: Cannot search "{path}" as it is outside the permitted working directory'
+
+    if not query:
+        return "Error: query must not be empty"
+
+    flags = 0 if case_sensitive else re.IGNORECASE
+    try:
+        pattern = re.compile(query if regex else re.escape(query), flags)
+    except re.error as e:
+        return f'Error: Invalid regex "{query}": {e}'
+
+    try:
+        index = get_index(working_directory)
+        index.refresh()
+
+        literals = _required_literals(query) if regex else [query]
+        prefix = os.path.relpath(search_root, absolute_working_dir)
+        prefix = "" if prefix == "." else prefix + os.sep
+
+        hits = []
+        for file_path in index.candidates([literal.lower() for literal in literals]):
+            if not file_path.startswith(prefix):
+                continue
+            text = index.text(file_path)
+            if text is None:
+                continue
+            for line_number, line in enumerate(text.splitlines(), start=1):
+                if pattern.search(line):
+                    hits.append(f"{file_path}:{line_number}: {line.strip()[:SNIPPET_CHARS]}")
+                    if len(hits) > SEARCH_MAX_RESULTS:
+                        break
+            if len(hits) > SEARCH_MAX_RESULTS:
+                break
+
+        if not hits:
+            return f'No matches for "{query}"'
+        if len(hits) > SEARCH_MAX_RESULTS:
+            hits = hits[:SEARCH_MAX_RESULTS]
+            hits.append(f"[...results capped at {SEARCH_MAX_RESULTS} matches; narrow the query or path]")
+        return "\n".join(hits)
+    except Exception as e:
+        return f"Error: searching code: {e}"
+
+
+def _required_literals(pattern):
+    # literal runs every match must contain; with alternation or group
+    # extensions anything goes, so fall back to scanning all files
+    if "|" in pattern or "(?" in pattern:
+        return []
+
+    # the literals of each open group; a group that turns out to be optional
+    # or repeated zero times takes its literals with it
+    groups = [[]]
+    literals = groups[-1]
+    current = ""
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char in "()":
+            literals.append(current)
+            current = ""
+            i += 1
+            if char == "(":
+                groups.append([])
+            elif len(groups) == 1:
+                return []
+            else:
+                group = groups.pop()
+                if not _optional_quantifier(pattern, i):
+                    groups[-1].extend(group)
+            literals = groups[-1]
+            continue
+        if char == "\\" and i + 1 < len(pattern):
+            escaped = pattern[i + 1]
+            i += 2
+            if escaped.isalnum():
+                # a class like \d or \w, an anchor like \b, or a character
+                # code like \x41 or \u00e9 whose argument is not literal text
+                literals.append(current)
+                current = ""
+                i = _escape_end(pattern, i, escaped)
+                continue
+            char = escaped
+        elif char in REGEX_METACHARACTERS:
+            if char in "*?{":
+                # the previous character is optional
+                current = current[:-1]
+            if char == "[":
+                i = _class_end(pattern, i)
+            elif char == "{":
+                close = pattern.find("}", i + 1)
+                i = close if close != -1 else len(pattern)
+            literals.append(current)
+            current = ""
+            i += 1
+            continue
+        else:
+            i += 1
+
+        if i < len(pattern) and pattern[i] in "*?{":
+            # this character is optional too
+            literals.append(current)
+            current = ""
+            continue
+        current += char
+
+    literals.append(current)
+    return [literal for literal in groups[0] if len(literal) >= 3]
+
+
+def _escape_end(pattern, i, escaped):
+    # where the argument of the escape ending just before `i` ends
+    if escaped in "xuU":
+        return i + {"x": 2, "u": 4, "U": 8}[escaped]
+    if escaped == "N" and pattern.startswith("{", i):
+        close = pattern.find("}", i)
+        return close + 1 if close != -1 else len(pattern)
+    if escaped.isdigit():
+        # an octal code or a group reference: the digits that follow belong to it
+        while i < len(pattern) and pattern[i].isdigit():
+            i += 1
+    return i
+
+
+def _class_end(pattern, i):
+    # the index of the "]" closing the character class opened at `i`; a "]"
+    # right after "[" or "[^" is a member, as is an escaped one
+    j = i + 1
+    if pattern.startswith("^", j):
+        j += 1
+    if pattern.startswith("]", j):
+        j += 1
+    while j < len(pattern):
+        if pattern[j] == "\\":
+            j += 2
+            continue
+        if pattern[j] == "]":
+            return j
+        j += 1
+    return len(pattern)
+
+
+def _optional_quantifier(pattern, i):
+    # whether the quantifier at `i`, if any, allows zero repetitions
+    if pattern.startswith(("?", "*"), i):
+        return True
+    match = re.match(r"\{(\d*)(,\d*)?\}", pattern[i:])
+    return match is not None and (match.group(1) or "0") == "0"
+
+
+schema_search_code = types.FunctionDeclaration(
+    name="search_code",
+    description="Searches the text files of the working directory for a literal string or regex and returns matching lines as `path:line: snippet`. Much cheaper than reading files one by one to find where something is used.",
+    parameters=types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            "query": types.Schema(
+                type=types.Type.STRING,
+                description="The text to look for. Treated as a literal string unless regex is true.",
+            ),
+            "regex": types.Schema(
+                type=types.Type.BOOLEAN,
+                description="Treat the query as a Python regular expression, matched per line.",
+                nullable=True,
+            ),
+            "case_sensitive": types.Schema(
+                type=types.Type.BOOLEAN,
+                description="Match case exactly. Defaults to true.",
+                nullable=True,
+            ),
+            "path": types.Schema(
+                type=types.Type.STRING,
+                description="Optional directory to limit the search to, relative to the working directory.",
+                nullable=True,
+            ),
+        },
+        required=["query"]
+    ),
+)
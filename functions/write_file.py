@@ -1,4 +1,8 @@
 import os
+import shutil
+import tempfile
+import uuid
+from config import WRITE_FSYNC
 from google.genai import types
 
 
@@ -30,14 +34,157 @@ def write_file(working_directory, file_path, content):
 
     # write content in the file
     try:
-        with open(target_absolute_file_path, "w") as f:
-            f.write(content)
+        replace_file(target_absolute_file_path, content)
 
         return f'Successfully wrote to "{file_path}" ({len(content)} characters written)'
     except Exception as e:
         return f"Error: writing to file: {e}"
 
 
+def write_files(working_directory, files):
+    absolute_working_dir = os.path.abspath(working_directory)
+    if not files:
+        return "Error: No files to write"
+
+    # every path is checked before anything is written
+    targets = []
+    for number, entry in enumerate(files, start=1):
+        file_path = entry.get("file_path") or ""
+        content = entry.get("content")
+        if not file_path or content is None:
+            return f"Error: file {number} needs a file_path and a content; no file was written"
+        target_absolute_file_path = os.path.abspath(os.path.join(working_directory, file_path))
+        if os.path.commonpath([absolute_working_dir, target_absolute_file_path]) != absolute_working_dir:
+            return f'Error: Cannot write to "{file_path}" as it is outside the permitted working directory; no file was written'
+        if os.path.isdir(target_absolute_file_path):
+            return f'Error: "{file_path}" is a directory, not a file; no file was written'
+        if target_absolute_file_path in (target for target, _, _ in targets):
+            return f'Error: "{file_path}" is listed more than once; no file was written'
+        targets.append((target_absolute_file_path, file_path, content))
+
+    try:
+        _replace_files([(target, content) for target, _, content in targets])
+    except Exception as e:
+        return f"Error: writing files: {e}; no file was changed"
+
+    lines = [f"Successfully wrote {len(targets)} file(s) in one transaction:"]
+    lines += [f'- "{file_path}" ({len(content)} characters written)' for _, file_path, content in targets]
+    return "\n".join(lines)
+
+
+def replace_file(absolute_path, text, newline=None, fsync=None):
+    # write next to the file and rename over it, so a crash or a timeout
+    # leaves either the old file or the new one, never half of it
+    fsync = WRITE_FSYNC if fsync is None else fsync
+    temp_path = _write_temp(absolute_path, text, newline, fsync)
+    try:
+        os.replace(temp_path, absolute_path)
+    except BaseException:
+        _unlink(temp_path)
+        raise
+    if fsync:
+        _fsync_directory(os.path.dirname(absolute_path))
+
+
+def _replace_files(contents, fsync=None):
+    # all (absolute path, text) pairs or none: every file is written to a temp
+    # file first, the originals are kept as hard links until all renames succeeded
+    fsync = WRITE_FSYNC if fsync is None else fsync
+    created_dirs = []
+    temp_paths = []
+    backups = {}
+    replaced = []
+    try:
+        for absolute_path, _ in contents:
+            created_dirs += _make_parent_dirs(os.path.dirname(absolute_path))
+        for absolute_path, text in contents:
+            temp_paths.append(_write_temp(absolute_path, text, None, fsync))
+        for absolute_path, _ in contents:
+            if os.path.exists(absolute_path):
+                backups[absolute_path] = _backup(absolute_path)
+        for (absolute_path, _), temp_path in zip(contents, temp_paths):
+            os.replace(temp_path, absolute_path)
+            replaced.append(absolute_path)
+    except BaseException:
+        for absolute_path in reversed(replaced):
+            if absolute_path in backups:
+                os.replace(backups.pop(absolute_path), absolute_path)
+            else:
+                _unlink(absolute_path)
+        for path in temp_paths + list(backups.values()):
+            _unlink(path)
+        for directory in reversed(created_dirs):
+            try:
+                os.rmdir(directory)
+            except OSError:
+                pass
+        raise
+
+    for backup_path in backups.values():
+        _unlink(backup_path)
+    if fsync:
+        for directory in sorted({os.path.dirname(absolute_path) for absolute_path, _ in contents}):
+            _fsync_directory(directory)
+
+
+def _write_temp(absolute_path, text, newline, fsync):
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(absolute_path), prefix=".write-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8", newline=newline) as f:
+            f.write(text)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        if os.path.exists(absolute_path):
+            shutil.copymode(absolute_path, temp_path)
+    except BaseException:
+        _unlink(temp_path)
+        raise
+    return temp_path
+
+
+def _backup(absolute_path):
+    # a second name for the original, so a failed transaction can put it back
+    backup_path = os.path.join(os.path.dirname(absolute_path), f".backup-{uuid.uuid4().hex}.tmp")
+    try:
+        os.link(absolute_path, backup_path)
+    except OSError:
+        shutil.copy2(absolute_path, backup_path)
+    return backup_path
+
+
+def _make_parent_dirs(directory):
+    # the directories created, outermost first
+    missing = []
+    while not os.path.isdir(directory):
+        missing.append(directory)
+        directory = os.path.dirname(directory)
+    for path in reversed(missing):
+        os.mkdir(path)
+    return list(reversed(missing))
+
+
+def _fsync_directory(directory):
+    # makes a rename durable; not every platform can open a directory
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _unlink(path):
+    try:
+        os.unlink(path)
+    except OSError:
+        pass
+
+
 schema_write_file = types.FunctionDeclaration(
     name="write_file",
     description="Writes content to a specified file, creating directories if needed. The file must be within the permitted working directory bounds.",
@@ -56,3 +203,32 @@ schema_write_file = types.FunctionDeclaration(
         required=["file_path", "content"]
     ),
 )
+
+schema_write_files = types.FunctionDeclaration(
+    name="write_files",
+    description="Writes several files in one call as a single transaction: either every file is written or, if any write fails, none is changed. Creates directories if needed. Use it for a change that spans files instead of one write_file call per file.",
+    parameters=types.Schema(
+        type=types.Type.OBJECT,
+        properties={
+            "files": types.Schema(
+                type=types.Type.ARRAY,
+                description="The files to write, each at most once.",
+                items=types.Schema(
+                    type=types.Type.OBJECT,
+                    properties={
+                        "file_path": types.Schema(
+                            type=types.Type.STRING,
+                            description="The path to the file to write to, relative to the working directory.",
+                        ),
+                        "content": types.Schema(
+                            type=types.Type.STRING,
+                            description="The whole new content of the file.",
+                        ),
+                    },
+                    required=["file_path", "content"],
+                ),
+            ),
+        },
+        required=["files"]
+    ),
+)
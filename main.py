@@ -1,27 +1,42 @@
 import argparse
+import asyncio
+import functools
 import sys
 import os
+import time
+from dataclasses import dataclass, field
 
-from google import genai
-from google.genai import types
-from dotenv import load_dotenv
-
-from call_function import available_functions, call_function
-from config import MAX_ITERATIONS
+from compaction import compact_messages
+from call_function import CallScheduler, call_functions_async, tool_declarations
+from config import (
+    FAST_MODEL, MAX_ITERATIONS, MODEL, MODEL_ROUTING, PREFETCH_MODE, SAVE_SESSIONS, SESSION_DIR, STRONG_MODEL,
+    WORKING_DIR,
+)
 from prompts import system_prompt
+from model_backend import RecordingBackend, ReplayBackend, merge_stream, replay_latency
+from prefetch import PREFETCH_MODES, prefetcher
+from rate_limit import RateLimitedClient
+from routing import ModelRouter
+from session_store import SessionStore
+from tool_cache import tool_cache
+from tracing import tracer
 
 
 def main():
     parser = argparse.ArgumentParser(description="AI Code Assistant")
-    parser.add_argument("user_prompt", type=str, help="Prompt to send to Gemini")
+    parser.add_argument("user_prompt", type=str, nargs="?", help="Prompt to send to Gemini")
     parser.add_argument("--verbose", action="store_true", help="Enable verbose output")
+    parser.add_argument("--stream", action="store_true", help="Print the model's text as it is generated")
+    add_session_arguments(parser)
+    add_backend_arguments(parser)
+    add_routing_arguments(parser)
+    add_prefetch_arguments(parser)
+    add_tracing_arguments(parser)
     args = parser.parse_args()
-
-    load_dotenv()
-
-    api_key = os.environ.get("GEMINI_API_KEY")
-    if not api_key:
-        raise RuntimeError("GEMINI_API_KEY environment variable not set")
+    if not args.user_prompt and not args.resume:
+        parser.error("a prompt is required unless resuming a session with --resume")
+    tracer.configure(args.trace, args.metrics)
+    prefetcher.configure(args.prefetch)
 
     # # getting user prompt from the command line arguments
     # verbose = "--verbose" in sys.argv
@@ -34,7 +49,9 @@ def main():
     #     sys.exit(1)
 
     # client initialization
-    client = genai.Client(api_key=api_key)
+    client = create_client(args)
+    # the Gemini SDK is imported only now, after the arguments and API key checked out
+    from google.genai import types
 
     # # message formatting
     # user_prompt = " ".join(args)
@@ -42,31 +59,69 @@ def main():
     # if verbose:
     #     print(f"User prompt: {user_prompt}")
 
+    store = SessionStore(args.session_dir)
+    session = None
+    working_directory = WORKING_DIR
+    if args.resume:
+        try:
+            session = store.open(args.resume)
+        except ValueError as e:
+            parser.error(str(e))
+        if not args.user_prompt and session.messages and session.messages[-1].role == "model":
+            parser.error(f"session {session.id} already ended with an answer; give a prompt to continue it")
+        # the history so far, with the files it read and wrote still where it left them
+        messages = session.messages
+        working_directory = session.working_directory
+        if args.verbose:
+            print(f"Resumed session {session.id}: {len(messages)} messages")
+    else:
+        messages = []
+        if args.save_session:
+            session = store.create(args.user_prompt, working_directory)
+
     # To keep track of the entire conversation with LLM store in a list with role
-    messages = [
-        types.Content(
-            role="user",
-            parts=[
-                types.Part(text=args.user_prompt)
-            ]
-        ),
-    ]
+    if args.user_prompt:
+        messages.append(
+            types.Content(
+                role="user",
+                parts=[
+                    types.Part(text=args.user_prompt)
+                ]
+            )
+        )
+    if session:
+        session.append(messages)
     if args.verbose:
-        print(f"User prompt: {args.user_prompt}\n")
+        if args.user_prompt:
+            print(f"User prompt: {args.user_prompt}")
+        if session:
+            print(f"Session: {session.id}")
+        print()
 
-    # run the agent for multiple turns (up to 20) to allow tool use + feedback loop
-    for _ in range(MAX_ITERATIONS):
-        try:
-            content_response = generate_content(client, messages, args.verbose)
-            if content_response:
-                print("final response:")
-                print(content_response)
-                break
-        except Exception as e:
-            print(f"Error in generate_content: {e}")
-            break
+    stats = AgentStats()
+    final_response = asyncio.run(run_agent(
+        client, messages, args.verbose, working_directory, stats, args.stream, create_router(args),
+        session, args.max_iterations,
+    ))
+    tracer.write_metrics()
+    tracer.close()
+    if args.verbose:
+        print(f"Tool cache: {tool_cache.stats()}")
+        if prefetcher.mode != "off":
+            print(f"Prefetch: {prefetcher.stats()}")
+        print(f"Model backend: {backend_stats(client)}")
+        print(f"Models: {stats.models()}")
+    if final_response:
+        # a streamed answer is already on screen
+        if not args.stream:
+            print("final response:")
+            print(final_response)
+        return
 
-    print(f"Maximum iterations ({MAX_ITERATIONS}) reached")
+    if not stats.error:
+        print(f"Maximum iterations ({args.max_iterations}) reached")
+    if session:
+        print(f"Continue with: python main.py --resume {session.id} [--max-iterations N]")
     sys.exit(1)
 
     # manually check and print if limit reached
@@ -86,19 +141,224 @@ def main():
     #     except Exception as e:
     #         print(f"Error in generate_content: {e}")
 
-def generate_content(client, messages, verbose):
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=messages,
-        config=types.GenerateContentConfig(
-            tools=[available_functions],
-            system_instruction=system_prompt
-        ),
+@dataclass
+class AgentStats:
+    # filled in by run_agent when passed one
+    iterations: int = 0
+    prompt_tokens: int = 0
+    response_tokens: int = 0
+    error: str | None = None
+    # one entry per model call: model, route reason, latency and tokens
+    turns: list = field(default_factory=list)
+
+    def models(self):
+        counts = {}
+        for turn in self.turns:
+            counts[turn["model"]] = counts.get(turn["model"], 0) + 1
+        return counts
+
+
+def add_session_arguments(parser):
+    parser.add_argument(
+        "--resume", metavar="SESSION",
+        help='Continue a saved session ("latest" for the most recent), optionally with a new prompt',
+    )
+    parser.add_argument(
+        "--max-iterations", type=int, default=MAX_ITERATIONS, help="Model calls this run may make before giving up",
+    )
+    parser.add_argument(
+        "--no-session", dest="save_session", action="store_false", default=SAVE_SESSIONS,
+        help="Do not save the conversation for --resume",
+    )
+    parser.add_argument("--session-dir", default=SESSION_DIR, help="Where sessions are saved")
+
+
+def add_backend_arguments(parser):
+    parser.add_argument("--record", metavar="CASSETTE", help="Save every model request/response to a cassette file")
+    parser.add_argument("--replay", metavar="CASSETTE", help="Serve model responses from a cassette instead of the API")
+    parser.add_argument(
+        "--replay-latency", type=replay_latency, metavar="SECONDS",
+        help='Delay added to each replayed response, or "recorded" to use the recorded latency',
+    )
+
+
+def add_routing_arguments(parser):
+    parser.add_argument(
+        "--route", action="store_true", default=MODEL_ROUTING,
+        help="Use a fast model for tool turns and a strong model for reasoning and final answers",
+    )
+    parser.add_argument("--fast-model", default=FAST_MODEL, help="Model for mechanical tool turns when routing")
+    parser.add_argument("--strong-model", default=STRONG_MODEL, help="Model for fixes and final answers when routing")
+
+
+def create_router(args):
+    # None keeps every turn on MODEL
+    if not args.route:
+        return None
+    return ModelRouter(args.fast_model, args.strong_model)
+
+
+def add_prefetch_arguments(parser):
+    parser.add_argument(
+        "--prefetch", choices=PREFETCH_MODES, default=PREFETCH_MODE,
+        help="After a listing, read likely next files in the background (buffer) or also preview them in it (inline)",
     )
-    if not response.usage_metadata:
-        raise RuntimeError("Gemini API response appears to be malformed")
 
+
+def add_tracing_arguments(parser):
+    parser.add_argument("--trace", metavar="FILE", help="Append a JSONL span for every session, iteration, model and tool call")
+    parser.add_argument("--metrics", metavar="FILE", help="Write Prometheus text-format metrics when the run ends")
+
+
+def create_client(args):
+    """Build the model client the command line asked for.
+
+    Replays need no API key or network. Live calls go through the shared rate
+    limiter, and are recorded below it, so retries never reach the cassette.
+    """
+    if args.replay:
+        return ReplayBackend(args.replay, latency=args.replay_latency)
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if not api_key:
+        raise RuntimeError("GEMINI_API_KEY environment variable not set")
+
+    from google import genai
+
+    client = genai.Client(api_key=api_key)
+    if args.record:
+        client = RecordingBackend(client, args.record)
+    return RateLimitedClient(client)
+
+
+def backend_stats(client):
+    if isinstance(client, ReplayBackend):
+        return {"replayed": client.replayed, "mismatches": client.mismatches}
+    stats = client.limiter.stats()
+    if isinstance(client.client, RecordingBackend):
+        stats["recorded"] = client.client.recorded
+    return stats
+
+
+async def run_agent(
+    client, messages, verbose=False, working_directory=WORKING_DIR, stats=None, stream=False, router=None,
+    session=None, max_iterations=MAX_ITERATIONS,
+):
+    """Drive one conversation until the model answers, returning its final text.
+
+    Returns None when the iteration budget runs out or the model call fails.
+    Many conversations can share one event loop and one client, each with its
+    own `messages` and `working_directory`; pass an AgentStats to collect
+    iteration, token and per-turn model counts. With `stream`, model text is
+    printed as it arrives and tool calls start before the response is
+    complete. A ModelRouter picks the model of every iteration; without one
+    each turn uses MODEL. With a Session, the history is appended to its log
+    after every completed iteration, so the run can be resumed from there.
+    """
+    stats = stats if stats is not None else AgentStats()
+    final_response = None
+    with tracer.span("session") as session_span:
+        # run the agent for multiple turns (up to 20) to allow tool use + feedback loop
+        for _ in range(max_iterations):
+            stats.iterations += 1
+            try:
+                model, route = router.choose(messages) if router else (MODEL, None)
+                with tracer.span("iteration", iteration=stats.iterations):
+                    turn_start = len(messages)
+                    final_response = await generate_content(
+                        client, messages, verbose, working_directory, stats, stream, model, route,
+                    )
+                    # a streamed answer is already on screen, so it stands
+                    if final_response and router and router.should_recheck(model) and not stream:
+                        # the fast model thinks it is done; the strong one writes the answer
+                        del messages[turn_start:]
+                        final_response = await generate_content(
+                            client, messages, verbose, working_directory, stats, stream, router.strong_model, "final answer",
+                        )
+                if session is not None:
+                    # only whole iterations: a model turn without its tool results cannot be resumed
+                    session.append(messages)
+                if final_response:
+                    break
+            except Exception as e:
+                print(f"Error in generate_content: {e}")
+                stats.error = str(e)
+                break
+
+        if final_response:
+            outcome = "answered"
+        else:
+            outcome = "error" if stats.error else "max_iterations"
+        session_span.set(
+            outcome=outcome,
+            iterations=stats.iterations,
+            prompt_tokens=stats.prompt_tokens,
+            response_tokens=stats.response_tokens,
+        )
+        if session is not None:
+            session.end(outcome, stats)
+    return final_response or None
+
+
+@functools.cache
+def generate_config():
+    """The request config every model call shares: tool declarations and system prompt."""
+    from google.genai import types
+
+    return types.GenerateContentConfig(tools=[tool_declarations()], system_instruction=system_prompt)
+
+
+async def generate_content(
+    client, messages, verbose, working_directory=WORKING_DIR, stats=None, stream=False, model=MODEL, route=None,
+):
+    from google.genai import types
+
+    # send a compacted view of the history; `messages` itself keeps everything
+    contents, tokens_saved = compact_messages(messages)
+    if verbose and tokens_saved:
+        print(f"Compacted history: ~{tokens_saved} tokens saved")
+
+    scheduler = None
+    start = time.perf_counter()
+    with tracer.span("model_call", model=model, route=route, stream=stream) as model_span:
+        if stream:
+            scheduler = CallScheduler(verbose, working_directory)
+            response = await stream_content(client, contents, scheduler, verbose, model, model_span)
+        else:
+            response = await client.aio.models.generate_content(
+                model=model,
+                contents=contents,
+                config=generate_config(),
+            )
+        if not response.usage_metadata:
+            if scheduler is not None:
+                scheduler.cancel()
+            raise RuntimeError("Gemini API response appears to be malformed")
+        model_span.set(
+            prompt_tokens=response.usage_metadata.prompt_token_count,
+            response_tokens=response.usage_metadata.candidates_token_count,
+            function_calls=len(response.function_calls or []),
+        )
+
+    latency = time.perf_counter() - start
+    prompt_tokens = response.usage_metadata.prompt_token_count or 0
+    response_tokens = response.usage_metadata.candidates_token_count or 0
+    if stats is not None:
+        stats.prompt_tokens += prompt_tokens
+        stats.response_tokens += response_tokens
+        stats.turns.append({
+            "model": model,
+            "route": route,
+            "latency": round(latency, 3),
+            "prompt_tokens": prompt_tokens,
+            "response_tokens": response_tokens,
+        })
     if verbose:
+        print(f"Model: {model}{f' ({route})' if route else ''} in {latency:.2f}s")
         print(f"Prompt tokens: {response.usage_metadata.prompt_token_count}")
         print(f"Response tokens: {response.usage_metadata.candidates_token_count}")
 
@@ -114,11 +374,15 @@ def generate_content(client, messages, verbose):
     if not response.function_calls:
         return response.text
 
-    # excute any tool calls the model requested and collect their results
+    # excute any tool calls the model requested and collect their results;
+    # calls run concurrently but come back in the order the model made them
+    if scheduler is not None:
+        # already started while the response streamed in
+        function_call_results = await scheduler.results()
+    else:
+        function_call_results = await call_functions_async(response.function_calls, verbose, working_directory)
     function_responses = []
-    for function_call_part in response.function_calls:
-        function_call_result = call_function(function_call_part, verbose)
-
+    for function_call_result in function_call_results:
         # sanity-check: ensure the tool actually return a function response
         if (
             not function_call_result.parts
@@ -145,5 +409,36 @@ def generate_content(client, messages, verbose):
     )
 
 
+async def stream_content(client, contents, scheduler, verbose, model, model_span):
+    """Stream one model response, printing its text and handing each function
+    call to `scheduler` as soon as it arrives. Returns the merged response."""
+    start = time.perf_counter()
+    chunks = []
+    printed = False
+    try:
+        stream = await client.aio.models.generate_content_stream(model=model, contents=contents, config=generate_config())
+        async for chunk in stream:
+            if not chunks:
+                model_span.set(first_chunk_seconds=round(time.perf_counter() - start, 4))
+                if verbose:
+                    print(f"First chunk after {time.perf_counter() - start:.3f}s")
+            chunks.append(chunk)
+            candidate = chunk.candidates[0] if chunk.candidates else None
+            for part in (candidate.content.parts if candidate and candidate.content else None) or []:
+                if part.function_call:
+                    scheduler.submit(part.function_call)
+                elif part.text and not part.thought:
+                    print(part.text, end="", flush=True)
+                    printed = True
+    except BaseException:
+        # calls already started belong to a response that will not be kept
+        scheduler.cancel()
+        raise
+    finally:
+        if printed:
+            print()
+    return merge_stream(chunks)
+
+
 if __name__ == "__main__":
     main()
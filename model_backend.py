@@ -0,0 +1,214 @@
+"""Model backends: anything with an async `aio.models.generate_content`.
+
+The agent only ever calls `client.aio.models.generate_content(model=...,
+contents=..., config=...)`, or `generate_content_stream` with the same
+arguments when streaming, so a genai.Client works as is. The backends here
+add recording of a live session to a cassette file and replaying it offline.
+A streamed call is recorded as the single response its chunks add up to, and
+backends without a stream of their own serve a response one part per chunk.
+
+A cassette is JSON lines (gzipped if the name ends in .gz), one per model
+call: the session it belongs to (a hash of the first user prompt), the turn
+(how many contents were sent), a hash of the full request, the time the call
+took and the response. Replay looks responses up by session and turn rather
+than by the full request, since tool results such as timings differ from run
+to run.
+"""
+import asyncio
+import gzip
+import hashlib
+import json
+import time
+from collections import defaultdict
+from types import SimpleNamespace
+
+
+class ModelBackend:
+    """Base for backends that stand in for a genai.Client."""
+
+    def __init__(self):
+        self.aio = SimpleNamespace(models=self)
+
+    async def generate_content(self, model, contents, config=None):
+        raise NotImplementedError
+
+    async def generate_content_stream(self, model, contents, config=None):
+        # like the SDK, awaiting this returns an async iterator of chunks
+        response = await self.generate_content(model=model, contents=contents, config=config)
+        return _iterate(split_response(response))
+
+
+class ReplayError(Exception):
+    pass
+
+
+class RecordingBackend(ModelBackend):
+    """Passes calls through to `client` and appends each exchange to a cassette."""
+
+    def __init__(self, client, path):
+        super().__init__()
+        self.client = client
+        self.path = path
+        self.recorded = 0
+        # start a fresh cassette; every exchange is appended as soon as it happens
+        _open_cassette(path, "wt").close()
+
+    async def generate_content(self, model, contents, config=None):
+        start = time.perf_counter()
+        response = await self.client.aio.models.generate_content(model=model, contents=contents, config=config)
+        self._record(model, contents, config, start, response)
+        return response
+
+    async def generate_content_stream(self, model, contents, config=None):
+        start = time.perf_counter()
+        stream = await self.client.aio.models.generate_content_stream(model=model, contents=contents, config=config)
+        return self._record_stream(stream, model, contents, config, start)
+
+    async def _record_stream(self, stream, model, contents, config, start):
+        chunks = []
+        async for chunk in stream:
+            chunks.append(chunk)
+            yield chunk
+        self._record(model, contents, config, start, merge_stream(chunks))
+
+    def _record(self, model, contents, config, start, response):
+        entry = {
+            "session": session_key(contents),
+            "turn": len(contents),
+            "request": request_hash(model, contents, config),
+            "latency": round(time.perf_counter() - start, 4),
+            "response": response.model_dump(
+                mode="json", exclude_none=True, include={"candidates", "usage_metadata", "model_version"}
+            ),
+        }
+        with _open_cassette(self.path, "at") as f:
+            f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        self.recorded += 1
+
+
+class ReplayBackend(ModelBackend):
+    """Serves the responses of a cassette without touching the network.
+
+    `latency` is None for no delay, a number of seconds added to every call,
+    or "recorded" to wait as long as the original call took. With `strict`,
+    a request that differs from the recorded one raises ReplayError instead
+    of being counted in `mismatches`.
+    """
+
+    def __init__(self, path, latency=None, strict=False):
+        super().__init__()
+        self.latency = latency
+        self.strict = strict
+        self.replayed = 0
+        self.mismatches = 0
+        self._entries = defaultdict(list)  # (session, turn) -> entries in recorded order
+        with _open_cassette(path, "rt") as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self._entries[(entry["session"], entry["turn"])].append(entry)
+
+    async def generate_content(self, model, contents, config=None):
+        key = (session_key(contents), len(contents))
+        entries = self._entries.get(key)
+        if not entries:
+            raise ReplayError(f"no recorded response for session {key[0]} turn {key[1]}")
+        # the same prompt recorded more than once is served in order, then the last one repeats
+        entry = entries.pop(0) if len(entries) > 1 else entries[0]
+
+        if entry["request"] != request_hash(model, contents, config):
+            if self.strict:
+                raise ReplayError(f"request for session {key[0]} turn {key[1]} differs from the recording")
+            self.mismatches += 1
+
+        delay = entry.get("latency", 0.0) if self.latency == "recorded" else self.latency
+        if delay:
+            await asyncio.sleep(delay)
+        self.replayed += 1
+        from google.genai import types
+
+        return types.GenerateContentResponse.model_validate(entry["response"])
+
+
+def merge_stream(chunks):
+    """The single response a stream of chunks adds up to.
+
+    Parts are kept in order, with runs of plain text joined into one part.
+    Usage, finish reason and model version come from the last chunk that has
+    them, since the API reports running totals.
+    """
+    from google.genai import types
+
+    parts = []
+    finish_reason = None
+    for chunk in chunks:
+        if not chunk.candidates:
+            continue
+        candidate = chunk.candidates[0]
+        finish_reason = candidate.finish_reason or finish_reason
+        for part in (candidate.content.parts if candidate.content else None) or []:
+            if parts and _is_plain_text(part) and _is_plain_text(parts[-1]):
+                parts[-1] = types.Part(text=parts[-1].text + part.text)
+            else:
+                parts.append(part)
+
+    usage = next((chunk.usage_metadata for chunk in reversed(chunks) if chunk.usage_metadata), None)
+    model_version = next((chunk.model_version for chunk in reversed(chunks) if chunk.model_version), None)
+    candidates = [types.Candidate(content=types.Content(role="model", parts=parts), finish_reason=finish_reason)]
+    return types.GenerateContentResponse(
+        candidates=candidates if parts or finish_reason else None,
+        usage_metadata=usage,
+        model_version=model_version,
+    )
+
+
+def split_response(response):
+    """Chunks that stream `response` one part at a time, usage on the last one."""
+    from google.genai import types
+
+    candidate = response.candidates[0] if response.candidates else None
+    parts = (candidate.content.parts if candidate and candidate.content else None) or []
+    if not parts:
+        return [response]
+    chunks = [
+        types.GenerateContentResponse(candidates=[types.Candidate(content=types.Content(role="model", parts=[part]))])
+        for part in parts
+    ]
+    chunks[-1].candidates[0].finish_reason = candidate.finish_reason
+    chunks[-1].usage_metadata = response.usage_metadata
+    chunks[-1].model_version = response.model_version
+    return chunks
+
+
+def session_key(contents):
+    first = contents[0].parts[0].text if contents and contents[0].parts else ""
+    return hashlib.sha256((first or "").encode()).hexdigest()[:16]
+
+
+def request_hash(model, contents, config):
+    request = {
+        "model": model,
+        "contents": [content.model_dump(mode="json", exclude_none=True) for content in contents],
+        "config": config.model_dump(mode="json", exclude_none=True) if config is not None else None,
+    }
+    return hashlib.sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def replay_latency(value):
+    # argparse type for --replay-latency: seconds or "recorded"
+    return value if value == "recorded" else float(value)
+
+
+def _is_plain_text(part):
+    return part.text is not None and part.model_fields_set <= {"text"}
+
+
+async def _iterate(items):
+    for item in items:
+        yield item
+
+
+def _open_cassette(path, mode):
+    if path.endswith(".gz"):
+        return gzip.open(path, mode, encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
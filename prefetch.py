@@ -0,0 +1,236 @@
+import fnmatch
+import os
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from config import (
+    PREFETCH_MODE,
+    PREFETCH_MAX_FILES,
+    PREFETCH_MAX_FILE_BYTES,
+    PREFETCH_BUFFER_BYTES,
+    PREFETCH_PREVIEW_LINES,
+)
+
+
+PREFETCH_MODES = ("off", "buffer", "inline")
+
+# a file entry of a get_files_info listing
+LISTING_ENTRY = re.compile(r"^- (.+): file_size=(\d+) bytes, is_dir=False$", re.MULTILINE)
+
+# how likely a file is to be read right after a listing that shows it; the
+# first matching pattern wins and files matching none are not prefetched
+LIKELY_READS = (
+    ("main.py", 10),
+    ("README*", 9),
+    ("tests.py", 8),
+    ("app.py", 7),
+    ("config.py", 6),
+    ("test_*.py", 6),
+    ("pyproject.toml", 5),
+    ("setup.py", 5),
+    ("requirements*.txt", 4),
+    ("*.py", 4),
+    ("*.md", 2),
+    ("*.toml", 1),
+    ("*.cfg", 1),
+    ("*.txt", 1),
+)
+
+
+class Prefetcher:
+    """Reads the files a listing makes likely next reads before they are asked for.
+
+    After a get_files_info listing, the most likely small files in it are
+    read in the background with get_file_content into a bounded buffer. A
+    later plain read of one of them is served from the buffer if the file's
+    mtime and size still match. In "inline" mode the files are read right
+    away, and the first lines of each are appended to the listing itself, so
+    the model may not need another turn to read them at all.
+    """
+
+    def __init__(
+        self,
+        mode=PREFETCH_MODE,
+        max_files=PREFETCH_MAX_FILES,
+        max_file_bytes=PREFETCH_MAX_FILE_BYTES,
+        max_bytes=PREFETCH_BUFFER_BYTES,
+        preview_lines=PREFETCH_PREVIEW_LINES,
+    ):
+        self.configure(mode)
+        self.max_files = max_files
+        self.max_file_bytes = max_file_bytes
+        self.max_bytes = max_bytes
+        self.preview_lines = preview_lines
+        self.prefetched = 0
+        self.bytes_prefetched = 0
+        self.hits = 0
+        self.misses = 0
+        self.unused = 0  # prefetched entries evicted or invalidated before any read
+        self._entries = OrderedDict()  # (working dir, path) -> [mtime_ns, size, output, used]
+        self._pending = {}  # (working dir, path) -> Future of a read in flight
+        self._bytes = 0
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def configure(self, mode):
+        if mode not in PREFETCH_MODES:
+            raise ValueError(f"prefetch mode must be one of {', '.join(PREFETCH_MODES)}, not {mode!r}")
+        self.mode = mode
+
+    def after_listing(self, working_directory, directory, output):
+        """Start prefetching the likely reads of a listing; returns the output
+        to give the model, which has previews appended in inline mode."""
+        if self.mode == "off" or not isinstance(output, str) or output.startswith("Error"):
+            return output
+        paths = self._likely_reads(directory or ".", output)
+        if not paths:
+            return output
+
+        futures = [self._schedule(working_directory, path) for path in paths]
+        if self.mode != "inline":
+            return output
+        previews = []
+        for path, future in zip(paths, futures):
+            content = future.result()
+            if content is not None:
+                previews.append(self._preview(path, content))
+        if not previews:
+            return output
+        return (
+            output
+            + f"\n\nPreviews of files you are likely to read next (up to {self.preview_lines} lines each;"
+            + " get_file_content returns the rest):\n"
+            + "\n".join(previews)
+        )
+
+    def take(self, working_directory, file_path):
+        """The prefetched get_file_content output of `file_path`, or None."""
+        if self.mode == "off":
+            return None
+        key = _key(working_directory, file_path)
+        with self._lock:
+            future = self._pending.get(key)
+        if future is not None:
+            # already being read; waiting for it beats reading it twice
+            future.result()
+
+        fingerprint = _stat(key[0], key[1])
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or fingerprint is None or tuple(entry[:2]) != fingerprint:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            entry[3] = True
+            self.hits += 1
+            return entry[2]
+
+    def invalidate(self, working_directory, path):
+        # a write through the tools replaced the file
+        with self._lock:
+            self._drop(_key(working_directory, path))
+
+    def clear(self, working_directory=None):
+        # everything, or only the entries of one working directory
+        absolute_working_dir = os.path.abspath(working_directory) if working_directory is not None else None
+        with self._lock:
+            for key in list(self._entries):
+                if absolute_working_dir is None or key[0] == absolute_working_dir:
+                    self._drop(key)
+
+    def stats(self):
+        with self._lock:
+            reads = self.hits + self.misses
+            return {
+                "mode": self.mode,
+                "prefetched": self.prefetched,
+                "bytes_prefetched": self.bytes_prefetched,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / reads, 3) if reads else 0.0,
+                "unused": self.unused,
+                "buffered_bytes": self._bytes,
+            }
+
+    def _likely_reads(self, directory, output):
+        candidates = []
+        for match in LISTING_ENTRY.finditer(output):
+            entry_path, size = match.group(1), int(match.group(2))
+            if not 0 < size <= self.max_file_bytes:
+                continue
+            name = entry_path.rsplit("/", 1)[-1]
+            score = next((score for pattern, score in LIKELY_READS if fnmatch.fnmatch(name, pattern)), 0)
+            if score:
+                # files deeper in a recursive listing are less likely to be wanted first
+                path = os.path.normpath(os.path.join(directory, entry_path))
+                candidates.append((-(score - entry_path.count("/")), size, path))
+        return [path for _, _, path in sorted(candidates)[:self.max_files]]
+
+    def _schedule(self, working_directory, path):
+        key = _key(working_directory, path)
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="prefetch")
+            future = self._pool.submit(self._read, working_directory, path, key)
+            self._pending[key] = future
+            return future
+
+    def _read(self, working_directory, path, key):
+        # returns the file's get_file_content output, kept only if the file did not change meanwhile
+        from functions.get_file_content import get_file_content
+
+        try:
+            with self._lock:
+                entry = self._entries.get(key)
+            before = _stat(*key)
+            if entry is not None and tuple(entry[:2]) == before:
+                return entry[2]
+            output = get_file_content(working_directory, path)
+            if before is None or output.startswith("Error") or _stat(*key) != before:
+                return None
+            with self._lock:
+                self._drop(key)
+                self._entries[key] = [*before, output, False]
+                self._bytes += len(output)
+                self.prefetched += 1
+                self.bytes_prefetched += len(output)
+                while self._bytes > self.max_bytes and len(self._entries) > 1:
+                    self._drop(next(iter(self._entries)))
+            return output
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def _drop(self, key):
+        # callers hold the lock
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[2])
+            if not entry[3]:
+                self.unused += 1
+
+    def _preview(self, path, content):
+        lines = content.splitlines()
+        if len(lines) <= self.preview_lines:
+            return f"--- {path} (whole file, {len(lines)} lines) ---\n{content.rstrip()}"
+        shown = "\n".join(lines[:self.preview_lines])
+        return f"--- {path} (first {self.preview_lines} of {len(lines)} lines) ---\n{shown}"
+
+
+def _key(working_directory, path):
+    return os.path.abspath(working_directory), os.path.normpath(path)
+
+
+def _stat(absolute_working_dir, path):
+    try:
+        stat = os.stat(os.path.join(absolute_working_dir, path))
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+prefetcher = Prefetcher()
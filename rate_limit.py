@@ -0,0 +1,261 @@
+import asyncio
+import random
+import re
+import time
+
+from compaction import estimate_tokens
+from model_backend import ModelBackend
+from config import (
+    MODEL_REQUESTS_PER_MINUTE,
+    MODEL_TOKENS_PER_MINUTE,
+    MODEL_MAX_CONCURRENCY,
+    MODEL_MAX_RETRIES,
+    MODEL_RETRY_BASE_DELAY,
+    MODEL_RETRY_MAX_DELAY,
+)
+
+
+# HTTP codes worth another try; 429 and 503 also mean we are sending too much
+RETRYABLE_CODES = {429, 500, 502, 503, 504}
+THROTTLE_CODES = {429, 503}
+
+
+class TokenBucket:
+    """Allows `rate_per_minute` units a minute, in bursts of up to `capacity`.
+
+    Waiters are served in arrival order. A rate of None means unlimited.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate_per_minute = rate_per_minute
+        self.capacity = capacity or rate_per_minute
+        self.available = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self, amount=1):
+        if self.rate_per_minute is None:
+            return
+        # a request larger than the whole bucket waits for a full bucket
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            while True:
+                self._refill()
+                if self.available >= amount:
+                    self.available -= amount
+                    return
+                await asyncio.sleep((amount - self.available) * 60 / self.rate_per_minute)
+
+    def adjust(self, amount):
+        # settle the difference once the real cost is known; may go negative
+        if self.rate_per_minute is not None:
+            self._refill()
+            self.available -= amount
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self._updated) * self.rate_per_minute / 60)
+        self._updated = now
+
+
+class AdaptiveConcurrency:
+    """Caps calls in flight, halving the cap on throttling and adding one back
+    after every `limit` successful calls in a row.
+    """
+
+    def __init__(self, maximum, minimum=1, cooldown=1.0):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = maximum
+        self.in_flight = 0
+        self.cooldown = cooldown
+        self._successes = 0
+        self._last_decrease = float("-inf")
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def release(self, throttled=False):
+        async with self._condition:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if throttled:
+                self._successes = 0
+                # calls already in flight when the limit was hit fail together; count them once
+                if now - self._last_decrease >= self.cooldown:
+                    self.limit = max(self.minimum, self.limit // 2)
+                    self._last_decrease = now
+            else:
+                self._successes += 1
+                if self._successes >= self.limit and self.limit < self.maximum:
+                    self.limit += 1
+                    self._successes = 0
+            self._condition.notify_all()
+
+
+class RateLimiter:
+    """Shared throttle and retry policy for every model call of a process.
+
+    Each call waits for a request slot, its estimated tokens and a
+    concurrency slot. Throttling and transient server errors are retried with
+    jittered exponential backoff, and a retry-after hint from the API pauses
+    all callers, not just the one that hit it.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute=MODEL_REQUESTS_PER_MINUTE,
+        tokens_per_minute=MODEL_TOKENS_PER_MINUTE,
+        max_concurrency=MODEL_MAX_CONCURRENCY,
+        max_retries=MODEL_MAX_RETRIES,
+        base_delay=MODEL_RETRY_BASE_DELAY,
+        max_delay=MODEL_RETRY_MAX_DELAY,
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.concurrency = AdaptiveConcurrency(max_concurrency)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self._paused_until = 0.0
+
+    async def call(self, make_call, estimated_tokens=0):
+        """Run `make_call()` under the limits, retrying until it succeeds or
+        the retry budget is spent. `estimated_tokens` is charged up front and
+        corrected by the response's usage metadata."""
+        for attempt in range(self.max_retries + 1):
+            pause = self._paused_until - time.monotonic()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            await self.requests.acquire(1)
+            await self.tokens.acquire(estimated_tokens)
+            await self.concurrency.acquire()
+
+            self.calls += 1
+            error = None
+            try:
+                response = await make_call()
+            except Exception as e:
+                error = e
+            finally:
+                throttled = _error_code(error) in THROTTLE_CODES
+                await self.concurrency.release(throttled)
+
+            if error is None:
+                usage = getattr(response, "usage_metadata", None)
+                if usage is not None and usage.total_token_count:
+                    self.tokens.adjust(usage.total_token_count - estimated_tokens)
+                return response
+
+            if throttled:
+                self.throttled += 1
+            if attempt == self.max_retries or not _is_retryable(error):
+                raise error
+            retry_after = _retry_after(error)
+            if retry_after is not None:
+                self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            self.retries += 1
+            await asyncio.sleep(self._backoff(attempt, retry_after))
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "concurrency_limit": self.concurrency.limit,
+        }
+
+    def _backoff(self, attempt, retry_after):
+        # full jitter keeps callers that failed together from retrying together
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if retry_after is not None:
+            return retry_after + delay / 2
+        return delay
+
+
+class RateLimitedClient(ModelBackend):
+    """Stands in for a genai.Client, sending `aio.models.generate_content`
+    through a RateLimiter that can be shared by several clients."""
+
+    def __init__(self, client, limiter=None):
+        super().__init__()
+        self.client = client
+        self.limiter = limiter or RateLimiter()
+
+    async def generate_content(self, model, contents, config=None):
+        return await self.limiter.call(
+            lambda: self.client.aio.models.generate_content(model=model, contents=contents, config=config),
+            estimate_tokens(contents),
+        )
+
+    async def generate_content_stream(self, model, contents, config=None):
+        """Open a stream under the limiter. Opening it, up to the first chunk,
+        is retried like any call; a stream that breaks later is not, since
+        its chunks have already been handed out."""
+        estimated_tokens = estimate_tokens(contents)
+
+        async def open_stream():
+            stream = await self.client.aio.models.generate_content_stream(model=model, contents=contents, config=config)
+            return await anext(stream, None), stream
+
+        first, stream = await self.limiter.call(open_stream, estimated_tokens)
+        return self._resume(first, stream, estimated_tokens)
+
+    async def _resume(self, first, stream, estimated_tokens):
+        usage = None
+        if first is not None:
+            usage = first.usage_metadata
+            yield first
+            async for chunk in stream:
+                usage = chunk.usage_metadata or usage
+                yield chunk
+        # the limiter only saw the opening call; settle the token estimate here
+        if usage is not None and usage.total_token_count:
+            self.limiter.tokens.adjust(usage.total_token_count - estimated_tokens)
+
+
+# these import the SDK and httpx only once a call has failed, by when both are loaded anyway
+def _error_code(error):
+    if error is None:
+        return None
+    from google.genai import errors
+
+    return error.code if isinstance(error, errors.APIError) else None
+
+
+def _is_retryable(error):
+    import httpx
+    from google.genai import errors
+
+    if isinstance(error, errors.APIError):
+        return error.code in RETRYABLE_CODES
+    return isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError))
+
+
+def _retry_after(error):
+    # seconds the API asked us to wait: a Retry-After header, or the RetryInfo
+    # detail Gemini puts in its error body ("retryDelay": "37s")
+    from google.genai import errors
+
+    if not isinstance(error, errors.APIError):
+        return None
+    headers = getattr(error.response, "headers", None)
+    if headers and headers.get("retry-after"):
+        try:
+            return float(headers["retry-after"])
+        except ValueError:
+            pass
+
+    body = error.details.get("error", error.details) if isinstance(error.details, dict) else {}
+    for detail in body.get("details") or []:
+        if isinstance(detail, dict) and "retryDelay" in detail:
+            match = re.fullmatch(r"([\d.]+)s", str(detail["retryDelay"]))
+            if match:
+                return float(match.group(1))
+    return None
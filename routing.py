@@ -0,0 +1,87 @@
+from compaction import estimate_tokens
+from call_function import EXIT_CODE, READ_ONLY_FUNCTIONS
+from config import FAST_MODEL, STRONG_MODEL, ROUTING_HISTORY_TOKENS, ROUTING_RECHECK_FINAL
+
+
+class ModelRouter:
+    """Picks the model for each iteration of the agent loop.
+
+    Mechanical turns, the ones that follow plain reads or a write, go to
+    `fast_model`. The strong model takes over when there is something to
+    reason about: a tool failed or a script exited non-zero, a script passed
+    after the code was changed (the answer is usually next), the history has
+    grown past `history_tokens`, or a caller asked for it with `escalate`.
+    With `recheck_final`, a final answer from the fast model is thrown away
+    and asked of the strong model instead.
+    """
+
+    def __init__(
+        self,
+        fast_model=FAST_MODEL,
+        strong_model=STRONG_MODEL,
+        history_tokens=ROUTING_HISTORY_TOKENS,
+        recheck_final=ROUTING_RECHECK_FINAL,
+    ):
+        self.fast_model = fast_model
+        self.strong_model = strong_model
+        self.history_tokens = history_tokens
+        self.recheck_final = recheck_final
+        self._escalated_turns = 0
+        self._escalation_reason = None
+
+    def escalate(self, turns=1, reason="escalated"):
+        """Use the strong model for the next `turns` iterations."""
+        self._escalated_turns = max(self._escalated_turns, turns)
+        self._escalation_reason = reason
+
+    def choose(self, messages):
+        """Return (model, reason) for the iteration about to run on `messages`."""
+        if self._escalated_turns:
+            self._escalated_turns -= 1
+            return self.strong_model, self._escalation_reason
+        if estimate_tokens(messages) >= self.history_tokens:
+            return self.strong_model, "long history"
+
+        calls, results = _previous_turn(messages)
+        if not calls:
+            return self.fast_model, "first turn"
+        if any(_failed(result) for result in results):
+            return self.strong_model, "tool failed"
+        if any(call.name in ("run_python_file", "run_tests") for call in calls) and _changed_code(messages):
+            return self.strong_model, "verified change"
+        if all(call.name in READ_ONLY_FUNCTIONS for call in calls):
+            return self.fast_model, "reads"
+        return self.fast_model, "tool turn"
+
+    def should_recheck(self, model):
+        # a final answer the strong model should write instead
+        return self.recheck_final and model != self.strong_model
+
+
+def _previous_turn(messages):
+    # the model's last function calls and the responses that answered them
+    if len(messages) < 2:
+        return [], []
+    calls = [part.function_call for part in messages[-2].parts or [] if part.function_call]
+    results = [part.function_response.response for part in messages[-1].parts or [] if part.function_response]
+    return calls, results
+
+
+def _failed(response):
+    if not response or "error" in response:
+        return True
+    result = response.get("result")
+    if not isinstance(result, str):
+        return False
+    if result.startswith("Error"):
+        return True
+    match = EXIT_CODE.search(result)
+    return match is not None and match.group(1) != "0"
+
+
+def _changed_code(messages):
+    return any(
+        part.function_call and part.function_call.name in ("write_file", "edit_file", "write_files", "rollback")
+        for content in messages
+        for part in content.parts or []
+    )
@@ -0,0 +1,157 @@
+"""Sessions on disk, so an interrupted run can pick up where it stopped.
+
+Every session is an append-only JSON lines log, `<id>.jsonl` in SESSION_DIR:
+a "start" record with the prompt and working directory, then one "content"
+record per message, written as soon as the iteration that produced it
+completes, and an "end" record each time a run stops. A resumed run appends
+to the same log, so a crash loses at most the iteration in flight.
+
+String arguments of tool calls and string results of tool responses longer
+than SESSION_BLOB_MIN_CHARS are stored once, gzipped, under blobs/ and named
+by their SHA-256; the log holds {"$blob": digest} in their place. A file read
+in many iterations or many sessions takes its space once.
+"""
+import gzip
+import hashlib
+import json
+import os
+import secrets
+import tempfile
+import time
+
+from config import SESSION_BLOB_MIN_CHARS, SESSION_DIR
+
+# the part fields whose string values may be moved out to blobs
+_BLOB_FIELDS = (("function_call", "args"), ("function_response", "response"))
+
+
+class SessionStore:
+    """Session logs and the blobs they share, in one directory."""
+
+    def __init__(self, directory=SESSION_DIR, blob_min_chars=SESSION_BLOB_MIN_CHARS):
+        self.directory = directory
+        self.blob_min_chars = blob_min_chars
+
+    def create(self, prompt, working_directory):
+        """Start a new session and return it."""
+        os.makedirs(self.directory, exist_ok=True)
+        session_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{secrets.token_hex(3)}"
+        session = Session(self, session_id, working_directory)
+        session._write({"type": "start", "time": time.time(), "prompt": prompt, "working_directory": working_directory})
+        return session
+
+    def open(self, session_id):
+        """Load a session to resume; "latest" is the most recently written one.
+
+        Raises ValueError when there is no such session.
+        """
+        if session_id == "latest":
+            sessions = self.session_ids()
+            if not sessions:
+                raise ValueError(f"no sessions in {self.directory}")
+            session_id = sessions[-1]
+        path = os.path.join(self.directory, f"{session_id}.jsonl")
+        if not os.path.isfile(path):
+            raise ValueError(f"no session {session_id} in {self.directory}")
+
+        session = Session(self, session_id, None)
+        with open(path, "rb+") as f:
+            valid_bytes = 0
+            for line in f:
+                try:
+                    record = json.loads(line) if line.endswith(b"\n") else None
+                except json.JSONDecodeError:
+                    record = None
+                if record is None:
+                    # the last line of a run killed mid-write; cut it off so appends start clean
+                    f.truncate(valid_bytes)
+                    break
+                valid_bytes += len(line)
+                if record["type"] == "start":
+                    session.working_directory = record["working_directory"]
+                elif record["type"] == "content":
+                    session.messages.append(self._decode(record["content"]))
+        session.saved = len(session.messages)
+        return session
+
+    def session_ids(self):
+        """Every session in the store, oldest first by last write."""
+        if not os.path.isdir(self.directory):
+            return []
+        logs = [entry for entry in os.scandir(self.directory) if entry.is_file() and entry.name.endswith(".jsonl")]
+        return [entry.name[: -len(".jsonl")] for entry in sorted(logs, key=lambda entry: entry.stat().st_mtime)]
+
+    def put_blob(self, text):
+        """Store `text` once and return its digest."""
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        path = self._blob_path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # written aside and renamed, so a blob is either whole or missing
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+            with os.fdopen(fd, "wb") as f:
+                f.write(gzip.compress(text.encode("utf-8")))
+            os.replace(temp_path, path)
+        return digest
+
+    def get_blob(self, digest):
+        with open(self._blob_path(digest), "rb") as f:
+            return gzip.decompress(f.read()).decode("utf-8")
+
+    def _blob_path(self, digest):
+        return os.path.join(self.directory, "blobs", digest[:2], digest)
+
+    def _encode(self, content):
+        data = content.model_dump(mode="json", exclude_none=True)
+        for part in data.get("parts", []):
+            for field_name, values_name in _BLOB_FIELDS:
+                values = part.get(field_name, {}).get(values_name)
+                for key, value in (values or {}).items():
+                    if isinstance(value, str) and len(value) >= self.blob_min_chars:
+                        values[key] = {"$blob": self.put_blob(value)}
+        return data
+
+    def _decode(self, data):
+        from google.genai import types
+
+        for part in data.get("parts", []):
+            for field_name, values_name in _BLOB_FIELDS:
+                values = part.get(field_name, {}).get(values_name)
+                for key, value in (values or {}).items():
+                    if isinstance(value, dict) and value.keys() == {"$blob"}:
+                        values[key] = self.get_blob(value["$blob"])
+        return types.Content.model_validate(data)
+
+
+class Session:
+    """One conversation's log. `messages` holds the history loaded from it and
+    `saved` how many messages are already in the log."""
+
+    def __init__(self, store, session_id, working_directory):
+        self.store = store
+        self.id = session_id
+        self.working_directory = working_directory
+        self.path = os.path.join(store.directory, f"{session_id}.jsonl")
+        self.messages = []
+        self.saved = 0
+
+    def append(self, messages):
+        """Log the messages of `messages` that are not saved yet."""
+        if len(messages) <= self.saved:
+            return
+        self._write(*({"type": "content", "content": self.store._encode(content)} for content in messages[self.saved:]))
+        self.saved = len(messages)
+
+    def end(self, outcome, stats):
+        self._write({
+            "type": "end",
+            "time": time.time(),
+            "outcome": outcome,
+            "iterations": stats.iterations,
+            "prompt_tokens": stats.prompt_tokens,
+            "response_tokens": stats.response_tokens,
+        })
+
+    def _write(self, *records):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records))
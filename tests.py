@@ -1,4 +1,43 @@
-from functions.run_python import run_python_file
+import asyncio
+import contextlib
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from google.genai import errors, types
+
+from batch import format_summary, run_batch
+from functions.checkpoint import drop_checkpoints
+from functions.code_outline import get_file_outline, get_symbol
+from functions import get_file_content as get_file_content_module
+from functions.edit_file import edit_file
+from functions.get_file_content import get_file_content
+from functions import get_files_info as get_files_info_module
+from functions.get_files_info import get_files_info
+from functions.output_capture import OutputWindow
+from functions import run_python as run_python_module
+from functions.run_python import run_python_file, run_python_file_async
+from functions.run_tests import run_tests
+from functions.search_code import search_code, update_search_index
+from functions import write_file as write_file_module
+from functions.write_file import write_file, write_files
+import call_function as call_function_module
+from call_function import TOOL_MODULES, call_function, call_functions
+from compaction import compact_messages, estimate_tokens
+from main import AgentStats, generate_config, run_agent
+from prefetch import prefetcher
+from model_backend import ModelBackend, RecordingBackend, ReplayBackend, split_response
+from rate_limit import RateLimitedClient, RateLimiter, TokenBucket
+from routing import ModelRouter
+from session_store import SessionStore
+import tool_cache as tool_cache_module
+from tool_cache import ToolCache
+from tracing import tracer
 
 
 def test():
@@ -22,5 +61,1067 @@ def test():
     print(result)
     print("==================================================")
 
+    # same output either way, apart from the timing summary on the last line
+    result = asyncio.run(run_python_file_async("calculator", "main.py", ["3 + 5"]))
+    assert result.splitlines()[:-1] == run_python_file("calculator", "main.py", ["3 + 5"]).splitlines()[:-1]
+    print(result)
+    print("==================================================")
+
+
+class FakeAsyncModels:
+    # replays canned responses and remembers what the agent sent
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    async def generate_content(self, model, contents, config=None):
+        self.requests.append(list(contents))
+        await asyncio.sleep(0)
+        return self.responses.pop(0)
+
+
+class FakeAsyncClient:
+    def __init__(self, responses):
+        self.aio = type("FakeAio", (), {})()
+        self.aio.models = FakeAsyncModels(responses)
+
+
+def fake_response(*parts):
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(content=types.Content(role="model", parts=list(parts)))],
+        usage_metadata=types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=10,
+            candidates_token_count=5,
+        ),
+    )
+
+
+def test_agent_loop():
+    client = FakeAsyncClient([
+        fake_response(
+            types.Part(function_call=types.FunctionCall(name="get_files_info", args={})),
+            types.Part(function_call=types.FunctionCall(name="run_python_file", args={"file_path": "main.py", "args": ["3 + 5"]})),
+        ),
+        fake_response(types.Part(text="The calculator prints 8.")),
+    ])
+    messages = [types.Content(role="user", parts=[types.Part(text="what does 3 + 5 give?")])]
+
+    final_response = asyncio.run(run_agent(client, messages))
+    assert final_response == "The calculator prints 8."
+
+    # user prompt, function calls, function results, final answer
+    assert [message.role for message in messages] == ["user", "model", "user", "model"]
+    function_results = [part.function_response for part in messages[2].parts]
+    assert [result.name for result in function_results] == ["get_files_info", "run_python_file"]
+    assert "8" in function_results[1].response["result"]
+    assert len(client.aio.models.requests) == 2
+    print(final_response)
+    print("==================================================")
+
+
+class NoteTakingModels:
+    # writes the prompt to a file, reads it back and answers with what it read
+    def __init__(self):
+        self.active = 0
+        self.max_active = 0
+
+    async def generate_content(self, model, contents, config=None):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        await asyncio.sleep(0.01)
+        self.active -= 1
+
+        if len(contents) == 1:
+            args = {"file_path": "note.txt", "content": contents[0].parts[0].text}
+            return fake_response(types.Part(function_call=types.FunctionCall(name="write_file", args=args)))
+        if len(contents) == 3:
+            args = {"file_path": "note.txt"}
+            return fake_response(types.Part(function_call=types.FunctionCall(name="get_file_content", args=args)))
+        return fake_response(types.Part(text=contents[-1].parts[0].function_response.response["result"]))
+
+
+def test_call_scheduler():
+    spans = []  # (tool, path, start, end) of every call
+
+    def slow_tool(name):
+        def tool(working_directory, file_path, content=None):
+            start = time.perf_counter()
+            time.sleep(0.1)
+            spans.append((name, file_path, start, time.perf_counter()))
+            return f"{name} {file_path}"
+        return tool
+
+    calls = [
+        ("get_file_content", "a.py"),
+        ("get_file_content", "b.py"),
+        ("write_file", "a.py"),
+        ("get_file_content", "a.py"),
+        ("write_file", "c.py"),
+    ]
+    originals = dict(call_function_module.function_map)
+    call_function_module.function_map.update({name: slow_tool(name) for name in ("get_file_content", "write_file")})
+    try:
+        with tempfile.TemporaryDirectory() as working_directory:
+            parts = [
+                types.FunctionCall(name=name, args={"file_path": path, **({"content": "x"} if name == "write_file" else {})})
+                for name, path in calls
+            ]
+            start = time.perf_counter()
+            results = call_functions(parts, working_directory=working_directory)
+            elapsed = time.perf_counter() - start
+    finally:
+        call_function_module.function_map.update(originals)
+
+    # results come back in call order
+    assert [result.parts[0].function_response.response["result"] for result in results] == [
+        f"{name} {path}" for name, path in calls
+    ]
+    timeline = sorted(spans, key=lambda span: span[2])
+    first_read_a, read_b = [span for span in timeline if span[0] == "get_file_content"][:2]
+    write_a = next(span for span in timeline if span[:2] == ("write_file", "a.py"))
+    second_read_a = [span for span in timeline if span[:2] == ("get_file_content", "a.py")][1]
+    write_c = next(span for span in timeline if span[:2] == ("write_file", "c.py"))
+
+    # reads of different files, and a write to an unrelated file, overlap
+    assert read_b[2] < first_read_a[3] and first_read_a[2] < read_b[3]
+    assert write_c[2] < first_read_a[3]
+    # a write waits for the earlier read of its file, and the later read waits for the write
+    assert write_a[2] >= first_read_a[3]
+    assert second_read_a[2] >= write_a[3]
+    assert elapsed < 0.45, elapsed
+    print(f"{len(calls)} calls in {elapsed:.2f}s")
+    print("==================================================")
+
+
+def test_batch():
+    client = FakeAsyncClient([])
+    client.aio.models = NoteTakingModels()
+    tasks = [{"id": str(i), "prompt": f"note {i}"} for i in range(6)]
+    results = io.StringIO()
+
+    with tempfile.TemporaryDirectory() as working_directory:
+        for task in tasks:
+            task["working_directory"] = working_directory
+        summary = asyncio.run(run_batch(client, tasks, results, concurrency=2))
+
+    lines = [json.loads(line) for line in results.getvalue().splitlines()]
+    # every task saw only its own note, each in its own working directory copy
+    assert sorted((line["id"], line["final_text"]) for line in lines) == [(str(i), f"note {i}") for i in range(6)]
+    assert all(line["iterations"] == 3 and line["prompt_tokens"] == 30 for line in lines)
+    assert client.aio.models.max_active == 2
+    assert summary["ok"] == 6 and summary["tokens"] == 6 * 45
+    print(format_summary(summary))
+    print("==================================================")
+
+
+class ThrottlingModels:
+    # answers with 429s and a retry hint for the first `failures` calls
+    def __init__(self, failures):
+        self.failures = failures
+        self.calls = 0
+
+    async def generate_content(self, model, contents, config=None):
+        self.calls += 1
+        await asyncio.sleep(0.01)
+        if self.failures:
+            self.failures -= 1
+            raise errors.ClientError(429, {"error": {
+                "code": 429,
+                "status": "RESOURCE_EXHAUSTED",
+                "details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": "0.05s"}],
+            }})
+        if contents[0].parts[0].text == "bad request":
+            raise errors.ClientError(400, {"error": {"code": 400, "status": "INVALID_ARGUMENT"}})
+        return fake_response(types.Part(text="ok"))
+
+
+def test_rate_limiter():
+    async def run():
+        limiter = RateLimiter(requests_per_minute=6000, tokens_per_minute=None, max_concurrency=4, base_delay=0.01, max_delay=0.05)
+        fake_client = FakeAsyncClient([])
+        fake_client.aio.models = ThrottlingModels(failures=3)
+        client = RateLimitedClient(fake_client, limiter)
+        contents = [types.Content(role="user", parts=[types.Part(text="hi")])]
+
+        # throttled calls are retried after the hinted delay and the limit shrinks
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(client.aio.models.generate_content(model="m", contents=contents) for _ in range(4)))
+        assert [response.text for response in responses] == ["ok"] * 4
+        assert time.perf_counter() - start >= 0.05
+        assert limiter.throttled == 3 and limiter.retries == 3
+        assert limiter.concurrency.limit < 4
+
+        # and grows back once calls succeed again
+        for _ in range(10):
+            await client.aio.models.generate_content(model="m", contents=contents)
+        assert limiter.concurrency.limit == 4
+
+        # client errors other than throttling are not retried
+        calls = fake_client.aio.models.calls
+        bad = [types.Content(role="user", parts=[types.Part(text="bad request")])]
+        try:
+            await client.aio.models.generate_content(model="m", contents=bad)
+            assert False, "expected a ClientError"
+        except errors.ClientError as e:
+            assert e.code == 400
+        assert fake_client.aio.models.calls == calls + 1
+
+        # 20 requests a second with no burst: the third waits ~0.1s
+        bucket = TokenBucket(rate_per_minute=1200, capacity=1)
+        start = time.perf_counter()
+        for _ in range(3):
+            await bucket.acquire()
+        assert time.perf_counter() - start >= 0.09
+        return limiter.stats()
+
+    stats = asyncio.run(run())
+    print(stats)
+    print("==================================================")
+
+
+def test_record_replay():
+    def session():
+        return [types.Content(role="user", parts=[types.Part(text="what does 3 + 5 give?")])]
+
+    with tempfile.TemporaryDirectory() as cassette_dir:
+        cassette = f"{cassette_dir}/session.jsonl.gz"
+        live = FakeAsyncClient([
+            fake_response(types.Part(function_call=types.FunctionCall(name="run_python_file", args={"file_path": "main.py", "args": ["3 + 5"]}))),
+            fake_response(types.Part(text="The calculator prints 8.")),
+        ])
+        recorder = RecordingBackend(live, cassette)
+        assert asyncio.run(run_agent(recorder, session())) == "The calculator prints 8."
+        assert recorder.recorded == 2
+
+        # the replay runs the same tools and answers the same, with no live client
+        replay = ReplayBackend(cassette, latency=0.02)
+        messages = session()
+        start = time.perf_counter()
+        final_response = asyncio.run(run_agent(replay, messages))
+        assert final_response == "The calculator prints 8."
+        assert time.perf_counter() - start >= 0.04
+        assert "8" in messages[2].parts[0].function_response.response["result"]
+        assert replay.replayed == 2
+
+        # a prompt that was never recorded fails the run instead of going online
+        stats = AgentStats()
+        other = [types.Content(role="user", parts=[types.Part(text="something else")])]
+        assert asyncio.run(run_agent(replay, other, stats=stats)) is None
+        assert stats.error.startswith("no recorded response for session")
+    print(final_response)
+    print("==================================================")
+
+
+def test_session_store():
+    def read(file_path):
+        return types.Part(function_call=types.FunctionCall(name="get_file_content", args={"file_path": file_path}))
+
+    with tempfile.TemporaryDirectory() as session_dir:
+        store = SessionStore(session_dir, blob_min_chars=100)
+        session = store.create("what does the calculator do?", "calculator")
+        messages = [types.Content(role="user", parts=[types.Part(text="what does the calculator do?")])]
+        session.append(messages)
+
+        # the budget runs out after reading the same file twice
+        client = FakeAsyncClient([fake_response(read("main.py"), read("main.py"))])
+        assert asyncio.run(run_agent(client, messages, working_directory="calculator", session=session, max_iterations=1)) is None
+        with open(session.path, encoding="utf-8") as f:
+            records = [json.loads(line) for line in f]
+        assert [record["type"] for record in records] == ["start", "content", "content", "content", "end"]
+        assert records[-1]["outcome"] == "max_iterations"
+        # both reads point at one blob instead of holding the file
+        results = [part["function_response"]["response"]["result"] for part in records[3]["content"]["parts"]]
+        assert results[0] == results[1] and set(results[0]) == {"$blob"}
+        assert sum(len(files) for _, _, files in os.walk(os.path.join(session_dir, "blobs"))) == 1
+
+        # a run killed mid-write leaves a partial line, which resuming ignores
+        with open(session.path, "a", encoding="utf-8") as f:
+            f.write('{"type": "cont')
+        resumed = store.open("latest")
+        assert resumed.id == session.id and resumed.working_directory == "calculator"
+        assert [content.model_dump() for content in resumed.messages] == [content.model_dump() for content in messages]
+
+        # the resumed run picks up at the tool results instead of reading the files again
+        client = FakeAsyncClient([fake_response(types.Part(text="It evaluates expressions."))])
+        final_response = asyncio.run(run_agent(client, resumed.messages, session=resumed))
+        assert final_response == "It evaluates expressions."
+        assert len(client.aio.models.requests[0]) == 3
+        assert len(store.open(session.id).messages) == 4
+    print(final_response)
+    print("==================================================")
+
+
+class StreamingModels(ModelBackend):
+    # streams each scripted response a part per chunk and notes whether the
+    # file the first call writes exists before the rest of the stream is sent
+    def __init__(self, responses, written_path):
+        super().__init__()
+        self.responses = list(responses)
+        self.written_path = written_path
+        self.written_mid_stream = []
+
+    async def generate_content_stream(self, model, contents, config=None):
+        return self._stream(self.responses.pop(0))
+
+    async def _stream(self, response):
+        for chunk in split_response(response):
+            yield chunk
+            await asyncio.sleep(0.2)
+            if chunk.function_calls:
+                self.written_mid_stream.append(os.path.exists(self.written_path))
+
+
+def test_streaming():
+    def session():
+        return [types.Content(role="user", parts=[types.Part(text="write some notes")])]
+
+    with tempfile.TemporaryDirectory() as working_directory:
+        cassette = f"{working_directory}/stream.jsonl"
+        live = StreamingModels([
+            fake_response(
+                types.Part(function_call=types.FunctionCall(name="write_file", args={"file_path": "notes.txt", "content": "hi"})),
+                types.Part(text="Writing the notes."),
+            ),
+            fake_response(types.Part(text="Done, "), types.Part(text="notes.txt is written.")),
+        ], f"{working_directory}/notes.txt")
+        # stacked the way create_client stacks a live client
+        client = RateLimitedClient(RecordingBackend(live, cassette))
+        stats = AgentStats()
+        messages = session()
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            final_response = asyncio.run(run_agent(
+                client, messages, working_directory=working_directory, stats=stats, stream=True,
+            ))
+
+        # the write ran while the model was still streaming, and the text was printed as it came
+        assert live.written_mid_stream == [True]
+        assert final_response == "Done, notes.txt is written."
+        assert "Done, notes.txt is written.\n" in output.getvalue()
+        assert [part.text for part in messages[-1].parts] == ["Done, notes.txt is written."]
+        assert stats.prompt_tokens == 20 and stats.response_tokens == 10
+        assert client.limiter.calls == 2
+
+        # the recorded stream replays, streamed again a part per chunk
+        os.remove(f"{working_directory}/notes.txt")
+        with contextlib.redirect_stdout(io.StringIO()):
+            replayed = asyncio.run(run_agent(
+                ReplayBackend(cassette), session(), working_directory=working_directory, stream=True,
+            ))
+        assert replayed == final_response
+        assert os.path.exists(f"{working_directory}/notes.txt")
+    print(final_response)
+    print("==================================================")
+
+
+class RoutedModels(ModelBackend):
+    # serves scripted responses in order, noting the model each was asked of
+    def __init__(self, responses):
+        super().__init__()
+        self.responses = list(responses)
+        self.models = []
+
+    async def generate_content(self, model, contents, config=None):
+        self.models.append(model)
+        return self.responses.pop(0)
+
+
+def test_routing():
+    def call(name, **args):
+        return fake_response(types.Part(function_call=types.FunctionCall(name=name, args=args)))
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        working_directory = shutil.copytree("calculator", f"{temp_dir}/calculator")
+        client = RoutedModels([
+            call("get_file_content", file_path="main.py"),
+            call("run_python_file", file_path="missing.py"),
+            call("write_file", file_path="notes.txt", content="checked"),
+            call("run_python_file", file_path="main.py", args=["3 + 5"]),
+            fake_response(types.Part(text="Fixed.")),
+        ])
+        stats = AgentStats()
+        router = ModelRouter("fast", "strong")
+        messages = [types.Content(role="user", parts=[types.Part(text="fix it")])]
+        final_response = asyncio.run(run_agent(client, messages, working_directory=working_directory, stats=stats, router=router))
+
+    # reads and writes go to the fast model, a failure and the check after a change to the strong one
+    assert final_response == "Fixed."
+    assert client.models == ["fast", "fast", "strong", "fast", "strong"], client.models
+    assert [turn["route"] for turn in stats.turns] == ["first turn", "reads", "tool failed", "tool turn", "verified change"]
+    assert stats.models() == {"fast": 3, "strong": 2}
+    assert all(turn["prompt_tokens"] == 10 and turn["latency"] >= 0 for turn in stats.turns)
+
+    # a final answer from the fast model is asked again of the strong one
+    client = RoutedModels([fake_response(types.Part(text="draft")), fake_response(types.Part(text="answer"))])
+    messages = [types.Content(role="user", parts=[types.Part(text="what is this?")])]
+    assert asyncio.run(run_agent(client, messages, router=ModelRouter("fast", "strong"))) == "answer"
+    assert client.models == ["fast", "strong"]
+    assert [part.text for content in messages for part in content.parts] == ["what is this?", "answer"]
+
+    router.escalate(turns=2)
+    assert [router.choose(messages) for _ in range(3)] == [("strong", "escalated"), ("strong", "escalated"), ("fast", "first turn")]
+    print(stats.turns[-1])
+    print("==================================================")
+
+
+def test_tracing():
+    client = FakeAsyncClient([
+        fake_response(types.Part(function_call=types.FunctionCall(name="run_python_file", args={"file_path": "main.py", "args": ["3 + 5"]}))),
+        fake_response(types.Part(text="The calculator prints 8.")),
+    ])
+    messages = [types.Content(role="user", parts=[types.Part(text="what does 3 + 5 give?")])]
+
+    with tempfile.TemporaryDirectory() as trace_dir:
+        tracer.configure(f"{trace_dir}/trace.jsonl", f"{trace_dir}/metrics.prom")
+        try:
+            asyncio.run(run_agent(client, messages))
+            tracer.write_metrics()
+        finally:
+            tracer.configure()
+        with open(f"{trace_dir}/trace.jsonl") as f:
+            # spans are written as they end; keep the first of each name
+            spans = {}
+            for span in map(json.loads, f):
+                spans.setdefault(span["name"], span)
+        with open(f"{trace_dir}/metrics.prom") as f:
+            metrics = f.read()
+
+    # spans nest session > iteration > model/tool call
+    assert spans["session"]["parent_id"] is None
+    assert spans["session"]["attributes"]["outcome"] == "answered"
+    assert spans["iteration"]["parent_id"] == spans["session"]["span_id"]
+    assert spans["tool_call"]["parent_id"] == spans["iteration"]["span_id"]
+    assert spans["tool_call"]["attributes"]["exit_code"] == 0
+    assert spans["tool_call"]["attributes"]["output_bytes"] > 0
+    assert spans["model_call"]["attributes"]["prompt_tokens"] == 10
+
+    assert 'agent_prompt_tokens_total{span="model_call"} 20' in metrics
+    assert any(
+        line.startswith("agent_span_duration_seconds_count{") and 'exit_code="0",span="tool_call",tool="run_python_file"' in line
+        for line in metrics.splitlines()
+    )
+    assert tracer.span("tool_call") is tracer.span("model_call")  # disabled again: the shared no-op span
+    print(metrics.splitlines()[0])
+    print("==================================================")
+
+
+def test_startup():
+    # importing the agent leaves the Gemini SDK and the tool modules for later
+    loaded = subprocess.run(
+        [sys.executable, "-c", "import sys, main; print(sorted(m for m in sys.modules if m.startswith(('google', 'functions'))))"],
+        capture_output=True, text=True, check=True,
+    ).stdout.strip()
+    assert loaded == "[]", loaded
+
+    # the request config is built once and declares every registered tool
+    config = generate_config()
+    assert config is generate_config()
+    declared = [declaration.name for declaration in config.tools[0].function_declarations]
+    assert declared == list(TOOL_MODULES), declared
+    print(declared)
+    print("==================================================")
+
+
+def test_compaction():
+    def turn(*calls):
+        # the model's calls and the tool responses to them
+        model = types.Content(role="model", parts=[
+            types.Part(function_call=types.FunctionCall(name=name, args=args)) for name, args, _ in calls
+        ])
+        tool = types.Content(role="tool", parts=[
+            types.Part.from_function_response(name=name, response={"result": result}) for name, _, result in calls
+        ])
+        return [model, tool]
+
+    def result(content, position=0):
+        return content.parts[position].function_response.response["result"]
+
+    prompt = types.Content(role="user", parts=[types.Part(text="fix the shapes")])
+    messages = [
+        prompt,
+        *turn(
+            ("get_file_content", {"file_path": "a.py"}, "a" * 2000),
+            ("get_file_content", {"file_path": "b.py"}, "b" * 2000),
+            ("get_file_content", {"file_path": "c.py"}, "c" * 2000),
+            ("get_file_content", {"file_path": "d.py"}, "d" * 2000),
+        ),
+        *turn(("write_file", {"file_path": "./a.py", "content": "x"}, "ok")),
+        *turn(("write_files", {"files": [{"file_path": "b.py", "content": "x"}]}, "ok")),
+        *turn(("edit_file", {"file_path": "c.py", "diff": "..."}, "ok")),
+        *turn(("run_python_file", {"file_path": "main.py"}, "r" * 2000)),
+        *turn(("get_file_content", {"file_path": "d.py"}, "D" * 2000)),
+    ]
+    original = list(messages)
+
+    # stale reads go even when the history is within budget
+    compacted, saved = compact_messages(messages, token_budget=10**6, keep_recent=2)
+    assert [result(compacted[2], i)[:12] for i in range(4)] == [
+        '[read of "a.', '[read of "b.', '[read of "c.', "d" * 12,
+    ]
+    assert saved == estimate_tokens(messages) - estimate_tokens(compacted)
+
+    # over budget, old results are digested but the prompt and the latest messages are not
+    compacted, saved = compact_messages(messages, token_budget=100, keep_recent=2)
+    assert compacted[0] is prompt
+    assert compacted[-2:] == messages[-2:] and result(compacted[-1]) == "D" * 2000
+    assert "characters elided" in result(compacted[10])
+    assert "characters elided" in result(compacted[2], 3)
+    assert saved == estimate_tokens(messages) - estimate_tokens(compacted) > 0
+    assert messages == original and result(messages[2]) == "a" * 2000
+    print(f"{estimate_tokens(messages)} -> {estimate_tokens(compacted)} tokens")
+    print("==================================================")
+
+
+def test_get_files_info():
+    with tempfile.TemporaryDirectory() as working_directory:
+        for path in ["main.py", "pkg/shapes.py", "pkg/build/out.txt", "pkg/deep/er/x.py", "pkg/notes.txt", "pkg/__pycache__/a.pyc"]:
+            write_file(working_directory, path, "x")
+        write_file(working_directory, ".gitignore", "# outputs\npkg/build/out.txt\n")
+
+        def paths(**args):
+            listing = get_files_info(working_directory, **args)
+            return [line[2:].split(":")[0] for line in listing.splitlines()]
+
+        # paths are relative to the working directory; .gitignore path globs match them
+        assert paths(directory="pkg", recursive=True) == [
+            "pkg/build", "pkg/deep", "pkg/deep/er", "pkg/deep/er/x.py", "pkg/notes.txt", "pkg/shapes.py",
+        ]
+        assert paths(directory="pkg", recursive=True, max_depth=2) == [
+            "pkg/build", "pkg/deep", "pkg/deep/er", "pkg/notes.txt", "pkg/shapes.py",
+        ]
+        assert paths(directory="pkg", recursive=True, exclude=["*.txt", "pkg/deep"]) == ["pkg/build", "pkg/shapes.py"]
+        assert paths(directory="pkg") == ["__pycache__", "build", "deep", "notes.txt", "shapes.py"]
+        assert get_file_content(working_directory, paths(directory="pkg/deep", recursive=True)[-1]) == "x"
+
+        page_size = get_files_info_module.LISTING_PAGE_SIZE
+        get_files_info_module.LISTING_PAGE_SIZE = 4
+        try:
+            first = get_files_info(working_directory, recursive=True)
+            assert first.splitlines()[-1] == '[...more entries; call again with cursor="4" to continue]'
+            second = get_files_info(working_directory, recursive=True, cursor="4")
+            third = get_files_info(working_directory, recursive=True, cursor="8")
+        finally:
+            get_files_info_module.LISTING_PAGE_SIZE = page_size
+        pages = [line for page in (first, second, third) for line in page.splitlines() if line.startswith("- ")]
+        assert pages == get_files_info(working_directory, recursive=True).splitlines()
+        assert "cursor" not in third
+        assert get_files_info(working_directory, cursor="x").startswith("Error:")
+        assert get_files_info(working_directory, directory="../").startswith("Error:")
+    print(second)
+    print("==================================================")
+
+
+def test_file_ranges():
+    lines = [f"line {number:03d}\n" for number in range(1, 41)]
+    chunk_size = get_file_content_module.INDEX_CHUNK_SIZE
+    # small chunks, so ranges start and end in different chunks of the line index
+    get_file_content_module.INDEX_CHUNK_SIZE = 16
+    try:
+        with tempfile.TemporaryDirectory() as working_directory:
+            write_file(working_directory, "lines.txt", "".join(lines))
+            write_file(working_directory, "open.txt", "".join(lines)[:-1])
+            for start_line in range(1, 41):
+                for end_line in (start_line, start_line + 1, start_line + 7, 39, 40, 45):
+                    if end_line < start_line:
+                        continue
+                    header, text = get_file_content(
+                        working_directory, "lines.txt", start_line=start_line, end_line=end_line
+                    ).split("\n", 1)
+                    assert text == "".join(lines[start_line - 1:end_line]), (start_line, end_line)
+                    assert header == f'[File "lines.txt": lines {start_line}-{min(end_line, 40)} of 40, 360 bytes total]'
+
+            # a last line without a newline is still a line
+            result = get_file_content(working_directory, "open.txt", start_line=39)
+            assert result == '[File "open.txt": lines 39-40 of 40, 359 bytes total]\nline 039\nline 040'
+            assert get_file_content(working_directory, "open.txt", start_line=41).startswith("Error:")
+
+            result = get_file_content(working_directory, "lines.txt", offset=18, length=9)
+            assert result == '[File "lines.txt": bytes 18-27 of 360, 40 lines total]\nline 003\n'
+            assert get_file_content(working_directory, "lines.txt", offset=351).endswith("line 040\n")
+            assert get_file_content(working_directory, "lines.txt", offset=350, length=100).startswith(
+                '[File "lines.txt": bytes 350-360 of 360'
+            )
+            assert get_file_content(working_directory, "lines.txt", offset=360).startswith("Error: offset 360 is past the end")
+            assert get_file_content(working_directory, "lines.txt", offset=0, length=-1).startswith("Error:")
+    finally:
+        get_file_content_module.INDEX_CHUNK_SIZE = chunk_size
+    print(result)
+    print("==================================================")
+
+
+def test_tool_cache():
+    cache = ToolCache(max_entries=2)
+    with tempfile.TemporaryDirectory() as working_directory:
+        with open(f"{working_directory}/notes.txt", "w") as f:
+            f.write("first")
+
+        read_args = {"file_path": "notes.txt"}
+        key = cache.key("get_file_content", read_args, working_directory)
+        assert cache.get(key) is None
+        cache.put(key, get_file_content(working_directory, **read_args))
+        assert cache.get(cache.key("get_file_content", {"file_path": "./notes.txt"}, working_directory)) == "first"
+
+        list_key = cache.key("get_files_info", {}, working_directory)
+        cache.put(list_key, get_files_info(working_directory))
+
+        # a write through the tools drops the read and the listing above it
+        cache.invalidate(working_directory, "notes.txt")
+        assert cache.get(key) is None
+        assert cache.get(list_key) is None
+
+        # the size cap evicts the least recently used entry
+        for name in ["a", "b", "c"]:
+            cache.put(("get_file_content", working_directory, name, "{}", None), name)
+        assert cache.get(("get_file_content", working_directory, "a", "{}", None)) is None
+        assert cache.stats()["evictions"] == 1
+
+        # a recursive listing sees a nested file changed outside the tools
+        os.makedirs(f"{working_directory}/pkg/sub")
+        with open(f"{working_directory}/pkg/sub/mod.py", "w") as f:
+            f.write("x = 1\n")
+        tree_key = cache.key("get_files_info", {"recursive": True}, working_directory)
+        cache.put(tree_key, get_files_info(working_directory, recursive=True))
+        with open(f"{working_directory}/pkg/sub/mod.py", "a") as f:
+            f.write("y = 2\n")
+        tree_key = cache.key("get_files_info", {"recursive": True}, working_directory)
+        assert cache.get(tree_key) is None
+        assert "pkg/sub/mod.py: file_size=12 bytes" in get_files_info(working_directory, recursive=True)
+
+    print(cache.stats())
+
+    # with cached runs on, a run is a miss once any file it could read changed
+    tool_cache_module.TOOL_CACHE_RUNS = True
+    try:
+        with tempfile.TemporaryDirectory() as working_directory:
+            write_file(working_directory, "data.txt", "1")
+            write_file(working_directory, "show.py", "print(open('data.txt').read())\n")
+            write_file(working_directory, "bump.py", "open('data.txt', 'w').write('2')\n")
+
+            def run(file_path):
+                args = {"file_path": file_path}
+                result = call_function(types.FunctionCall(name="run_python_file", args=args), working_directory=working_directory)
+                return result.parts[0].function_response.response["result"]
+
+            assert "STDOUT:\n1" in run("show.py")
+            run("bump.py")
+            assert "STDOUT:\n2" in run("show.py")
+    finally:
+        tool_cache_module.TOOL_CACHE_RUNS = False
+    print("==================================================")
+
+
+def test_search_code():
+    with tempfile.TemporaryDirectory() as working_directory:
+        write_file(working_directory, "pkg/shapes.py", "def area(width, height):\n    return width * height\n")
+        assert search_code(working_directory, "area(") == "pkg/shapes.py:1: def area(width, height):"
+        assert search_code(working_directory, r"return \w+ \*", regex=True) == "pkg/shapes.py:2: return width * height"
+
+        # writes through the tools update the index in place
+        write_file(working_directory, "main.py", "from pkg.shapes import area\nprint(area(2, 3))\n")
+        update_search_index(working_directory, "main.py")
+        result = search_code(working_directory, "AREA(", case_sensitive=False)
+        assert result.splitlines() == [
+            "main.py:2: print(area(2, 3))",
+            "pkg/shapes.py:1: def area(width, height):",
+        ]
+        assert search_code(working_directory, "area", path="../").startswith("Error:")
+
+        # literals of an optional group are not required to be in the file
+        write_file(working_directory, "flags.py", "foobaz = 1\n")
+        update_search_index(working_directory, "flags.py")
+        assert search_code(working_directory, "foo(bar)?baz", regex=True) == "flags.py:1: foobaz = 1"
+        assert search_code(working_directory, "foo(bar){0,2}baz", regex=True) == "flags.py:1: foobaz = 1"
+        assert search_code(working_directory, "foo(bar)+baz", regex=True).startswith("No matches")
+
+        # character codes and classes with a "]" member are not literal text
+        write_file(working_directory, "codes.py", "label = 'foo bar'\nvalue = 'AB'\nother = 'axyz'\n")
+        write_file(working_directory, "wrapped.py", "wrapped = ']xyz'\n")
+        update_search_index(working_directory, "codes.py")
+        update_search_index(working_directory, "wrapped.py")
+        assert search_code(working_directory, r"foo\x20bar", regex=True) == "codes.py:1: label = 'foo bar'"
+        assert search_code(working_directory, r"foo\u0020bar", regex=True) == "codes.py:1: label = 'foo bar'"
+        assert search_code(working_directory, r"\x41B", regex=True) == "codes.py:2: value = 'AB'"
+        assert search_code(working_directory, r"foo\N{SPACE}bar", regex=True) == "codes.py:1: label = 'foo bar'"
+        assert search_code(working_directory, r"foo\040bar", regex=True) == "codes.py:1: label = 'foo bar'"
+        assert search_code(working_directory, r"[^]]xyz", regex=True) == "codes.py:3: other = 'axyz'"
+        assert search_code(working_directory, r"[]]xyz", regex=True) == "wrapped.py:1: wrapped = ']xyz'"
+    print(result)
+    print("==================================================")
+
+
+def test_code_outline():
+    outline = get_file_outline("calculator", "pkg/calculator.py")
+    assert "class Calculator  # Evaluates infix expressions over numbers and named variables." in outline
+    assert "def evaluate(self, expression, variables=None)" in outline
+    symbol = get_symbol("calculator", "pkg/calculator.py", "Calculator.evaluate")
+    assert symbol.splitlines()[1] == "    def evaluate(self, expression, variables=None):"
+    assert get_symbol("calculator", "pkg/calculator.py", "evaluate") == symbol
+    assert get_file_outline("calculator", "lorem.txt").startswith("Error:")
+    assert get_file_outline("calculator", "../main.py").startswith("Error:")
+
+    with tempfile.TemporaryDirectory() as working_directory:
+        def write(content):
+            args = {"file_path": "shapes.py", "content": content}
+            call_function(types.FunctionCall(name="write_file", args=args), working_directory=working_directory)
+
+        write("@cache\ndef area(width, height):\n    return width * height\n")
+        assert get_symbol(working_directory, "shapes.py", "area").splitlines()[1] == "@cache"
+        # same size, possibly the same mtime: the write itself drops the parsed file
+        write("@cache\ndef size(width, height):\n    return width * height\n")
+        result = get_file_outline(working_directory, "shapes.py")
+        assert result.splitlines()[1].split() == ["1-3", "@cache", "def", "size(width,", "height)"]
+
+        write("class Square:\n    def area(self): ...\n\nclass Circle:\n    def area(self): ...\n")
+        assert get_symbol(working_directory, "shapes.py", "area").startswith('Error: "area" is ambiguous')
+        assert get_symbol(working_directory, "shapes.py", "Circle.area").endswith("lines 5-5 of 5]\n    def area(self): ...\n")
+
+        # form feeds and U+2028 are not line breaks to ast
+        write('a = 1\n\x0c\nSEPARATOR = "\u2028"\n\n\ndef b():\n    return 2\n')
+        assert get_file_outline(working_directory, "shapes.py").startswith('[Outline of "shapes.py": 7 lines')
+        assert get_symbol(working_directory, "shapes.py", "b").endswith("lines 6-7 of 7]\ndef b():\n    return 2\n")
+    print(result)
+    print("==================================================")
+
+
+def test_run_tests():
+    with tempfile.TemporaryDirectory() as working_directory:
+        write_file(working_directory, "shapes/__init__.py", "")
+        write_file(working_directory, "shapes/area.py", "def area(w, h):\n    return w * h\n")
+        write_file(working_directory, "shapes/perimeter.py", "def perimeter(w, h):\n    return 2 * (w + h)\n")
+        write_file(working_directory, "tests.py", (
+            "import unittest\n"
+            "from shapes.area import area\n"
+            "from shapes import perimeter\n\n"
+            "class TestArea(unittest.TestCase):\n"
+            "    def test_area(self):\n"
+            "        self.assertEqual(area(2, 3), 6)\n\n"
+            "class TestPerimeter(unittest.TestCase):\n"
+            "    def test_perimeter(self):\n"
+            "        self.assertEqual(perimeter.perimeter(2, 3), 10)\n"
+        ))
+
+        result = run_tests(working_directory)
+        assert result.startswith("Ran 2 of 2 tests for the whole suite")
+        assert result.endswith("2 passed, 0 failed, 0 errors, 0 skipped]")
+        assert run_tests(working_directory).startswith("No files changed since the last green run")
+
+        # only the case that imports the changed module runs, and its failure is reported
+        write_file(working_directory, "shapes/perimeter.py", "def perimeter(w, h):\n    return w + h\n")
+        result = run_tests(working_directory)
+        assert result.startswith("Ran 1 of 2 tests for 1 file(s) changed since the last green run: shapes/perimeter.py")
+        assert "FAIL: tests.TestPerimeter.test_perimeter" in result and "AssertionError: 5 != 10" in result
+        assert result.splitlines()[-1].startswith("[exit code 1,")
+
+        # still red, so the same case runs again until it passes
+        write_file(working_directory, "shapes/perimeter.py", "def perimeter(w, h):\n    return 2 * w + 2 * h\n")
+        assert "0 failed" in run_tests(working_directory)
+        assert run_tests(working_directory, full=True).startswith("Ran 2 of 2 tests for the whole suite")
+    print(result)
+    print("==================================================")
+
+
+def test_edit_file():
+    with tempfile.TemporaryDirectory() as working_directory:
+        lines = [f"value_{i} = {i}" for i in range(1, 2001)]
+        write_file(working_directory, "big.py", "\n".join(lines) + "\n")
+
+        result = edit_file(working_directory, "big.py", edits=[
+            {"search": "value_10 = 10\n", "replace": "value_10 = 'ten'\nvalue_10b = 10\n"},
+            {"search": "value_2000 = 2000\n", "replace": ""},
+        ])
+        assert result.splitlines() == [
+            'Successfully edited "big.py": 2 hunk(s), -2 +2 lines, 2000 lines total',
+            "- lines 10-11: -1 +2",
+            "- line 2001: -1 +0",
+        ], result
+
+        diff = "--- a/big.py\n+++ b/big.py\n@@ -4,3 +4,3 @@\n value_3 = 3\n-value_4 = 4\n+value_4 = 'four'\n value_5 = 5\n"
+        assert edit_file(working_directory, "big.py", diff=diff).startswith('Successfully edited "big.py": 1 hunk(s), -1 +1 lines')
+
+        # one failing hunk leaves the file exactly as it was
+        before = get_file_content(working_directory, "big.py", start_line=1, end_line=12)
+        result = edit_file(working_directory, "big.py", edits=[
+            {"search": "value_1 = 1\n", "replace": "value_1 = 'one'\n"},
+            {"search": "  value_3 = 3", "replace": ""},
+        ])
+        assert result.startswith("Error: edit 2 search text not found (its first line is similar to line 3;"), result
+        assert get_file_content(working_directory, "big.py", start_line=1, end_line=12) == before
+        assert "value_10 = 'ten'" in before and "value_4 = 'four'" in before
+        assert "places; include more surrounding lines" in edit_file(working_directory, "big.py", edits=[{"search": "value_10", "replace": "x"}])
+        assert edit_file(working_directory, "../big.py", diff=diff).startswith("Error:")
+    print(result)
+    print("==================================================")
+
+
+def test_python_worker():
+    scripts = {
+        "out.py": "import sys\nprint('out')\nprint('err', file=sys.stderr)\n",
+        "exit_code.py": "import sys\nsys.exit(3)\n",
+        "exit_message.py": "import sys\nsys.exit('bad input')\n",
+        "boom.py": "def area():\n    raise ValueError('boom')\n\narea()\n",
+        "env.py": (
+            "import os, sys, counter\n"
+            "counter.count += 1\n"
+            "sys.modules['leaked'] = counter\n"
+            "print(os.getcwd() == os.path.dirname(os.path.abspath(__file__)), sys.argv[1:], counter.count)\n"
+        ),
+        "check.py": "import sys\nprint('leaked' in sys.modules, 'counter' in sys.modules)\n",
+        "sleep.py": "import time\nprint('started', flush=True)\ntime.sleep(30)\n",
+        "flood.py": "while True:\n    print('x' * 1000)\n",
+    }
+
+    def run(file_path, args=(), timeout=10):
+        result = run_python_module.execute_python(
+            ["python3", os.path.join(working_directory, file_path), *args], working_directory, timeout
+        )
+        formatted = run_python_module._format_result(result, ["python3", file_path])
+        return result.exit_code, result.stdout, result.stderr, result.timed_out, result.output_capped, result.wall_time, formatted
+
+    max_bytes = run_python_module.RUN_OUTPUT_MAX_BYTES
+    run_python_module.RUN_OUTPUT_MAX_BYTES = 100_000
+    try:
+        with tempfile.TemporaryDirectory() as working_directory:
+            for file_path, source in scripts.items():
+                write_file(working_directory, file_path, source)
+            write_file(working_directory, "counter.py", "count = 0\n")
+
+            results = {}
+            for pool in (False, True):
+                run_python_module.PYTHON_WORKER_POOL = pool
+                results[pool] = {
+                    "out": run("out.py"),
+                    "exit_code": run("exit_code.py"),
+                    "exit_message": run("exit_message.py"),
+                    "boom": run("boom.py"),
+                    # two runs in a row: each starts from a fresh interpreter state
+                    "env": run("env.py", ["--flag", "two words"]),
+                    "env_again": run("env.py"),
+                    "check": run("check.py"),
+                    "timeout": run("sleep.py", timeout=1),
+                    "flood": run("flood.py"),
+                }
+    finally:
+        run_python_module.PYTHON_WORKER_POOL = False
+        run_python_module.RUN_OUTPUT_MAX_BYTES = max_bytes
+
+    subprocess_results, worker_results = results[False], results[True]
+    for name, result in subprocess_results.items():
+        # the same outcome both ways; the flood stops at a different point of its output
+        compared = slice(3, 5) if name == "flood" else slice(0, 5)
+        assert worker_results[name][compared] == result[compared], (name, worker_results[name], result)
+
+    assert worker_results["out"][:3] == (0, "out\n", "err\n")
+    assert worker_results["exit_code"][0] == 3
+    assert worker_results["exit_message"][:3] == (1, "", "bad input\n")
+    assert worker_results["boom"][0] == 1 and worker_results["boom"][2].endswith("ValueError: boom\n")
+    assert worker_results["env"][1] == "True ['--flag', 'two words'] 1\n"
+    assert worker_results["env_again"][1] == "True [] 1\n"
+    assert worker_results["check"][1] == "False False\n"
+    # both runaway scripts were killed well before they would have finished
+    assert worker_results["timeout"][1] == "started\n" and worker_results["timeout"][5] < 5
+    assert "timed out after 1 seconds" in worker_results["timeout"][6]
+    assert worker_results["flood"][4] and worker_results["flood"][5] < 5
+    print(worker_results["boom"][2])
+
+    # a child whose limits cannot be applied is still killed and reaped
+    pids = []
+
+    def failing_limits(pid):
+        pids.append(pid)
+        raise ProcessLookupError(pid)
+
+    apply_limits = run_python_module._apply_limits
+    run_python_module._apply_limits = failing_limits
+    try:
+        with tempfile.TemporaryDirectory() as working_directory:
+            write_file(working_directory, "sleep.py", scripts["sleep.py"])
+            try:
+                asyncio.run(run_python_module.execute_python_async(
+                    ["python3", os.path.join(working_directory, "sleep.py")], working_directory
+                ))
+                raise AssertionError("execute_python_async did not raise")
+            except ProcessLookupError:
+                pass
+    finally:
+        run_python_module._apply_limits = apply_limits
+    try:
+        os.kill(pids[0], 0)
+        raise AssertionError(f"child {pids[0]} was left running or unreaped")
+    except ProcessLookupError:
+        pass
+
+    # a backgrounded grandchild holding stdout open does not stretch the
+    # timeout, and nothing is left behind for the closed loop to complain about
+    with tempfile.TemporaryDirectory() as working_directory:
+        write_file(working_directory, "background.py", (
+            "import subprocess, sys, time\n"
+            "subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(4)'])\n"
+            "print('started', flush=True)\n"
+            "time.sleep(30)\n"
+        ))
+        script = (
+            "import asyncio, gc, os, sys\n"
+            "from functions.run_python import execute_python_async\n"
+            "cwd = sys.argv[1]\n"
+            "result = asyncio.run(execute_python_async(['python3', os.path.join(cwd, 'background.py')], cwd, timeout=1))\n"
+            "gc.collect()\n"
+            "print(result.timed_out, repr(result.stdout), result.wall_time < 2.5)\n"
+        )
+        completed = subprocess.run(
+            [sys.executable, "-X", "dev", "-c", script, working_directory],
+            capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+        )
+    assert completed.stdout == "True 'started\\n' True\n", completed
+    assert "never retrieved" not in completed.stderr and "Event loop is closed" not in completed.stderr, completed.stderr
+    print("==================================================")
+
+
+def test_output_window():
+    window = OutputWindow(head_bytes=20, tail_bytes=20)
+    window.feed(b"first\n" + b"spam\n" * 1000)
+    window.feed(b"".join(f"line {i}\n".encode() for i in range(100)))
+    window.close()
+
+    text = window.text()
+    assert text == "first\nspam\nspam\n[... 1096 lines (5764 bytes) elided ...]\nline 98\nline 99\n"
+    assert window.total_bytes == 6 + 5000 + sum(len(f"line {i}\n") for i in range(100))
+
+    window = OutputWindow(head_bytes=100, tail_bytes=100)
+    window.feed(b"same\n" * 10)
+    window.close()
+    assert window.text() == "same\n[previous line repeated 9 more times]\n"
+    print(text)
+    print("==================================================")
+
+
+def test_prefetch():
+    def call(name, working_directory, **args):
+        result = call_function(types.FunctionCall(name=name, args=args), working_directory=working_directory)
+        return result.parts[0].function_response.response["result"]
+
+    with tempfile.TemporaryDirectory() as working_directory:
+        write_file(working_directory, "main.py", "print('hello')\n")
+        write_file(working_directory, "notes.bin", "not a likely read")
+        prefetcher.configure("buffer")
+        try:
+            call("get_files_info", working_directory)
+            assert call("get_file_content", working_directory, file_path="main.py") == "print('hello')\n"
+            assert prefetcher.stats()["hits"] == 1
+
+            # a listing served from the tool cache starts prefetching too
+            prefetcher.clear(working_directory)
+            cache_hits = tool_cache_module.tool_cache.stats()["hits"]
+            call("get_files_info", working_directory)
+            assert tool_cache_module.tool_cache.stats()["hits"] == cache_hits + 1
+            assert prefetcher.take(working_directory, "main.py") == "print('hello')\n"
+            assert prefetcher.stats()["hits"] == 2
+
+            # a write through the tools drops the prefetched copy
+            call("write_file", working_directory, file_path="main.py", content="print('bye')\n")
+            assert call("get_file_content", working_directory, file_path="main.py") == "print('bye')\n"
+            assert prefetcher.stats()["hits"] == 2
+
+            prefetcher.configure("inline")
+            listing = call("get_files_info", working_directory)
+            assert "--- main.py (whole file, 1 lines) ---\nprint('bye')" in listing
+            assert "notes.bin (" not in listing
+            # the cached listing has no previews and gets them again
+            assert call("get_files_info", working_directory) == listing
+            assert "Previews" not in tool_cache_module.tool_cache.get(
+                tool_cache_module.tool_cache.key("get_files_info", {}, working_directory)
+            )
+            result = prefetcher.stats()
+        finally:
+            prefetcher.configure("off")
+            prefetcher.clear()
+    print(result)
+    print("==================================================")
+
+
+def test_write_files_and_checkpoint():
+    def call(tool, working_directory, **args):
+        result = call_function(types.FunctionCall(name=tool, args=args), working_directory=working_directory)
+        return result.parts[0].function_response.response["result"]
+
+    def read(working_directory, path):
+        with open(os.path.join(working_directory, path)) as f:
+            return f.read()
+
+    with tempfile.TemporaryDirectory() as working_directory:
+        write_file(working_directory, "shapes.py", "def area(w, h):\n    return w * h\n")
+        assert call("get_file_content", working_directory, file_path="shapes.py").startswith("def area")
+        assert call("checkpoint", working_directory, name="before").startswith('Created checkpoint "before" of 1 file(s)')
+
+        files = [
+            {"file_path": "shapes.py", "content": "def size(w, h):\n    return w * h\n"},
+            {"file_path": "pkg/main.py", "content": "from shapes import size\n"},
+        ]
+        assert call("write_files", working_directory, files=files).startswith("Successfully wrote 2 file(s)")
+        # the cached read of the old content is gone
+        assert call("get_file_content", working_directory, file_path="shapes.py").startswith("def size")
+
+        # a failure half way through the renames puts back what was already replaced
+        replace = os.replace
+        renames = []
+
+        def failing_replace(source, target):
+            renames.append(target)
+            if len(renames) == 2:
+                raise OSError("disk full")
+            replace(source, target)
+
+        write_file_module.os.replace = failing_replace
+        try:
+            result = write_files(working_directory, [
+                {"file_path": "shapes.py", "content": "broken"},
+                {"file_path": "pkg/main.py", "content": "broken"},
+            ])
+        finally:
+            write_file_module.os.replace = replace
+        assert result == "Error: writing files: disk full; no file was changed"
+        assert read(working_directory, "shapes.py").startswith("def size")
+        assert sorted(os.listdir(working_directory)) == [".checkpoints", "pkg", "shapes.py"]
+        # the store stays inside the working directory and out of listings and search
+        assert call("get_files_info", working_directory).splitlines()[-1].startswith("- shapes.py")
+        assert ".checkpoints" not in call("get_files_info", working_directory, recursive=True)
+        assert call("search_code", working_directory, query="def area") == 'No matches for "def area"'
+
+        result = call("rollback", working_directory)
+        assert result.splitlines() == [
+            'Rolled back to checkpoint "before": restored 1 file(s), removed 1 file(s) created since',
+            "- restored: shapes.py",
+            f"- removed: {os.path.join('pkg', 'main.py')}",
+        ]
+        assert sorted(os.listdir(working_directory)) == [".checkpoints", "shapes.py"]
+        assert call("get_file_content", working_directory, file_path="shapes.py").startswith("def area")
+        assert call("rollback", working_directory, name="later").startswith("Error:")
+        drop_checkpoints(working_directory)
+        assert os.listdir(working_directory) == ["shapes.py"]
+    print(result)
+    print("==================================================")
+
+
 if __name__ == "__main__":
     test()
+    test_agent_loop()
+    test_call_scheduler()
+    test_batch()
+    test_rate_limiter()
+    test_record_replay()
+    test_session_store()
+    test_streaming()
+    test_routing()
+    test_tracing()
+    test_startup()
+    test_get_files_info()
+    test_file_ranges()
+    test_compaction()
+    test_tool_cache()
+    test_search_code()
+    test_code_outline()
+    test_run_tests()
+    test_edit_file()
+    test_output_window()
+    test_python_worker()
+    test_prefetch()
+    test_write_files_and_checkpoint()
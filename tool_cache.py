@@ -0,0 +1,172 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from config import TOOL_CACHE_MAX_ENTRIES, TOOL_CACHE_MAX_CHARS, TOOL_CACHE_RUNS
+
+
+# directories never looked at when fingerprinting the files a script may read
+SKIP_DIRS = {"__pycache__", ".git", ".venv", "venv", ".checkpoints"}
+
+
+class ToolCache:
+    """LRU cache of tool results, keyed on the call and the state of the files it reads.
+
+    A key includes the mtime and size of the path the call reads: the file
+    for a read, the directory itself for a listing, every file and directory
+    under it for a recursive listing and every file of the working directory
+    for a script run. A changed file or a directory with
+    entries added or removed is therefore a miss on its own, but a file that
+    only changed size does not change its directory, so writes and runs made
+    through the tools also invalidate the entries they can affect.
+    """
+
+    def __init__(self, max_entries=TOOL_CACHE_MAX_ENTRIES, max_chars=TOOL_CACHE_MAX_CHARS):
+        self.max_entries = max_entries
+        self.max_chars = max_chars
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._chars = 0
+        self._lock = threading.Lock()
+
+    def key(self, name, args, working_directory):
+        # returns None for calls that must not be cached
+        absolute_working_dir = os.path.abspath(working_directory)
+        if name == "get_files_info":
+            path = _normalize(args.get("directory") or ".")
+            if args.get("recursive"):
+                # a nested file can change size without touching the directory
+                from functions.get_files_info import DEFAULT_EXCLUDES
+                fingerprint = _files_fingerprint(os.path.join(absolute_working_dir, path), set(DEFAULT_EXCLUDES))
+            else:
+                fingerprint = _stat(os.path.join(absolute_working_dir, path))
+        elif name == "get_file_content":
+            path = _normalize(args.get("file_path", ""))
+            fingerprint = _stat(os.path.join(absolute_working_dir, path))
+        elif name == "run_python_file" and TOOL_CACHE_RUNS:
+            path = _normalize(args.get("file_path", ""))
+            fingerprint = _files_fingerprint(absolute_working_dir)
+        else:
+            return None
+
+        # the path is already normalized into the key, the rest of the args go in as-is
+        normalized_args = json.dumps(
+            {
+                arg: value
+                for arg, value in args.items()
+                if arg not in ("working_directory", "directory", "file_path")
+            },
+            sort_keys=True,
+            default=str,
+        )
+        return (name, absolute_working_dir, path, normalized_args, fingerprint)
+
+    def get(self, key):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, output):
+        # only plain successful outputs are worth keeping
+        if not isinstance(output, str) or output.startswith("Error"):
+            return
+        with self._lock:
+            if key in self._entries:
+                self._chars -= len(self._entries.pop(key))
+            self._entries[key] = output
+            self._chars += len(output)
+            while self._entries and (
+                len(self._entries) > self.max_entries or self._chars > self.max_chars
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self._chars -= len(evicted)
+                self.evictions += 1
+
+    def invalidate(self, working_directory, path):
+        """Drop entries a write to `path` can affect.
+
+        That is reads of the file itself, listings of any directory above it
+        and every cached script run in the same working directory.
+        """
+        absolute_working_dir = os.path.abspath(working_directory)
+        path = _normalize(path)
+        with self._lock:
+            for key in list(self._entries):
+                name, key_working_dir, key_path = key[:3]
+                if key_working_dir != absolute_working_dir:
+                    continue
+                if (
+                    name == "run_python_file"
+                    or (name == "get_file_content" and key_path == path)
+                    or (name == "get_files_info" and _is_within(path, key_path))
+                ):
+                    self._chars -= len(self._entries.pop(key))
+
+    def invalidate_listings(self, working_directory):
+        # a script run may have created or resized any file
+        absolute_working_dir = os.path.abspath(working_directory)
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] == "get_files_info" and key[1] == absolute_working_dir:
+                    self._chars -= len(self._entries.pop(key))
+
+    def clear(self, working_directory=None):
+        # everything, or only the entries of one working directory
+        with self._lock:
+            if working_directory is None:
+                self._entries.clear()
+                self._chars = 0
+                return
+            absolute_working_dir = os.path.abspath(working_directory)
+            for key in list(self._entries):
+                if key[1] == absolute_working_dir:
+                    self._chars -= len(self._entries.pop(key))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "chars": self._chars,
+            }
+
+
+def _normalize(path):
+    return os.path.normpath(path)
+
+
+def _is_within(path, directory):
+    return directory == "." or path == directory or path.startswith(directory + os.sep)
+
+
+def _stat(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _files_fingerprint(absolute_path, skip_dirs=SKIP_DIRS):
+    # a run depends on every file it could import or read, not only Python ones;
+    # directories are in too, for the empty ones a listing shows
+    fingerprint = []
+    for dirpath, dirnames, filenames in os.walk(absolute_path):
+        dirnames[:] = sorted(d for d in dirnames if d not in skip_dirs)
+        fingerprint.append((dirpath, _stat(dirpath)))
+        for filename in sorted(filenames):
+            full_path = os.path.join(dirpath, filename)
+            fingerprint.append((full_path, _stat(full_path)))
+    return tuple(fingerprint)
+
+
+tool_cache = ToolCache()
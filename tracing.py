@@ -0,0 +1,192 @@
+import contextvars
+import json
+import os
+import threading
+import time
+
+
+# the span the running code is inside of; asyncio tasks and to_thread copy it
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+# span attributes that become metric labels, and the numeric ones summed into counters
+LABEL_ATTRIBUTES = ("tool", "cache", "model", "outcome", "exit_code")
+COUNTED_ATTRIBUTES = ("prompt_tokens", "response_tokens", "arg_bytes", "output_bytes")
+
+DURATION_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class Span:
+    """One timed operation. Use as a context manager; `set` adds attributes."""
+
+    __slots__ = ("tracer", "name", "attributes", "trace_id", "span_id", "parent_id", "start", "duration", "_started", "_token")
+    recording = True
+
+    def __init__(self, tracer, name, attributes):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        parent = _current_span.get()
+        self.trace_id = parent.trace_id if parent else os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent else None
+        self.span_id = os.urandom(4).hex()
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self._started
+        _current_span.reset(self._token)
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        self.tracer._finish(self)
+        return False
+
+
+class _NoopSpan:
+    # handed out while tracing is off, so instrumented code costs one attribute check
+    recording = False
+
+    def set(self, **attributes):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class Metrics:
+    """Counters and histograms, rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self.counters = {}  # (name, labels) -> value
+        self.histograms = {}  # (name, labels) -> [bucket counts, sum, count]
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.setdefault(key, [[0] * len(DURATION_BUCKETS), 0.0, 0])
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if value <= bound:
+                    histogram[0][index] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self.counters}):
+                lines.append(f"# TYPE {name} counter")
+                for (key_name, labels), value in sorted(self.counters.items()):
+                    if key_name == name:
+                        lines.append(f"{name}{_labels(labels)} {value}")
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (key_name, labels), (buckets, total, count) in sorted(self.histograms.items()):
+                    if key_name != name:
+                        continue
+                    for bound, bucket_count in zip(DURATION_BUCKETS, buckets):
+                        lines.append(f"{name}_bucket{_labels(labels + (('le', str(bound)),))} {bucket_count}")
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {count}")
+                    lines.append(f"{name}_sum{_labels(labels)} {total}")
+                    lines.append(f"{name}_count{_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+class Tracer:
+    """Creates spans and exports them.
+
+    Finished spans are appended to a JSONL trace file and folded into
+    metrics: a duration histogram per span name, a count per name and label
+    set, and running totals of token and byte attributes. While disabled,
+    `span` returns a shared no-op span.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.metrics = Metrics()
+        self.trace_path = None
+        self.metrics_path = None
+        self._trace_file = None
+        self._lock = threading.Lock()
+
+    def configure(self, trace_path=None, metrics_path=None):
+        self.close()
+        self.trace_path = trace_path
+        self.metrics_path = metrics_path
+        self.enabled = bool(trace_path or metrics_path)
+        if trace_path:
+            self._trace_file = open(trace_path, "a", encoding="utf-8")
+
+    def span(self, name, **attributes):
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, name, attributes)
+
+    def write_metrics(self):
+        if self.metrics_path:
+            with open(self.metrics_path, "w", encoding="utf-8") as f:
+                f.write(self.metrics.render())
+
+    def close(self):
+        with self._lock:
+            if self._trace_file is not None:
+                self._trace_file.close()
+                self._trace_file = None
+
+    def _finish(self, span):
+        labels = {"span": span.name}
+        for attribute in LABEL_ATTRIBUTES:
+            if span.attributes.get(attribute) is not None:
+                labels[attribute] = str(span.attributes[attribute])
+        self.metrics.observe("agent_span_duration_seconds", span.duration, **labels)
+        self.metrics.inc("agent_spans_total", **labels)
+        for attribute in COUNTED_ATTRIBUTES:
+            value = span.attributes.get(attribute)
+            if value:
+                self.metrics.inc(f"agent_{attribute}_total", value, span=span.name)
+
+        if self._trace_file is not None:
+            record = {
+                "name": span.name,
+                "trace_id": span.trace_id,
+                "span_id": span.span_id,
+                "parent_id": span.parent_id,
+                "start": span.start,
+                "duration": span.duration,
+                "attributes": span.attributes,
+            }
+            line = json.dumps(record, default=str) + "\n"
+            with self._lock:
+                if self._trace_file is not None:
+                    self._trace_file.write(line)
+                    self._trace_file.flush()
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+tracer = Tracer()